@@ -1,12 +1,42 @@
 import argparse
+import atexit
+import importlib
+import sys
+from pathlib import Path
 
-from psychopy import core
-
-from bid2d.experiment import Experiment, Stimulus
-from bid2d.logger import Logger
+# Offline tools, which are available as 'bid2d <command>' and do not require the graphics stack. The entry point
+# is 'main' of the module, unless another function is given after a colon.
+COMMANDS = {
+    "analyze": "bid2d.analysis",
+    "benchmark": "bid2d.benchmark",
+    "compile-schedule": "bid2d.schedule",
+    "index-catalog": "bid2d.catalog",
+    "merge-journals": "bid2d.journal",
+    "monitor": "bid2d.monitor",
+    "prepare-assets": "bid2d.assets",
+    "simulate": "bid2d.simulation",
+    "stats": "bid2d.stats",
+    "synthesize": "bid2d.synthetic",
+    "verify-schedule": "bid2d.schedule:verify_main",
+}
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        module, _, function = COMMANDS[sys.argv[1]].partition(":")
+        getattr(importlib.import_module(module), function or "main")(sys.argv[2:])
+        return
+
+    from psychopy import core
+
+    from bid2d.assets import AssetCache
+    from bid2d.catalog import CatalogIndex
+    from bid2d.experiment import Experiment, Stimulus
+    from bid2d.logger import Logger, BackgroundLogger
+    from bid2d.schedule import Schedule
+    from bid2d.util.constrained_shuffle import SequenceConstraints
+    from bid2d.util.profiler import Profiler
+
     # Parse the command line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -39,6 +69,88 @@ def main():
         help="Maximal duration of the fixation cross",
         default=1.25,
     )
+    parser.add_argument(
+        "-asset_cache",
+        type=str,
+        help=f"The images prepared by 'bid2d prepare-assets'. Defaults to "
+        f"'{AssetCache.DIRECTORY}' next to the samples, if existing.",
+        default=None,
+    )
+    parser.add_argument(
+        "-distractors",
+        type=int,
+        help="The number of distractor images shown next to the stimulus.",
+        default=0,
+    )
+    parser.add_argument(
+        "-distractor_size",
+        type=float,
+        help="The relative size of the distractors regarding their largest size.",
+        default=0.25,
+    )
+    parser.add_argument(
+        "--approach_distractors",
+        dest="approach_distractors",
+        action="store_true",
+        help="Touching a distractor of a stimulus to approach ends the trial, too.",
+        default=False,
+    )
+    parser.add_argument(
+        "-max_run",
+        type=str,
+        nargs="*",
+        help="Limit the consecutive trials of the same level as 'FACTOR=N', i.e. 'position=3', "
+        "'should_approach=3' or 'stimulus=1' against immediate repeats.",
+        default=[],
+    )
+    parser.add_argument(
+        "-balance_transitions",
+        type=str,
+        nargs="*",
+        help="Balance the transitions between the levels of these factors, i.e. 'position'.",
+        default=[],
+    )
+    parser.add_argument(
+        "-schedule",
+        type=str,
+        help="Run the session compiled by 'bid2d compile-schedule' instead of generating it from the seed, the "
+        "fixation jitter and the sizes.",
+        default=None,
+    )
+    parser.add_argument(
+        "-prefetch",
+        type=int,
+        help="Only keep the stimuli of the current and this many upcoming trials loaded, instead of loading all "
+        "of them up front. The next images are decoded in the background.",
+        default=None,
+    )
+    parser.add_argument(
+        "-journal",
+        type=str,
+        help="Also append the events to a local journal, which 'bid2d merge-journals' converts into a session.",
+        default=None,
+    )
+    parser.add_argument(
+        "-profile",
+        type=str,
+        help="Record the phases of the session, i.e. loading, fixation, drawing, logging and flipping, and write "
+        "them as a Chrome trace (for Perfetto) to this file on exit.",
+        default=None,
+    )
+    parser.add_argument(
+        "--cprofile",
+        dest="cprofile",
+        action="store_true",
+        help="Also profile the session by cProfile. Requires '-profile'.",
+        default=False,
+    )
+    parser.add_argument(
+        "--trace_allocations",
+        dest="trace_allocations",
+        action="store_true",
+        help="Also trace the allocations and write a snapshot on exit. Requires '-profile'.",
+        default=False,
+    )
     parser.add_argument(
         "--no_fullscreen",
         dest="fullscreen",
@@ -60,32 +172,144 @@ def main():
         help="Invert the given value of 'should_approach'.",
         default=False,
     )
+    parser.add_argument(
+        "--catalog_index",
+        dest="catalog_index",
+        action="store_true",
+        help="Load the samples through a local index, which only revalidates changed rows of the CSV file.",
+        default=False,
+    )
+    parser.add_argument(
+        "--background_logging",
+        dest="background_logging",
+        action="store_true",
+        help="Push the events to the Lab Streaming Layer from a background thread.",
+        default=False,
+    )
+    parser.add_argument(
+        "--static_scene",
+        dest="static_scene",
+        action="store_true",
+        help="Capture the stimuli and the fixation point once and only redraw the avatar on top of them.",
+        default=False,
+    )
+    parser.add_argument(
+        "--frame_timing",
+        dest="frame_timing",
+        action="store_true",
+        help="Record the flip times and stream a per-trial summary of dropped frames.",
+        default=False,
+    )
+    parser.add_argument(
+        "--compact_trials",
+        dest="compact_trials",
+        action="store_true",
+        help="Stream the trials as indices into the names and positions listed in the stream description.",
+        default=False,
+    )
 
     arguments = parser.parse_args()
+    if arguments.profile is None and (
+        arguments.cprofile or arguments.trace_allocations
+    ):
+        parser.error("'--cprofile' and '--trace_allocations' require '-profile'.")
+
+    # The trace is also written if the session is quit early
+    profiler = None
+    if arguments.profile is not None:
+        profiler = Profiler(
+            arguments.profile,
+            cprofile=arguments.cprofile,
+            trace_allocations=arguments.trace_allocations,
+        )
+        profiler.start()
+        atexit.register(profiler.close)
 
     # Load the stimuli from the provided CSV file
     stimuli = list(
         Stimulus.from_csv(
-            arguments.samples, invert_should_approach=arguments.invert_should_approach
+            arguments.samples,
+            invert_should_approach=arguments.invert_should_approach,
+            index=(
+                CatalogIndex.default_file(Path(arguments.samples))
+                if arguments.catalog_index
+                else None
+            ),
         )
     )
 
-    # Prepare the LabStreamingLayer streams
-    logger = Logger()
+    # The constraints of the trial order refer to the conditions and the columns of the samples
+    try:
+        constraints = SequenceConstraints.parse(
+            arguments.max_run,
+            arguments.balance_transitions,
+            factors=Schedule.factors(stimuli),
+        )
+    except ValueError as error:
+        parser.error(str(error))
+
+    # Use the pre-scaled images, if available
+    asset_directory = (
+        Path(arguments.asset_cache)
+        if arguments.asset_cache is not None
+        else Path(arguments.samples).parent / AssetCache.DIRECTORY
+    )
+    asset_cache = AssetCache(asset_directory) if asset_directory.is_dir() else None
+
+    # Prepare the LabStreamingLayer streams. Touches are only streamed for trials with distractors.
+    schedule = (
+        Schedule.load(arguments.schedule) if arguments.schedule is not None else None
+    )
+    touches = (
+        schedule.num_distractors if schedule is not None else arguments.distractors
+    ) > 0
+    logger = (BackgroundLogger if arguments.background_logging else Logger)(
+        frame_timing=arguments.frame_timing,
+        touches=touches,
+        journal=arguments.journal,
+        trial_names=(
+            [stimulus.name for stimulus in stimuli]
+            if arguments.compact_trials
+            else None
+        ),
+    )
 
     # Query information about the participant and start the experiment
-    experiment = Experiment(stimuli, fullscreen=arguments.fullscreen, logger=logger)
+    experiment = Experiment(
+        stimuli,
+        fullscreen=arguments.fullscreen,
+        logger=logger,
+        record_frame_timing=arguments.frame_timing,
+        asset_cache=asset_cache,
+        static_scene=arguments.static_scene,
+        prefetch=arguments.prefetch,
+        profiler=profiler,
+    )
     if arguments.prepare:
         experiment.prepare()
-    experiment.run(
-        seed=arguments.seed,
-        fixation_cross_jitter=(
-            arguments.fixation_jitter_min,
-            arguments.fixation_jitter_max,
-        ),
-        avatar_size=arguments.avatar_size,
-        stimulus_size=arguments.stimulus_size,
-    )
+    if schedule is not None:
+        experiment.run_schedule(schedule)
+    else:
+        experiment.run(
+            seed=arguments.seed,
+            fixation_cross_jitter=(
+                arguments.fixation_jitter_min,
+                arguments.fixation_jitter_max,
+            ),
+            avatar_size=arguments.avatar_size,
+            stimulus_size=arguments.stimulus_size,
+            num_distractors=arguments.distractors,
+            distractor_size=arguments.distractor_size,
+            constraints=constraints,
+            approach_distractors=arguments.approach_distractors,
+        )
+    logger.close()
+    if isinstance(logger, BackgroundLogger):
+        print(logger.statistics, file=sys.stderr)
+    if experiment.prefetcher is not None:
+        print(experiment.prefetcher.statistics, file=sys.stderr)
+    if experiment.distractor_prefetcher is not None:
+        print(experiment.distractor_prefetcher.statistics, file=sys.stderr)
 
     # Gently close the PsychoPy. Otherwise, i.e. the window on Windows may hang
     core.quit()
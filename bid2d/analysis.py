@@ -0,0 +1,273 @@
+import argparse
+import csv
+import hashlib
+import sys
+import time
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from bid2d.logger import Logger
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+
+
+class Analysis:
+    RECORDING_PATTERNS = ("*.xdf", "*.xdfz")
+    CACHE_DIRECTORY = ".bid2d_cache"
+    COLUMNS = (
+        "participant",
+        "trial",
+        "stimulus",
+        "position",
+        "onset",
+        "rt",
+        "num_frames",
+        "reaction",
+        "correct",
+        "dropped_frames",
+    )
+
+    def __init__(
+        self,
+        files: Sequence[Union[str, Path]],
+        cache_directory: Optional[Union[str, Path]] = None,
+        max_dropped_frames: Optional[int] = None,
+    ):
+        self.files = [file if isinstance(file, Path) else Path(file) for file in files]
+        self.cache_directory = (
+            Path(cache_directory) if cache_directory is not None else None
+        )
+        self.max_dropped_frames = max_dropped_frames
+
+        # The recordings which could not be decoded, with the error
+        self.failed: List[Tuple[Path, str]] = []
+
+    def run(self, processes: Optional[int] = None) -> List[Tuple]:
+        if self.cache_directory is not None:
+            self.cache_directory.mkdir(parents=True, exist_ok=True)
+
+        # Only the recordings without a valid cache entry are sent to the worker processes
+        participants = Analysis.participants(self.files)
+        rows = {}
+        pending = []
+        self.failed = []
+        # A recording which cannot be read or decoded is skipped, instead of aborting the others
+        for file in self.files:
+            try:
+                cache_file = self._cache_file(file)
+                if cache_file is not None and cache_file.is_dir():
+                    start = time.perf_counter()
+                    rows[file] = list(
+                        Analysis.tabulate(
+                            file, Session.load(cache_file), participants[file]
+                        )
+                    )
+                    Analysis._report(file, time.perf_counter() - start, cached=True)
+                else:
+                    pending.append((file, cache_file))
+            except Exception as error:
+                self._fail(file, error)
+
+        if len(pending) > 0:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = {
+                    executor.submit(
+                        Analysis._decode, file, cache_file, participants[file]
+                    ): file
+                    for file, cache_file in pending
+                }
+                for future in as_completed(futures):
+                    file = futures[future]
+                    try:
+                        _, rows[file], duration = future.result()
+                    except Exception as error:
+                        self._fail(file, error)
+                    else:
+                        Analysis._report(file, duration, cached=False)
+
+        if len(self.failed) > 0:
+            self.failed.sort()
+            print(
+                f"Failed to read {len(self.failed)} of {len(self.files)} recordings:",
+                file=sys.stderr,
+            )
+            for file, error in self.failed:
+                print(f"  {file}: {error}", file=sys.stderr)
+
+        rows = [row for file in self.files for row in rows.get(file, ())]
+
+        # Exclude the trials with bad timing. Trials without any frame timing are kept.
+        if self.max_dropped_frames is not None:
+            dropped_frames = Analysis.COLUMNS.index("dropped_frames")
+            rows = [
+                row for row in rows if row[dropped_frames] <= self.max_dropped_frames
+            ]
+        return rows
+
+    @staticmethod
+    def tabulate(
+        file: Path, session: Session, participant: Optional[str] = None
+    ) -> Iterable[Tuple]:
+        responses = session.responses()
+        dropped_frames = session.dropped_frames()
+        positions = np.array([str(position) for position in Session.POSITIONS] + [""])
+        reactions = {reaction.value: str(reaction) for reaction in Reaction}
+
+        if participant is None:
+            participant = file.with_suffix("").name
+        for i, (trial, response, dropped) in enumerate(
+            zip(session.trials, responses, dropped_frames)
+        ):
+            yield (
+                participant,
+                i,
+                session.names[trial["name"]],
+                positions[trial["position"]],
+                float(trial["onset"]),
+                float(response["rt"]),
+                int(response["num_frames"]),
+                reactions[int(response["reaction"])],
+                bool(response["correct"]),
+                int(dropped),
+            )
+
+    @staticmethod
+    def participants(files: Sequence[Path]) -> Dict[Path, str]:
+        # The path of each recording relative to the directory containing all of them, without its extension. So
+        # recordings of the same name in different directories remain separate participants.
+        if len(files) == 0:
+            return {}
+        root = Path(os.path.commonpath([file.resolve().parent for file in files]))
+        return {
+            file: file.resolve().relative_to(root).with_suffix("").as_posix()
+            for file in files
+        }
+
+    @staticmethod
+    def find_recordings(paths: Iterable[Union[str, Path]]) -> List[Path]:
+        files = []
+        for path in paths:
+            path = path if isinstance(path, Path) else Path(path)
+            if path.is_dir():
+                for pattern in Analysis.RECORDING_PATTERNS:
+                    files.extend(path.rglob(pattern))
+            else:
+                files.append(path)
+        return sorted(set(files))
+
+    @staticmethod
+    def save(rows: Iterable[Tuple], file: Union[str, Path]):
+        with Path(file).open("w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(Analysis.COLUMNS)
+            writer.writerows(rows)
+
+    def _cache_file(self, file: Path) -> Optional[Path]:
+        if self.cache_directory is None:
+            return None
+
+        # The cache is invalidated as soon as the recording is replaced or modified
+        stat = file.stat()
+        key = hashlib.sha1(
+            f"{file.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        ).hexdigest()
+        return self.cache_directory / f"{file.name.split('.')[0]}-{key[:16]}.npy"
+
+    @staticmethod
+    def _decode(
+        file: Path, cache_file: Optional[Path], participant: Optional[str] = None
+    ) -> Tuple[Path, List, float]:
+        start = time.perf_counter()
+        session = Logger.load_session(str(file))
+        if cache_file is not None:
+            # The tables are memory-mapped on loading. The entry is renamed once complete, so an interrupted run does
+            # not leave a partial one behind.
+            partial = cache_file.with_name(f"{cache_file.stem}.partial.npy")
+            session.save(partial)
+            partial.rename(cache_file)
+        rows = list(Analysis.tabulate(file, session, participant))
+        return file, rows, time.perf_counter() - start
+
+    def _fail(self, file: Path, error: Exception):
+        self.failed.append((file, f"{type(error).__name__}: {error}"))
+        print(f"{file}: {self.failed[-1][1]}", file=sys.stderr)
+
+    @staticmethod
+    def _report(file: Path, duration: float, cached: bool):
+        print(
+            f"{file}: {duration:.3f}s{' (cached)' if cached else ''}", file=sys.stderr
+        )
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d analyze")
+    parser.add_argument(
+        "recordings",
+        type=str,
+        nargs="+",
+        help="The XDF files or directories containing them.",
+    )
+    parser.add_argument(
+        "-output", type=str, help="The resulting CSV table.", default="trials.csv"
+    )
+    parser.add_argument(
+        "-processes",
+        type=int,
+        help="The number of worker processes. Defaults to the number of CPUs.",
+        default=None,
+    )
+    parser.add_argument(
+        "-cache",
+        type=str,
+        help=f"The directory caching already decoded recordings. Defaults to "
+        f"'{Analysis.CACHE_DIRECTORY}' next to the output.",
+        default=None,
+    )
+    parser.add_argument(
+        "--no_cache",
+        dest="use_cache",
+        action="store_false",
+        help="Decode all recordings again.",
+        default=True,
+    )
+    parser.add_argument(
+        "-max_dropped_frames",
+        type=int,
+        help="Exclude the trials with more dropped frames than this.",
+        default=None,
+    )
+    arguments = parser.parse_args(arguments)
+
+    output = Path(arguments.output)
+    cache_directory = None
+    if arguments.use_cache:
+        cache_directory = (
+            Path(arguments.cache)
+            if arguments.cache is not None
+            else output.parent / Analysis.CACHE_DIRECTORY
+        )
+
+    start = time.perf_counter()
+    files = Analysis.find_recordings(arguments.recordings)
+    analysis = Analysis(
+        files,
+        cache_directory=cache_directory,
+        max_dropped_frames=arguments.max_dropped_frames,
+    )
+    rows = analysis.run(processes=arguments.processes)
+    Analysis.save(rows, output)
+    print(
+        f"Analyzed {len(files) - len(analysis.failed)} recordings with {len(rows)} trials in "
+        f"{time.perf_counter() - start:.2f}s.",
+        file=sys.stderr,
+    )
+    if len(analysis.failed) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
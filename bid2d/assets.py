@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from bid2d.stimulus import Stimulus
+
+
+class AssetCache:
+    DIRECTORY = ".bid2d_assets"
+    AVATAR = Path(__file__).parent / "assets" / "avatar.png"
+
+    # Images scaled to the size they are shown with, stored as raw RGBA arrays which are memory-mapped on loading.
+    # The entries are keyed by the source file including its size and modification time, the relative size of the
+    # image and the window size. Therefore, changing any of them invalidates the entry.
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = directory if isinstance(directory, Path) else Path(directory)
+
+    def load(
+        self,
+        path: Path,
+        relative_size: float,
+        window_size: Tuple[int, int],
+    ) -> Image.Image:
+        cache_file = self._cache_file(path, relative_size, window_size)
+        if cache_file.is_file():
+            return Image.fromarray(np.load(cache_file, mmap_mode="r"))
+
+        # Fall back to the original image if the assets were not prepared for this configuration
+        image = Image.open(path)
+        image.load()
+        return image
+
+    def prepare(
+        self,
+        path: Path,
+        relative_size: float,
+        window_size: Tuple[int, int],
+    ) -> bool:
+        cache_file = self._cache_file(path, relative_size, window_size)
+        if cache_file.is_file():
+            return False
+
+        with Image.open(path) as image:
+            image = image.convert("RGBA")
+            target_size = AssetCache.display_size(
+                image.size, relative_size, window_size
+            )
+            if target_size != image.size:
+                image = image.resize(target_size, resample=Image.LANCZOS)
+            pixels = np.asarray(image, dtype=np.uint8)
+
+        # Write to a temporary file first, so an interrupted run never leaves a broken entry behind
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary_file = cache_file.with_suffix(".tmp.npy")
+        np.save(temporary_file, pixels)
+        temporary_file.replace(cache_file)
+        return True
+
+    @staticmethod
+    def display_size(
+        image_size: Tuple[int, int], relative_size: float, window_size: Tuple[int, int]
+    ) -> Tuple[int, int]:
+        # The largest side of the image spans 'relative_size' in normalized units, i.e. half of the window per unit
+        width, height = image_size
+        scale = relative_size / max(
+            2 * width / window_size[0], 2 * height / window_size[1]
+        )
+
+        # Never upscale: It costs memory without adding any details
+        scale = min(scale, 1.0)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def _cache_file(
+        self, path: Path, relative_size: float, window_size: Tuple[int, int]
+    ) -> Path:
+        stat = path.stat()
+        key = hashlib.sha1(
+            f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{relative_size}:"
+            f"{window_size[0]}x{window_size[1]}".encode()
+        ).hexdigest()
+        return self.directory / f"{key}.npy"
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d prepare-assets")
+    parser.add_argument(
+        "samples", type=str, help="The CSV file with the required samples."
+    )
+    parser.add_argument(
+        "-resolution",
+        type=int,
+        nargs=2,
+        help="The resolution of the window in pixels.",
+        default=(1920, 1080),
+    )
+    parser.add_argument(
+        "-avatar_size",
+        type=float,
+        help="The relative size of the avatar regarding its largest size.",
+        default=0.15,
+    )
+    parser.add_argument(
+        "-stimulus_size",
+        type=float,
+        help="The relative size of the stimulus regarding its largest size.",
+        default=0.75,
+    )
+    parser.add_argument(
+        "-cache",
+        type=str,
+        help=f"The cache directory. Defaults to '{AssetCache.DIRECTORY}' next to the samples.",
+        default=None,
+    )
+    arguments = parser.parse_args(arguments)
+
+    samples = Path(arguments.samples)
+    cache = AssetCache(
+        arguments.cache
+        if arguments.cache is not None
+        else samples.parent / AssetCache.DIRECTORY
+    )
+    window_size = tuple(arguments.resolution)
+
+    jobs = list(
+        dict.fromkeys(
+            [(AssetCache.AVATAR, arguments.avatar_size)]
+            + [
+                (stimulus.image, arguments.stimulus_size)
+                for stimulus in Stimulus.from_csv(samples)
+            ]
+        )
+    )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor() as executor:
+        prepared = sum(
+            executor.map(lambda job: cache.prepare(job[0], job[1], window_size), jobs)
+        )
+    print(
+        f"Prepared {prepared} of {len(jobs)} images for {window_size[0]}x{window_size[1]} in "
+        f"{time.perf_counter() - start:.2f}s.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
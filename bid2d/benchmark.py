@@ -0,0 +1,500 @@
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from bid2d.catalog import CatalogIndex
+from bid2d.logger import Logger
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+from bid2d.simulation import NullAvatar, NullStimulus
+from bid2d.stimulus import Stimulus
+from bid2d.trial import TrialTable
+from bid2d.util.collision import BoundingBoxes
+from bid2d.util.constrained_shuffle import SequenceConstraints
+from bid2d.util.profiler import Profiler
+from bid2d.xdf import XdfReader, XdfWriter
+
+# A benchmark prepares its data and returns the operation to time. It is skipped if the setup raises ImportError.
+BENCHMARKS: Dict[str, Callable[["Fixtures"], Callable[[], None]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup: Callable[["Fixtures"], Callable[[], None]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+class Fixtures:
+    # The data shared by the benchmarks, created in a temporary directory on first use
+    def __init__(self, directory: Path, scale: float = 1.0):
+        self.directory = directory
+        self.scale = scale
+        self._catalog = None
+        self._recording = None
+        self._compact_recording = None
+
+    def size(self, size: int) -> int:
+        return max(1, int(size * self.scale))
+
+    @property
+    def image(self) -> Path:
+        path = self.directory / "stimulus.png"
+        if not path.is_file():
+            Image.new("RGB", (400, 300)).save(path)
+        return path
+
+    @property
+    def catalog(self) -> Path:
+        if self._catalog is None:
+            self._catalog = self.directory / "catalog.csv"
+            with self._catalog.open("w") as file:
+                file.write("image,should_approach,name,category\n")
+                for i in range(self.size(10000)):
+                    file.write(f"{self.image.name},{i % 2 == 0},stimulus{i},c{i % 7}\n")
+        return self._catalog
+
+    @property
+    def recording(self) -> Path:
+        if self._recording is None:
+            self._recording = self.directory / "recording.xdf"
+            self._write_recording(self._recording, compact=False)
+        return self._recording
+
+    @property
+    def compact_recording(self) -> Path:
+        # The same session with the trials streamed as indices into a dictionary
+        if self._compact_recording is None:
+            self._compact_recording = self.directory / "compact_recording.xdf"
+            self._write_recording(self._compact_recording, compact=True)
+        return self._compact_recording
+
+    def _write_recording(self, file: Path, compact: bool):
+        # A session of about half an hour as LabRecorder writes it, next to 16 channels of EEG at 250 Hz
+        random_generator = np.random.default_rng(0)
+        num_trials = self.size(1000)
+        names = [f"stimulus{trial}" for trial in range(num_trials)]
+        eeg_rate, eeg_chunk = 250.0, 250
+        with XdfWriter(file) as writer:
+            if compact:
+                writer.add_stream(
+                    1,
+                    Logger.TRIAL_STREAM_NAME,
+                    "int32",
+                    2,
+                    desc=Session.trial_description(names),
+                )
+            else:
+                writer.add_stream(1, Logger.TRIAL_STREAM_NAME, "string", 2)
+            writer.add_stream(2, Logger.REACTION_STREAM_NAME, "int32", 2)
+            writer.add_stream(3, "EEG", "float32", 16, nominal_srate=eeg_rate)
+
+            eeg_time = 0.0
+            for trial in range(num_trials):
+                onset = 2.0 * trial
+                sample = (
+                    np.array([[trial, trial % 2]], dtype=np.int32)
+                    if compact
+                    else [[names[trial], Session.POSITIONS[trial % 2].value]]
+                )
+                writer.write_samples(1, np.array([onset]), sample)
+                num_frames = np.arange(30)
+                writer.write_samples(
+                    2,
+                    onset + 0.5 + num_frames / 60.0,
+                    np.column_stack(
+                        (num_frames, np.full(30, Reaction.Up.value))
+                    ).astype(np.int32),
+                )
+                writer.write_samples(1, np.array([onset + 1.0]), sample)
+
+                while eeg_time < onset + 2.0:
+                    writer.write_samples(
+                        3,
+                        eeg_time + np.arange(eeg_chunk) / eeg_rate,
+                        random_generator.standard_normal(
+                            (eeg_chunk, 16), dtype=np.float32
+                        ),
+                    )
+                    eeg_time += eeg_chunk / eeg_rate
+                writer.write_clock_offset(1, onset, 0.001)
+
+
+@benchmark("avatar.is_overlapping")
+def _is_overlapping(fixtures: Fixtures) -> Callable[[], None]:
+    avatar = NullAvatar((0.1, 0.15))
+    stimulus = NullStimulus((0.0, 0.0), (0.75, 0.5))
+    avatar.place(*Position.Above.calculate_avatar_position(stimulus))
+
+    def run():
+        for _ in range(1000):
+            avatar.is_overlapping(stimulus)
+
+    return run
+
+
+@benchmark("collision.overlapping")
+def _overlapping(fixtures: Fixtures) -> Callable[[], None]:
+    # A stimulus with 63 distractors, tested in one vectorized operation per frame
+    random_generator = np.random.default_rng(0)
+    bounding_boxes = BoundingBoxes.from_objects(
+        [NullStimulus((0.0, 0.0), (0.75, 0.5))]
+        + [
+            NullStimulus(tuple(random_generator.uniform(-1, 1, 2)), (0.1, 0.1))
+            for _ in range(63)
+        ]
+    )
+    avatar = NullAvatar((0.1, 0.15))
+
+    def run():
+        for _ in range(1000):
+            bounding_boxes.overlapping(avatar)
+
+    return run
+
+
+@benchmark("avatar.is_on_screen")
+def _is_on_screen(fixtures: Fixtures) -> Callable[[], None]:
+    avatar = NullAvatar((0.1, 0.15))
+
+    def run():
+        for _ in range(1000):
+            avatar.is_on_screen()
+
+    return run
+
+
+@benchmark("position.calculate_avatar_position")
+def _calculate_avatar_position(fixtures: Fixtures) -> Callable[[], None]:
+    stimulus = NullStimulus((0.0, 0.0), (0.75, 0.5))
+
+    def run():
+        for _ in range(500):
+            Position.Above.calculate_avatar_position(stimulus)
+            Position.Below.calculate_avatar_position(stimulus)
+
+    return run
+
+
+@benchmark("reaction.validate")
+def _validate(fixtures: Fixtures) -> Callable[[], None]:
+    def run():
+        for _ in range(250):
+            for reaction in (Reaction.Up, Reaction.Down):
+                reaction.validate(Position.Above, True)
+                reaction.validate(Position.Below, False)
+
+    return run
+
+
+@benchmark("logger.push")
+def _push(fixtures: Fixtures) -> Callable[[], None]:
+    logger = Logger()
+    trial = Logger.Trial(name="stimulus", position=Position.Above)
+    reaction = Logger.Reaction(num_frames=1, reaction=Reaction.Up)
+
+    def run():
+        logger.push(trial)
+        for _ in range(1000):
+            logger.push(reaction)
+        logger.push(trial)
+
+    return run
+
+
+@benchmark("logger.push_journaled")
+def _push_journaled(fixtures: Fixtures) -> Callable[[], None]:
+    logger = Logger(journal=fixtures.directory / "benchmark.journal")
+    trial = Logger.Trial(name="stimulus", position=Position.Above)
+    reaction = Logger.Reaction(num_frames=1, reaction=Reaction.Up)
+
+    def run():
+        logger.push(trial)
+        for _ in range(1000):
+            logger.push(reaction)
+        logger.push(trial)
+
+    return run
+
+
+@benchmark("profiler.wrap")
+def _profiler_wrap(fixtures: Fixtures) -> Callable[[], None]:
+    # The cost of recording a span around a call
+    profiler = Profiler(fixtures.directory / "benchmark_trace.json", capacity=1000)
+    noop = profiler.wrap("noop", lambda: None)
+
+    def run():
+        profiler.clear()
+        for _ in range(1000):
+            noop()
+
+    return run
+
+
+@benchmark("stimulus.from_csv")
+def _from_csv(fixtures: Fixtures) -> Callable[[], None]:
+    catalog = fixtures.catalog
+    return lambda: list(Stimulus.from_csv(catalog))
+
+
+@benchmark("stimulus.from_csv_indexed")
+def _from_csv_indexed(fixtures: Fixtures) -> Callable[[], None]:
+    catalog = fixtures.catalog
+    index = CatalogIndex(fixtures.directory / "catalog.sqlite")
+    list(Stimulus.from_csv(catalog, index=index))
+    return lambda: list(Stimulus.from_csv(catalog, index=index))
+
+
+@benchmark("experiment.generate_trials")
+def _generate_trials(fixtures: Fixtures) -> Callable[[], None]:
+    stimuli = list(Stimulus.from_csv(fixtures.catalog))[: fixtures.size(2000)]
+    return lambda: TrialTable.generate(
+        stimuli, position=(Position.Above, Position.Below), block=tuple(range(5))
+    )
+
+
+@benchmark("experiment.generate_constrained_trials")
+def _generate_constrained_trials(fixtures: Fixtures) -> Callable[[], None]:
+    stimuli = list(Stimulus.from_csv(fixtures.catalog))[: fixtures.size(2000)]
+    constraints = SequenceConstraints(
+        max_run={"position": 3, "should_approach": 3, "stimulus": 1},
+        balanced_transitions=("position",),
+    )
+    return lambda: TrialTable.generate(
+        stimuli, constraints=constraints, position=(Position.Above, Position.Below)
+    )
+
+
+@benchmark("experiment.iterate_trials")
+def _iterate_trials(fixtures: Fixtures) -> Callable[[], None]:
+    stimuli = list(Stimulus.from_csv(fixtures.catalog))[: fixtures.size(2000)]
+    trials = TrialTable.generate(
+        stimuli, position=(Position.Above, Position.Below), block=tuple(range(5))
+    )
+
+    def run():
+        for trial in trials:
+            trial["position"], trial.should_approach
+
+    return run
+
+
+@benchmark("logger.load_trials")
+def _load_trials(fixtures: Fixtures) -> Callable[[], None]:
+    recording = str(fixtures.recording)
+    return lambda: list(Logger.load_trials(recording))
+
+
+@benchmark("logger.load_trials_compact")
+def _load_trials_compact(fixtures: Fixtures) -> Callable[[], None]:
+    recording = str(fixtures.compact_recording)
+    return lambda: list(Logger.load_trials(recording))
+
+
+@benchmark("logger.load_session_trials")
+def _load_session_trials(fixtures: Fixtures) -> Callable[[], None]:
+    recording = fixtures.recording
+    return lambda: Session.from_streams(
+        XdfReader(recording).load((Logger.TRIAL_STREAM_NAME,))[
+            Logger.TRIAL_STREAM_NAME
+        ],
+        None,
+    )
+
+
+@benchmark("logger.load_session_trials_compact")
+def _load_session_trials_compact(fixtures: Fixtures) -> Callable[[], None]:
+    recording = fixtures.compact_recording
+    return lambda: Session.from_streams(
+        XdfReader(recording).load((Logger.TRIAL_STREAM_NAME,))[
+            Logger.TRIAL_STREAM_NAME
+        ],
+        None,
+    )
+
+
+@benchmark("logger.load_reactions")
+def _load_reactions(fixtures: Fixtures) -> Callable[[], None]:
+    recording = str(fixtures.recording)
+    return lambda: list(Logger.load_reactions(recording))
+
+
+@dataclass
+class Result:
+    # Seconds per call of the operation
+    best: float
+    median: float
+    number: int
+    repeat: int
+
+
+def measure(
+    operation: Callable[[], None], repeat: int = 5, min_time: float = 0.2
+) -> Result:
+    # Calibrate the number of calls per repetition like 'timeit', so fast operations are not dominated by the timer
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        duration = time.perf_counter() - start
+        if duration >= min_time or number >= 2**20:
+            break
+        number *= 2 if duration <= 0 else max(2, min(10, int(min_time / duration) + 1))
+
+    timings = [duration / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        timings.append((time.perf_counter() - start) / number)
+    return Result(
+        best=min(timings),
+        median=statistics.median(timings),
+        number=number,
+        repeat=repeat,
+    )
+
+
+def run(
+    names: Sequence[str], repeat: int = 5, min_time: float = 0.2, scale: float = 1.0
+) -> Dict[str, Result]:
+    results = {}
+    directory = Path(tempfile.mkdtemp(prefix="bid2d_benchmark"))
+    try:
+        fixtures = Fixtures(directory, scale=scale)
+        for name in names:
+            try:
+                operation = BENCHMARKS[name](fixtures)
+            except ImportError as e:
+                print(f"{name:40s} skipped ({e})", file=sys.stderr)
+                continue
+            results[name] = measure(operation, repeat=repeat, min_time=min_time)
+            print(f"{name:40s} {results[name].best * 1e3:12.4f} ms", file=sys.stderr)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(
+    baseline: Dict[str, Result], results: Dict[str, Result], threshold: float
+) -> List[str]:
+    # Compare the best timings, which are the least affected by noise. Returns the names of the regressions.
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name, None)
+        if reference is None:
+            continue
+        ratio = result.best / reference.best
+        is_regression = ratio > 1.0 + threshold
+        print(
+            f"{name:40s} {reference.best * 1e3:12.4f} ms -> {result.best * 1e3:12.4f} ms "
+            f"({ratio:6.2f}x){' REGRESSION' if is_regression else ''}",
+            file=sys.stderr,
+        )
+        if is_regression:
+            regressions.append(name)
+    return regressions
+
+
+def save(file: Path, results: Dict[str, Result]):
+    file.write_text(
+        json.dumps(
+            {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": np.__version__,
+                "benchmarks": {
+                    name: asdict(result) for name, result in results.items()
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+def load(file: Path) -> Dict[str, Result]:
+    return {
+        name: Result(**result)
+        for name, result in json.loads(file.read_text())["benchmarks"].items()
+    }
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d benchmark")
+    parser.add_argument(
+        "-filter",
+        type=str,
+        nargs="*",
+        help="Only run the benchmarks containing one of the given strings.",
+        default=None,
+    )
+    parser.add_argument(
+        "-output", type=str, help="Save the results as JSON baseline.", default=None
+    )
+    parser.add_argument(
+        "-compare",
+        type=str,
+        help="Compare the results against a previously saved baseline.",
+        default=None,
+    )
+    parser.add_argument(
+        "-threshold",
+        type=float,
+        help="The relative slowdown regarding the baseline which is reported as regression.",
+        default=0.25,
+    )
+    parser.add_argument(
+        "-repeat", type=int, help="The number of timed repetitions.", default=5
+    )
+    parser.add_argument(
+        "--quick",
+        dest="quick",
+        action="store_true",
+        help="Use smaller data and shorter timings, i.e. for smoke tests.",
+        default=False,
+    )
+    arguments = parser.parse_args(arguments)
+
+    names = [
+        name
+        for name in BENCHMARKS
+        if not arguments.filter or any(part in name for part in arguments.filter)
+    ]
+    results = run(
+        names,
+        repeat=arguments.repeat,
+        min_time=0.02 if arguments.quick else 0.2,
+        scale=0.1 if arguments.quick else 1.0,
+    )
+
+    if arguments.output is not None:
+        save(Path(arguments.output), results)
+    if arguments.compare is not None:
+        regressions = compare(
+            load(Path(arguments.compare)), results, arguments.threshold
+        )
+        if regressions:
+            print(
+                f"{len(regressions)} benchmark(s) slower than the baseline by more than "
+                f"{arguments.threshold:.0%}: {', '.join(regressions)}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from PIL import Image
+
+from bid2d.stimulus import Stimulus
+
+
+class CatalogIndex:
+    # A local SQLite database with the parsed rows of a stimulus catalog and the validated images. For an unchanged
+    # catalog, the rows are read from the index without parsing the CSV, and the images, which may live on a slow
+    # network share, are only checked by their size and modification time, in parallel. Only the images which are
+    # new or changed since are opened again.
+    DIRECTORY = Path.home() / ".cache" / "bid2d" / "catalogs"
+
+    def __init__(self, file: Union[str, Path], max_workers: int = 16):
+        self.file = file if isinstance(file, Path) else Path(file)
+        self.max_workers = max_workers
+
+    def rows(
+        self,
+        catalog: Path,
+        delimiter: str = ",",
+        dialect: str = "excel",
+        full: bool = False,
+    ) -> List[Dict[str, Any]]:
+        signature = CatalogIndex._signature(catalog, delimiter, dialect)
+        with self._connect() as connection:
+            parsed = full or CatalogIndex._get(connection, "signature") != signature
+            if parsed:
+                rows = list(
+                    Stimulus.parse_csv(catalog, delimiter=delimiter, dialect=dialect)
+                )
+            else:
+                rows = CatalogIndex._decode_rows(
+                    [
+                        content
+                        for (content,) in connection.execute(
+                            "SELECT content FROM rows ORDER BY position"
+                        )
+                    ]
+                )
+
+            # Compare the files with the state they were validated in
+            paths = list(dict.fromkeys(row[Stimulus.IMAGE_PATH] for row in rows))
+            validated = (
+                {}
+                if full
+                else {
+                    path: (size, mtime_ns)
+                    for path, size, mtime_ns in connection.execute(
+                        "SELECT path, size, mtime_ns FROM images"
+                    )
+                }
+            )
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                stats = list(executor.map(CatalogIndex._stat, paths))
+                CatalogIndex._check_missing(paths, stats)
+                changed = [
+                    path
+                    for path, stat in zip(paths, stats)
+                    if validated.get(str(path), None) != stat
+                ]
+                images = list(executor.map(CatalogIndex._inspect, changed))
+            CatalogIndex._check_missing(changed, images)
+
+            connection.executemany(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+                [(str(path),) + image for path, image in zip(changed, images)],
+            )
+            if parsed:
+                connection.execute("DELETE FROM rows")
+                connection.executemany(
+                    "INSERT INTO rows VALUES (?, ?)",
+                    list(enumerate(CatalogIndex._encode_row(row) for row in rows)),
+                )
+                CatalogIndex._set(connection, "signature", signature)
+        return rows
+
+    def image_size(self, image: Path) -> Optional[Tuple[int, int]]:
+        with self._connect() as connection:
+            size = connection.execute(
+                "SELECT width, height FROM images WHERE path = ?", (str(image),)
+            ).fetchone()
+        return tuple(size) if size is not None else None
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A single transaction, which is rolled back on errors
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.file)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS rows (position INTEGER PRIMARY KEY, content TEXT)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, size INTEGER, "
+                    "mtime_ns INTEGER, width INTEGER, height INTEGER)"
+                )
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def default_file(catalog: Path) -> Path:
+        # Local to the machine, even if the catalog is on a network share
+        key = hashlib.sha1(str(catalog.resolve()).encode()).hexdigest()
+        return CatalogIndex.DIRECTORY / f"{key}.sqlite"
+
+    @staticmethod
+    def _signature(catalog: Path, delimiter: str, dialect: str) -> str:
+        stat = catalog.stat()
+        return f"{catalog.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{delimiter}:{dialect}"
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def _check_missing(paths: Sequence[Path], results: Sequence[Optional[Any]]):
+        missing = [path for path, result in zip(paths, results) if result is None]
+        if missing:
+            raise FileNotFoundError(f"Unable to find image '{missing[0]}'.")
+
+    @staticmethod
+    def _inspect(path: Path) -> Optional[Tuple[int, int, int, int]]:
+        # The size and modification time of the file and the dimensions of the image from its header
+        try:
+            stat = os.stat(path)
+            with Image.open(path) as image:
+                width, height = image.size
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+        return stat.st_size, stat.st_mtime_ns, width, height
+
+    @staticmethod
+    def _encode_row(row: Dict[str, Any]) -> str:
+        return json.dumps(
+            {
+                key: str(value) if key == Stimulus.IMAGE_PATH else value
+                for key, value in row.items()
+            },
+            sort_keys=True,
+        )
+
+    @staticmethod
+    def _decode_rows(contents: List[str]) -> List[Dict[str, Any]]:
+        # Parse all rows at once and share the paths of rows referring to the same image
+        rows = json.loads("[" + ",".join(contents) + "]")
+        paths = {}
+        for row in rows:
+            image = row[Stimulus.IMAGE_PATH]
+            path = paths.get(image, None)
+            if path is None:
+                path = paths[image] = Path(image)
+            row[Stimulus.IMAGE_PATH] = path
+        return rows
+
+    @staticmethod
+    def _get(connection: sqlite3.Connection, key: str) -> Optional[str]:
+        value = connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return value[0] if value is not None else None
+
+    @staticmethod
+    def _set(connection: sqlite3.Connection, key: str, value: str):
+        connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d index-catalog")
+    parser.add_argument(
+        "samples", type=str, help="The CSV file with the required samples."
+    )
+    parser.add_argument(
+        "-index",
+        type=str,
+        help=f"The index file. Defaults to a file in '{CatalogIndex.DIRECTORY}'.",
+        default=None,
+    )
+    parser.add_argument(
+        "--full",
+        dest="full",
+        action="store_true",
+        help="Validate all images, not only the new or changed ones.",
+        default=False,
+    )
+    arguments = parser.parse_args(arguments)
+
+    samples = Path(arguments.samples)
+    index = CatalogIndex(
+        arguments.index
+        if arguments.index is not None
+        else CatalogIndex.default_file(samples)
+    )
+    start = time.perf_counter()
+    rows = index.rows(samples, full=arguments.full)
+    print(
+        f"Indexed {len(rows)} samples into '{index.file}' in {time.perf_counter() - start:.2f}s.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
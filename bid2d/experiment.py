@@ -1,24 +1,31 @@
+import contextlib
+import functools
+import gc
 import itertools
-import random
-from copy import deepcopy
-from typing import Sequence, Any, Tuple
+from pathlib import Path
+from typing import Sequence, Any, Tuple, Optional, Callable, TYPE_CHECKING
 
-from psychopy.preferences import prefs
-
-# Install a global shutdown key
-prefs.general["shutdownKey"] = "q"
-from psychopy import visual
-from psychopy.visual.backends.pygletbackend import PygletBackend
-from pyglet.window import Window
-from pyglet.window.key import KeyStateHandler, UP, DOWN
+import numpy as np
 
+from bid2d.assets import AssetCache
 from bid2d.stimulus import Stimulus
-from bid2d.position import Position
 from bid2d.reaction import Reaction
-from bid2d.util.fixation_point import FixationPoint
-from bid2d.util.avatar import Avatar
+from bid2d.schedule import Schedule
+from bid2d.trial import TrialTable, Trial
+from bid2d.util.collision import BoundingBoxes
+from bid2d.util.constrained_shuffle import SequenceConstraints
+from bid2d.util.frame_timer import FrameTimer
+from bid2d.util.keyboard import KeyState, UP, DOWN
+from bid2d.util.profiler import Profiler
+from bid2d.util.static_scene import StaticScene
+from bid2d.util.texture_cache import TextureCache
+from bid2d.util.texture_prefetcher import TexturePrefetcher
 from bid2d.logger import Logger
 
+# The graphics stack is imported once the window is created, so headless runs do not depend on it
+if TYPE_CHECKING:
+    from pyglet.window import Window
+
 
 class Experiment:
     def __init__(
@@ -27,10 +34,30 @@ class Experiment:
         logger: Logger,
         win_size: Tuple[int, int] = (1024, 768),
         fullscreen: bool = True,
+        record_frame_timing: bool = False,
+        asset_cache: Optional[AssetCache] = None,
+        static_scene: bool = False,
+        prefetch: Optional[int] = None,
+        profiler: Optional[Profiler] = None,
+        clock: Optional[Callable[[], float]] = None,
     ):
         self.samples = samples
         self.logger = logger
-        self._window = visual.Window(win_size, checkTiming=True, fullscr=fullscreen)
+        self.asset_cache = asset_cache
+        self._window = self._create_window(win_size, fullscreen)
+        self._frame_timer = FrameTimer(self._window) if record_frame_timing else None
+        self._static_scene = StaticScene(self._window) if static_scene else None
+
+        # Given a window of trials, only their stimuli and distractors are loaded instead of all of them up front
+        self.prefetch = prefetch
+        self.prefetcher: Optional[TexturePrefetcher] = None
+        self.distractor_prefetcher: Optional[TexturePrefetcher] = None
+
+        # The phases of the session are only measured given a profiler
+        self.profiler = profiler
+
+        # Given a clock, the events are timestamped with it. Otherwise, the logger timestamps them on arrival.
+        self.clock = clock
 
     def prepare(self):
         while not self.logger:
@@ -42,80 +69,410 @@ class Experiment:
         seed: int,
         avatar_size: float,
         stimulus_size: float,
+        num_distractors: int = 0,
+        distractor_size: float = 0.25,
+        constraints: Optional[SequenceConstraints] = None,
+        approach_distractors: bool = False,
     ):
-        # Create the trials and load all the visible stimuli into the graphic buffer
-        trials = Experiment.generate_trials(
-            self.samples, position=(Position.Above, Position.Below), seed=seed
+        with self._span("Schedule.compile"):
+            schedule = Schedule.compile(
+                self.samples,
+                seed=seed,
+                fixation_jitter=fixation_cross_jitter,
+                frame_period=self._window.monitorFramePeriod,
+                window_size=tuple(self._window.size),
+                stimulus_size=stimulus_size,
+                avatar_size=avatar_size,
+                num_distractors=num_distractors,
+                distractor_size=distractor_size,
+                constraints=constraints,
+                approach_distractors=approach_distractors,
+            )
+        self.run_schedule(schedule)
+
+    def run_schedule(self, schedule: Schedule):
+        # The session is resolved ahead of time: The trial order, the fixation frames and the start of the avatar
+        schedule.check(
+            self.samples,
+            window_size=tuple(self._window.size),
+            frame_period=self._window.monitorFramePeriod,
+        )
+
+        # Create the trials and load all the visible stimuli into the graphic buffer, or prepare their prefetching
+        with self._span("preload"):
+            trials = schedule.trial_table(self.samples)
+            if self.prefetch is not None:
+                self.prefetcher = self._create_prefetcher(schedule)
+                if schedule.num_distractors > 0:
+                    self.distractor_prefetcher = self._create_distractor_prefetcher(
+                        schedule
+                    )
+            else:
+                self._load_stimuli(schedule.stimulus_size)
+            fixation_cross = self._create_fixation_point()
+            avatar = self._create_avatar(schedule.avatar_size)
+            distractors = {
+                int(index): self._create_distractor(
+                    self.samples[index], schedule.distractor_size
+                )
+                for index in (
+                    np.unique(schedule.trials["distractors"])
+                    if schedule.num_distractors > 0
+                    and self.distractor_prefetcher is None
+                    else ()
+                )
+            }
+        flip = self._profiled(
+            "flip",
+            (
+                self._frame_timer.flip
+                if self._frame_timer is not None
+                else self._window.flip
+            ),
         )
-        all((trial.load(self._window, stimulus_size=stimulus_size) for trial in trials))
-        fixation_cross = FixationPoint.create(self._window)
-        avatar = Avatar(self._window, avatar_size=avatar_size)
-        random_generator = random.Random(seed)
+        push = self._profiled("Logger.push", self.logger.push)
+        show_fixation = self._profiled("FixationPoint.show", fixation_cross.show_frames)
+        load_stimulus = self._profiled("Experiment.load_stimulus", self._load_stimulus)
+        draw = self._profiled("draw", self._draw_frame)
+        prepare = (
+            self._profiled("TexturePrefetcher.prepare", self.prefetcher.prepare)
+            if self.prefetcher is not None
+            else None
+        )
+        prepare_distractors = (
+            self._profiled(
+                "TexturePrefetcher.prepare", self.distractor_prefetcher.prepare
+            )
+            if self.distractor_prefetcher is not None
+            else None
+        )
+
+        keyboard = self._create_keyboard()
+        now = self.clock if self.clock is not None else Experiment._unset_timestamp
+
+        # The event record of the frame loop is reused, as the logger does not keep the events it was given
+        reaction_event = Logger.Reaction(num_frames=0, reaction=Reaction.NoReaction)
+
+        # Looking the members of an enumeration up allocates, so they are looked up once
+        no_reaction, up, down = Reaction.NoReaction, Reaction.Up, Reaction.Down
+
+        # The garbage collector is paused while the frames of a trial are presented, so a collection does not delay
+        # a flip. It catches up during the fixation cross.
+        gc_enabled = gc.isenabled()
+        try:
+            # Iterate through the trials
+            for trial, planned in zip(trials, schedule.trials):
+                # Create the texture of this trial. The next images are decoded in the background meanwhile.
+                if prepare is not None:
+                    prepare(trial.index)
+                if prepare_distractors is not None:
+                    prepare_distractors(trial.index)
+
+                # Show the fixation cross
+                show_fixation(int(planned["fixation_frames"]), flip=flip)
+
+                # Log the start of the trial
+                position = trial["position"]
+                push(Logger.Trial(name=trial.name, position=position, timestamp=now()))
+                if self._frame_timer is not None:
+                    self._frame_timer.start()
 
+                # Get the stimulus and set the position of the avatar
+                stimulus = load_stimulus(trial)
+                avatar.place(0.0, float(planned["avatar_y"]))
+
+                # The stimulus does not change during the trial, so draw its captured scene, if available
+                background = (
+                    self._static_scene.get(trial.stimulus.image, stimulus)
+                    if self._static_scene is not None
+                    else stimulus
+                )
+
+                should_approach = trial.should_approach
+
+                # The stimulus comes first, followed by the distractors placed for this trial
+                objects = [stimulus]
+                names = [trial.name]
+                for k in range(schedule.num_distractors):
+                    index = int(planned["distractors"][k])
+                    distractor = (
+                        self.distractor_prefetcher.get(trial.index, k)
+                        if self.distractor_prefetcher is not None
+                        else distractors[index]
+                    )
+                    distractor.pos = (
+                        float(planned["distractor_x"][k]),
+                        float(planned["distractor_y"][k]),
+                    )
+                    objects.append(distractor)
+                    names.append(self.samples[index].name)
+                trial_distractors = objects[1:]
+                bounding_boxes = BoundingBoxes.from_objects(objects)
+
+                # An approach trial ends on touching its stimulus, an avoid trial on leaving the screen. Touching a
+                # distractor to approach ends either of them, too.
+                approach = np.zeros(len(objects), dtype=bool)
+                approach[0] = should_approach
+                if schedule.num_distractors > 0:
+                    approach[1:] = planned["distractor_approach"]
+                is_first_touch = True
+
+                # Present the frames one after another and wait for the user reaction. Presses before the trial do
+                # not count.
+                keyboard.clear_presses()
+                is_first_reaction = True
+                gc.disable()
+                for frame in itertools.count():
+                    reaction = no_reaction
+
+                    # Handle the reaction of the user
+                    if keyboard[UP]:
+                        avatar.up()
+                        reaction = up
+                    elif keyboard[DOWN]:
+                        avatar.down()
+                        reaction = down
+
+                    # If there was a reaction ...
+                    if reaction is not no_reaction:
+                        # ... check it if it was the first one, ...
+                        timestamp = now()
+                        if is_first_reaction:
+                            # The key events tell which key was pressed first and on which flip it arrived,
+                            # even if frames were dropped
+                            press = keyboard.first_press((UP, DOWN))
+                            if press is not None:
+                                reaction = up if press[0] == UP else down
+                                timestamp = press[1]
+
+                            reaction = reaction.validate(
+                                should_approach=should_approach, position=position
+                            )
+                            is_first_reaction = False
+
+                        # ... but log it anyway.
+                        reaction_event.num_frames = frame
+                        reaction_event.reaction = reaction
+                        reaction_event.timestamp = timestamp
+                        push(reaction_event)
+
+                    # Log the first object the avatar touched
+                    touched = bounding_boxes.overlapping(avatar)
+                    if is_first_touch and bounding_boxes.any():
+                        index = int(touched.argmax())
+                        push(
+                            Logger.Touch(
+                                name=names[index], index=index, timestamp=now()
+                            )
+                        )
+                        is_first_touch = False
+
+                    # Check if this trial should end
+                    if bounding_boxes.any(where=approach) or (
+                        not should_approach and not avatar.is_on_screen()
+                    ):
+                        break
+
+                    # Draw end present the simuli
+                    draw(background, trial_distractors, avatar)
+                    flip()
+
+                if gc_enabled:
+                    gc.enable()
+                if self._frame_timer is not None:
+                    frame_timing = self._frame_timer.stop()
+                    push(
+                        Logger.FrameTiming(
+                            num_frames=frame_timing.num_frames,
+                            num_dropped=frame_timing.num_dropped,
+                            max_interval=frame_timing.max_interval,
+                            timestamp=now(),
+                        )
+                    )
+                push(Logger.Trial(name=trial.name, position=position, timestamp=now()))
+        finally:
+            if gc_enabled:
+                gc.enable()
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+            if self.distractor_prefetcher is not None:
+                self.distractor_prefetcher.close()
+
+    @staticmethod
+    def _unset_timestamp() -> float:
+        # The logger replaces a timestamp of zero with the time the event arrives
+        return 0.0
+
+    def _create_window(self, win_size: Tuple[int, int], fullscreen: bool):
+        from psychopy.preferences import prefs
+
+        # Install a global shutdown key
+        prefs.general["shutdownKey"] = "q"
+        from psychopy import visual
+
+        return visual.Window(win_size, checkTiming=True, fullscr=fullscreen)
+
+    def _create_keyboard(self) -> KeyState:
         # It would be nice to use Psychopys keyboard feature - but it does not support holding keys down.
         # Therefore, get deeper into the rabbits hole...
         # >> keyboard = Keyboard(waitForStart=False)
-        keyboard = KeyStateHandler()
+        import pylsl
+
+        # The presses are timestamped with the clock of the streams
+        keyboard = KeyState(clock=pylsl.local_clock)
         self.get_raw_window().push_handlers(keyboard)
+        return keyboard
 
-        # Iterate through the trials
-        for trial in trials:
-            # Show the fixation cross
-            fixation_cross.show(random_generator.uniform(*fixation_cross_jitter))
+    def _create_fixation_point(self):
+        from bid2d.util.fixation_point import FixationPoint
 
-            # Log the start of the trial
-            self.logger.push(
-                Logger.Trial(name=trial["name"], position=trial["position"])
-            )
+        fixation_point = FixationPoint.create(self._window)
+        if self._static_scene is not None:
+            fixation_point.capture(self._static_scene)
+        return fixation_point
 
-            # Get the stimulus and set the position of the avatar
-            stimulus = trial.load(self._window)
-            avatar.pos = trial["position"].calculate_avatar_position(stimulus)
-
-            should_approach = trial[Stimulus.SHOULD_APPROACH]
-
-            # Present the frames one after another and wait for the user reaction
-            is_first_reaction = True
-            for frame in itertools.count():
-                reaction = Reaction.NoReaction
-
-                # Handle the reaction of the user
-                if keyboard[UP]:
-                    avatar.up()
-                    reaction = Reaction.Up
-                elif keyboard[DOWN]:
-                    avatar.down()
-                    reaction = Reaction.Down
-
-                # If there was a reaction ...
-                if reaction in (Reaction.Up, Reaction.Down):
-                    # ... check it if it was the first one, ...
-                    if is_first_reaction:
-                        reaction = reaction.validate(
-                            should_approach=should_approach, position=trial["position"]
-                        )
-                        is_first_reaction = False
+    def _create_avatar(self, avatar_size: float):
+        from bid2d.util.avatar import Avatar
 
-                    # ... but log it anyway.
-                    self.logger.push(
-                        Logger.Reaction(num_frames=frame, reaction=reaction,)
-                    )
+        return Avatar(
+            self._window, avatar_size=avatar_size, asset_cache=self.asset_cache
+        )
+
+    def _draw_frame(self, background: Any, distractors: Sequence[Any], avatar: Any):
+        # Iterating allocates, so the loop is skipped in trials without distractors
+        background.draw(self._window)
+        if distractors:
+            for distractor in distractors:
+                distractor.draw(self._window)
+        avatar.draw(self._window)
+
+    def _profiled(self, name: str, function: Callable) -> Callable:
+        # Without a profiler, the function is called directly and not any slower
+        return (
+            self.profiler.wrap(name, function)
+            if self.profiler is not None
+            else function
+        )
+
+    def _span(self, name: str):
+        return (
+            self.profiler.span(name)
+            if self.profiler is not None
+            else contextlib.nullcontext()
+        )
+
+    def _decoder(self, stimulus_size: float) -> Callable[[Path], Any]:
+        # Use the pre-scaled images, if available
+        return self._profiled(
+            "decode",
+            (
+                functools.partial(
+                    self.asset_cache.load,
+                    relative_size=stimulus_size,
+                    window_size=tuple(self._window.size),
+                )
+                if self.asset_cache is not None
+                else TextureCache.decode_file
+            ),
+        )
 
-                # Check if this trial should end
-                if (should_approach and avatar.is_overlapping(stimulus)) or (
-                    not should_approach and not avatar.is_on_screen()
-                ):
-                    self.logger.push(
-                        Logger.Trial(name=trial["name"], position=trial["position"])
+    def _load_stimuli(self, stimulus_size: float):
+        # Each image is decoded once in parallel, no matter in how many conditions it is shown
+        load = self._profiled("Stimulus.load", Stimulus.load)
+        with TextureCache(decode=self._decoder(stimulus_size)) as texture_cache:
+            texture_cache.prefetch(sample.image for sample in self.samples)
+            all(
+                (
+                    load(
+                        sample,
+                        self._window,
+                        stimulus_size=stimulus_size,
+                        cache=texture_cache,
                     )
-                    break
+                    for sample in self.samples
+                )
+            )
+
+        # Capture each image once. Stimuli sharing an image share the scene, too.
+        if self._static_scene is not None:
+            window_size = tuple(self._window.size)
+            for sample in self.samples:
+                image = sample.load(self._window)
+                self._static_scene.capture(
+                    sample.image,
+                    [image],
+                    StaticScene.bounding_rect(image.pos, image.size, window_size),
+                )
+
+    def _create_distractor(
+        self, stimulus: Stimulus, distractor_size: float, decoded: Any = None
+    ):
+        # A separate image of its own size, so the stimulus of a trial may serve as distractor in another one
+        return Stimulus._create_image(
+            self._window,
+            decoded if decoded is not None else str(stimulus.image),
+            distractor_size,
+        )
+
+    def _create_distractor_prefetcher(self, schedule: Schedule) -> TexturePrefetcher:
+        # The distractors of each trial are consecutive keys. They are the indices of the samples, as the distractors
+        # of a trial differ, even if two samples share an image.
+        decode = self._decoder(schedule.distractor_size)
+        return TexturePrefetcher(
+            schedule.trials["distractors"].ravel().tolist(),
+            window=self.prefetch,
+            create=self._profiled(
+                "Experiment.create_distractor",
+                lambda index, decoded: self._create_distractor(
+                    self.samples[index], schedule.distractor_size, decoded
+                ),
+            ),
+            decode=lambda index: decode(self.samples[index].image),
+            keys_per_trial=schedule.num_distractors,
+        )
+
+    def _create_prefetcher(self, schedule: Schedule) -> TexturePrefetcher:
+        # Stimuli sharing the same image share the texture, too
+        return TexturePrefetcher(
+            [
+                self.samples[index].image
+                for index in schedule.trials["stimulus"].tolist()
+            ],
+            window=self.prefetch,
+            create=self._profiled(
+                "Stimulus.load",
+                functools.partial(
+                    self._create_stimulus, stimulus_size=schedule.stimulus_size
+                ),
+            ),
+            decode=self._decoder(schedule.stimulus_size),
+            release=self._release_stimulus,
+        )
 
-                # Draw end present the simuli
-                trial.draw(self._window)
-                avatar.draw(self._window)
-                self._window.flip()
+    def _create_stimulus(self, image: Path, decoded: Any, stimulus_size: float):
+        stimulus = Stimulus._create_image(self._window, decoded, stimulus_size)
+        if self._static_scene is not None:
+            self._static_scene.capture(
+                image,
+                [stimulus],
+                StaticScene.bounding_rect(
+                    stimulus.pos, stimulus.size, tuple(self._window.size)
+                ),
+            )
+        return stimulus
+
+    def _release_stimulus(self, image: Path, stimulus: Any):
+        if self._static_scene is not None:
+            self._static_scene.release(image)
+
+    def _load_stimulus(self, trial: Trial):
+        if self.prefetcher is not None:
+            return self.prefetcher.get(trial.index)
+        return trial.load(self._window)
+
+    def get_raw_window(self) -> "Window":
+        from psychopy.visual.backends.pygletbackend import PygletBackend
 
-    def get_raw_window(self) -> Window:
         backend = self._window.backend
         if not isinstance(backend, PygletBackend):
             raise NotImplementedError(
@@ -125,23 +482,11 @@ class Experiment:
 
     @staticmethod
     def generate_trials(
-        stimuli: Sequence[Stimulus], seed: int = 42, **conditions: Sequence[Any]
-    ) -> Sequence[Stimulus]:
-
-        trials = []
-        for stimulus, condition in itertools.product(stimuli, *conditions.values()):
-            stimulus = deepcopy(stimulus)
-            stimulus.update(
-                {
-                    key: value
-                    for key, value in zip(
-                        conditions.keys(),
-                        [condition] if len(conditions) == 1 else iter(condition),
-                    )
-                }
-            )
-
-            trials.append(stimulus)
-
-        random.shuffle(trials, random=random.Random(seed).random)
-        return trials
+        stimuli: Sequence[Stimulus],
+        seed: int = 42,
+        constraints: Optional[SequenceConstraints] = None,
+        **conditions: Sequence[Any],
+    ) -> TrialTable:
+        return TrialTable.generate(
+            stimuli, seed=seed, constraints=constraints, **conditions
+        )
@@ -0,0 +1,323 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+
+
+class EventJournal:
+    # A local, append-only copy of the logged events, independent of a connected recorder. The file is preallocated
+    # and memory mapped, so writing a record is a copy into the page cache without any system call. The kind of a
+    # record is written last: After a crash, a partially written record reads as empty and only that one is lost.
+    MAGIC = b"BID2DJNL"
+    VERSION = 1
+    HEADER_SIZE = 64
+    CAPACITY = 1 << 16
+
+    EMPTY, NAME, TRIAL, REACTION, FRAME_TIMING = range(5)
+
+    # The index is the name of a trial or the number of frames of the other events. The phase tells the start of
+    # a trial from its end. Names are written once, split into chunks, before the first trial referring to them.
+    RECORD_DTYPE = np.dtype(
+        [
+            ("kind", "u1"),
+            ("code", "i1"),
+            ("phase", "u1"),
+            ("index", "<i4"),
+            ("timestamp", "<f8"),
+            ("num_dropped", "<i4"),
+            ("max_interval", "<f8"),
+            ("text", "S32"),
+        ],
+        align=True,
+    )
+    POSITIONS = Session.POSITIONS
+
+    def __init__(self, file: Union[str, Path], capacity: int = CAPACITY):
+        self.file = file if isinstance(file, Path) else Path(file)
+        self._records: Optional[np.memmap] = None
+        if self.file.is_file() and self.file.stat().st_size > 0:
+            EventJournal._check_header(self.file)
+            capacity = max(capacity, EventJournal._capacity(self.file.stat().st_size))
+        else:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file, "wb") as stream:
+                stream.write(EventJournal._header())
+        self._map(capacity)
+
+        # Continue after the last complete record, overwriting a partially written one
+        empty = np.flatnonzero(self._kinds == EventJournal.EMPTY)
+        self._size = int(empty[0]) if len(empty) > 0 else len(self._records)
+        self._names: Dict[str, int] = {
+            name: index
+            for index, name in enumerate(
+                EventJournal._decode_names(self._records[: self._size])
+            )
+        }
+        self._num_trials = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __enter__(self) -> "EventJournal":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_trial(self, name: str, position: Position, timestamp: float):
+        index = self._names.get(name, None)
+        if index is None:
+            index = self._add_name(name)
+        self._append(
+            EventJournal.TRIAL,
+            EventJournal.POSITIONS.index(position),
+            self._num_trials % 2,
+            index,
+            timestamp,
+        )
+        self._num_trials += 1
+
+    def write_reaction(self, num_frames: int, reaction: Reaction, timestamp: float):
+        self._append(EventJournal.REACTION, reaction.value, 0, num_frames, timestamp)
+
+    def write_frame_timing(
+        self, num_frames: int, num_dropped: int, max_interval: float, timestamp: float
+    ):
+        self._append(
+            EventJournal.FRAME_TIMING,
+            0,
+            0,
+            num_frames,
+            timestamp,
+            num_dropped,
+            max_interval,
+        )
+
+    def flush(self):
+        self._records.flush()
+
+    def close(self):
+        if self._records is not None:
+            self._records.flush()
+            self._records = self._kinds = None
+
+    def _append(
+        self,
+        kind: int,
+        code: int,
+        phase: int,
+        index: int,
+        timestamp: float,
+        num_dropped: int = 0,
+        max_interval: float = 0.0,
+        text: bytes = b"",
+    ):
+        if self._size == len(self._records):
+            self._map(2 * len(self._records))
+        self._records[self._size] = (
+            EventJournal.EMPTY,
+            code,
+            phase,
+            index,
+            timestamp,
+            num_dropped,
+            max_interval,
+            text,
+        )
+        self._kinds[self._size] = kind
+        self._size += 1
+
+    def _add_name(self, name: str) -> int:
+        index = len(self._names)
+        encoded = name.encode()
+        chunk_size = EventJournal.RECORD_DTYPE["text"].itemsize
+        for start in range(0, max(len(encoded), 1), chunk_size):
+            self._append(
+                EventJournal.NAME,
+                0,
+                0,
+                index,
+                0.0,
+                text=encoded[start : start + chunk_size],
+            )
+        self._names[name] = index
+        return index
+
+    def _map(self, capacity: int):
+        # Growing remaps the file, which is rare, as the default capacity holds more than a session
+        size = EventJournal.HEADER_SIZE + capacity * EventJournal.RECORD_DTYPE.itemsize
+        if self.file.stat().st_size < size:
+            with open(self.file, "r+b") as stream:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(stream.fileno(), 0, size)
+                else:
+                    stream.truncate(size)
+        if self._records is not None:
+            self._records.flush()
+        self._records = np.memmap(
+            self.file,
+            dtype=EventJournal.RECORD_DTYPE,
+            mode="r+",
+            offset=EventJournal.HEADER_SIZE,
+            shape=(capacity,),
+        )
+        self._kinds = self._records["kind"]
+
+    @staticmethod
+    def load(file: Union[str, Path]) -> Session:
+        return EventJournal.merge([file])
+
+    @staticmethod
+    def merge(files: Sequence[Union[str, Path]]) -> Session:
+        # Each journal is decoded on its own, so a trial cut off by a crash does not pair with one of the next file
+        trials, reactions, frame_timings, names = [], [], [], {}
+        for file in files:
+            records = EventJournal.read(file)
+            journal_names = EventJournal._decode_names(records)
+            indices = np.array(
+                [names.setdefault(name, len(names)) for name in journal_names],
+                dtype=np.int32,
+            )
+            trials.append(EventJournal._decode_trials(records, indices))
+
+            selected = records[records["kind"] == EventJournal.REACTION]
+            journal_reactions = np.zeros(len(selected), dtype=Session.REACTION_DTYPE)
+            journal_reactions["timestamp"] = selected["timestamp"]
+            journal_reactions["num_frames"] = selected["index"]
+            journal_reactions["reaction"] = selected["code"]
+            reactions.append(journal_reactions)
+
+            selected = records[records["kind"] == EventJournal.FRAME_TIMING]
+            journal_frame_timings = np.zeros(
+                len(selected), dtype=Session.FRAME_TIMING_DTYPE
+            )
+            journal_frame_timings["timestamp"] = selected["timestamp"]
+            journal_frame_timings["num_frames"] = selected["index"]
+            journal_frame_timings["num_dropped"] = selected["num_dropped"]
+            journal_frame_timings["max_interval"] = selected["max_interval"]
+            frame_timings.append(journal_frame_timings)
+
+        return Session(
+            trials=EventJournal._sorted(trials, Session.TRIAL_DTYPE, "onset"),
+            reactions=EventJournal._sorted(
+                reactions, Session.REACTION_DTYPE, "timestamp"
+            ),
+            names=np.array(list(names), dtype=np.str_),
+            frame_timings=EventJournal._sorted(
+                frame_timings, Session.FRAME_TIMING_DTYPE, "timestamp"
+            ),
+        )
+
+    @staticmethod
+    def read(file: Union[str, Path]) -> np.ndarray:
+        # All complete records, up to the first empty one
+        file = file if isinstance(file, Path) else Path(file)
+        EventJournal._check_header(file)
+        records = np.memmap(
+            file,
+            dtype=EventJournal.RECORD_DTYPE,
+            mode="r",
+            offset=EventJournal.HEADER_SIZE,
+            shape=(EventJournal._capacity(file.stat().st_size),),
+        )
+        empty = np.flatnonzero(records["kind"] == EventJournal.EMPTY)
+        return np.array(records[: empty[0] if len(empty) > 0 else len(records)])
+
+    @staticmethod
+    def _decode_names(records: np.ndarray) -> List[str]:
+        selected = records[records["kind"] == EventJournal.NAME]
+        chunks: Dict[int, List[bytes]] = {}
+        for index, text in zip(selected["index"].tolist(), selected["text"].tolist()):
+            chunks.setdefault(index, []).append(text)
+        return [b"".join(chunks[index]).decode() for index in sorted(chunks)]
+
+    @staticmethod
+    def _decode_trials(records: np.ndarray, names: np.ndarray) -> np.ndarray:
+        selected = records[records["kind"] == EventJournal.TRIAL]
+        starts = np.flatnonzero(selected["phase"] == 0)
+        trials = np.zeros(len(starts), dtype=Session.TRIAL_DTYPE)
+        trials["onset"] = selected["timestamp"][starts]
+        trials["name"] = names[selected["index"][starts]]
+        trials["position"] = selected["code"][starts]
+
+        # A start followed by another start belongs to a session which ended without finishing its trial
+        ends = np.append(starts[1:], len(selected))
+        finished = (starts + 1 < ends) & (
+            selected["phase"][np.minimum(starts + 1, len(selected) - 1)] == 1
+        )
+        trials["offset"] = np.where(
+            finished,
+            selected["timestamp"][np.minimum(starts + 1, len(selected) - 1)],
+            np.nan,
+        )
+        return trials
+
+    @staticmethod
+    def _sorted(parts: List[np.ndarray], dtype: np.dtype, key: str) -> np.ndarray:
+        merged = np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+        return merged[np.argsort(merged[key], kind="stable")]
+
+    @staticmethod
+    def _header() -> bytes:
+        header = (
+            EventJournal.MAGIC
+            + np.array(
+                [EventJournal.VERSION, EventJournal.RECORD_DTYPE.itemsize], dtype="<u4"
+            ).tobytes()
+        )
+        return header.ljust(EventJournal.HEADER_SIZE, b"\0")
+
+    @staticmethod
+    def _check_header(file: Path):
+        with open(file, "rb") as stream:
+            header = stream.read(EventJournal.HEADER_SIZE)
+        if not header.startswith(EventJournal.MAGIC):
+            raise ValueError(f"'{file}' is not an event journal.")
+        version, record_size = np.frombuffer(
+            header, dtype="<u4", count=2, offset=len(EventJournal.MAGIC)
+        )
+        if (
+            version != EventJournal.VERSION
+            or record_size != EventJournal.RECORD_DTYPE.itemsize
+        ):
+            raise ValueError(
+                f"Unsupported version {version} of the event journal '{file}'."
+            )
+
+    @staticmethod
+    def _capacity(file_size: int) -> int:
+        return (
+            file_size - EventJournal.HEADER_SIZE
+        ) // EventJournal.RECORD_DTYPE.itemsize
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d merge-journals")
+    parser.add_argument(
+        "journals", type=str, nargs="+", help="The event journals of the sessions."
+    )
+    parser.add_argument(
+        "-output",
+        type=str,
+        help="The merged session as '.npz' or '.parquet'.",
+        required=True,
+    )
+    arguments = parser.parse_args(arguments)
+
+    session = EventJournal.merge(arguments.journals)
+    session.save(arguments.output)
+    print(
+        f"Merged {len(session.trials)} trials and {len(session.reactions)} reactions into '{arguments.output}'.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
+import threading
+import time
 from dataclasses import dataclass
-from typing import Union, Iterable, Tuple
+from pathlib import Path
+from typing import Union, Iterable, Tuple, List, Optional, Sequence, Dict
 
 import numpy as np
-import pylsl
-from pyxdf import load_xdf
 
+from bid2d.journal import EventJournal
 from bid2d.reaction import Position, Reaction
+from bid2d.session import Session
+from bid2d.util.ring_buffer import RingBuffer
+from bid2d.xdf import XdfReader, XdfStream
 
 
 class Logger:
     TRIAL_STREAM_NAME = "AffectiveSimonTask2d_Trial"
     REACTION_STREAM_NAME = "AffectiveSimonTask2d_Reaction"
+    FRAME_TIMING_STREAM_NAME = "AffectiveSimonTask2d_FrameTiming"
+    TOUCH_STREAM_NAME = "AffectiveSimonTask2d_Touch"
 
     @dataclass
     class Trial:
@@ -24,21 +31,87 @@ class Logger:
         reaction: Reaction
         timestamp: float = 0.0
 
-    def __init__(self):
-        self._stream_trial = pylsl.stream_outlet(
-            pylsl.stream_info(
-                Logger.TRIAL_STREAM_NAME,
-                channel_format=pylsl.cf_string,
-                channel_count=2,
-            )
+    @dataclass
+    class FrameTiming:
+        num_frames: int
+        num_dropped: int
+        max_interval: float
+        timestamp: float = 0.0
+
+    @dataclass
+    class Touch:
+        # The first object of a trial the avatar touched. Index 0 is the stimulus, the distractors follow.
+        name: str
+        index: int
+        timestamp: float = 0.0
+
+    def __init__(
+        self,
+        frame_timing: bool = False,
+        touches: bool = False,
+        journal: Optional[Union[str, Path]] = None,
+        trial_names: Optional[Sequence[str]] = None,
+    ):
+        # Decoding recordings does not require the Lab Streaming Layer library. Only load it for the outlets.
+        import pylsl
+
+        self._local_clock = pylsl.local_clock
+        self._journal = EventJournal(journal) if journal is not None else None
+
+        # Given the names of all trials, the trials are streamed as indices into them and into the positions. Both
+        # lists are part of the stream description, so the recording is decoded without comparing strings.
+        self._trial_codes: Optional[Dict[str, int]] = (
+            {name: index for index, name in enumerate(dict.fromkeys(trial_names))}
+            if trial_names is not None
+            else None
         )
-        self._stream_reaction = pylsl.stream_outlet(
-            pylsl.stream_info(
+        self._position_codes = {
+            position: index for index, position in enumerate(Session.POSITIONS)
+        }
+        trial_info = pylsl.StreamInfo(
+            Logger.TRIAL_STREAM_NAME,
+            channel_format=(
+                pylsl.cf_int32 if self._trial_codes is not None else pylsl.cf_string
+            ),
+            channel_count=2,
+        )
+        if self._trial_codes is not None:
+            names = trial_info.desc().append_child("names")
+            for name in self._trial_codes:
+                names.append_child_value("name", name)
+            positions = trial_info.desc().append_child("positions")
+            for position in Session.POSITIONS:
+                positions.append_child_value("position", position.value)
+        self._stream_trial = pylsl.StreamOutlet(trial_info)
+        self._stream_reaction = pylsl.StreamOutlet(
+            pylsl.StreamInfo(
                 Logger.REACTION_STREAM_NAME,
                 channel_format=pylsl.cf_int32,
                 channel_count=2,
             )
         )
+        self._stream_frame_timing = (
+            pylsl.StreamOutlet(
+                pylsl.StreamInfo(
+                    Logger.FRAME_TIMING_STREAM_NAME,
+                    channel_format=pylsl.cf_double64,
+                    channel_count=3,
+                )
+            )
+            if frame_timing
+            else None
+        )
+        self._stream_touch = (
+            pylsl.StreamOutlet(
+                pylsl.StreamInfo(
+                    Logger.TOUCH_STREAM_NAME,
+                    channel_format=pylsl.cf_string,
+                    channel_count=2,
+                )
+            )
+            if touches
+            else None
+        )
 
     def __bool__(self):
         return (
@@ -46,37 +119,303 @@ class Logger:
             and self._stream_trial.have_consumers()
         )
 
-    def push(self, event: Union["Trial", "Reaction"]):
+    def push(self, event: Union["Trial", "Reaction", "FrameTiming", "Touch"]):
+        # A timestamp of zero is replaced by the current time of the LSL clock. The journal needs it explicitly.
+        # The event is not kept, so the caller may reuse it.
+        timestamp = event.timestamp
+        if self._journal is not None:
+            timestamp = timestamp if timestamp > 0.0 else self._local_clock()
+            self._write_journal(event, timestamp)
+
         if isinstance(event, Logger.Trial):
-            self._stream_trial.push_sample((event.name, event.position.value))
+            self._stream_trial.push_sample(self._encode_trial(event), timestamp)
         elif isinstance(event, Logger.Reaction):
             self._stream_reaction.push_sample(
-                (event.num_frames, int(event.reaction.value))
+                (event.num_frames, int(event.reaction.value)), timestamp
             )
+        elif isinstance(event, Logger.FrameTiming):
+            if self._stream_frame_timing is not None:
+                self._stream_frame_timing.push_sample(
+                    (event.num_frames, event.num_dropped, event.max_interval),
+                    timestamp,
+                )
+        elif isinstance(event, Logger.Touch):
+            if self._stream_touch is not None:
+                self._stream_touch.push_sample(
+                    (event.name, str(event.index)), timestamp
+                )
         else:
             raise NotImplementedError("Unknown event!")
 
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+
+    def _encode_trial(self, event: "Trial") -> List[Union[str, int]]:
+        if self._trial_codes is None:
+            return [event.name, event.position.value]
+        return [self._trial_codes[event.name], self._position_codes[event.position]]
+
+    def _write_journal(
+        self,
+        event: Union["Trial", "Reaction", "FrameTiming", "Touch"],
+        timestamp: float,
+    ):
+        # Touches are not part of a session, so they are only streamed
+        if isinstance(event, Logger.Trial):
+            self._journal.write_trial(event.name, event.position, timestamp)
+        elif isinstance(event, Logger.Reaction):
+            self._journal.write_reaction(event.num_frames, event.reaction, timestamp)
+        elif isinstance(event, Logger.FrameTiming):
+            self._journal.write_frame_timing(
+                event.num_frames, event.num_dropped, event.max_interval, timestamp
+            )
+
+    @staticmethod
+    def load(file: str) -> Tuple[List["Trial"], List["Reaction"]]:
+        streams = XdfReader(file).load(
+            (Logger.TRIAL_STREAM_NAME, Logger.REACTION_STREAM_NAME)
+        )
+        return (
+            list(Logger._decode_trials(streams.get(Logger.TRIAL_STREAM_NAME, None))),
+            list(
+                Logger._decode_reactions(streams.get(Logger.REACTION_STREAM_NAME, None))
+            ),
+        )
+
+    @staticmethod
+    def load_session(file: str) -> Session:
+        streams = XdfReader(file).load(
+            (
+                Logger.TRIAL_STREAM_NAME,
+                Logger.REACTION_STREAM_NAME,
+                Logger.FRAME_TIMING_STREAM_NAME,
+            )
+        )
+        return Session.from_streams(
+            streams.get(Logger.TRIAL_STREAM_NAME, None),
+            streams.get(Logger.REACTION_STREAM_NAME, None),
+            streams.get(Logger.FRAME_TIMING_STREAM_NAME, None),
+        )
+
     @staticmethod
     def load_trials(file: str) -> Iterable["Trial"]:
-        for timestamp, sample in Logger._load_stream(file, Logger.TRIAL_STREAM_NAME):
-            yield Logger.Trial(name=sample[0], position=sample[1], timestamp=timestamp)
+        stream = XdfReader(file).load((Logger.TRIAL_STREAM_NAME,))
+        yield from Logger._decode_trials(stream.get(Logger.TRIAL_STREAM_NAME, None))
 
     @staticmethod
     def load_reactions(file: str) -> Iterable["Reaction"]:
-        for timestamp, sample in Logger._load_stream(file, Logger.REACTION_STREAM_NAME):
-            yield Logger.Reaction(
-                num_frames=sample[0], reaction=Reaction(sample[1]), timestamp=timestamp,
-            )
+        stream = XdfReader(file).load((Logger.REACTION_STREAM_NAME,))
+        yield from Logger._decode_reactions(
+            stream.get(Logger.REACTION_STREAM_NAME, None)
+        )
 
     @staticmethod
-    def _load_stream(file: str, stream_name: str) -> Iterable[Tuple[float, np.ndarray]]:
-        data, _meta = load_xdf(file)
-        stream = next(
-            (stream for stream in data if stream["info"]["name"] == [stream_name]), None
+    def load_frame_timings(file: str) -> Iterable["FrameTiming"]:
+        stream = (
+            XdfReader(file)
+            .load((Logger.FRAME_TIMING_STREAM_NAME,))
+            .get(Logger.FRAME_TIMING_STREAM_NAME, None)
         )
         if stream is not None:
-            for timestamp, sample in zip(stream["time_stamps"], stream["time_series"]):
-                yield timestamp, sample
+            for timestamp, sample in zip(stream.time_stamps, stream.time_series):
+                yield Logger.FrameTiming(
+                    num_frames=int(sample[0]),
+                    num_dropped=int(sample[1]),
+                    max_interval=sample[2],
+                    timestamp=timestamp,
+                )
+
+    @staticmethod
+    def load_touches(file: str) -> Iterable["Touch"]:
+        stream = (
+            XdfReader(file)
+            .load((Logger.TOUCH_STREAM_NAME,))
+            .get(Logger.TOUCH_STREAM_NAME, None)
+        )
+        if stream is not None:
+            for timestamp, sample in zip(stream.time_stamps, stream.time_series):
+                yield Logger.Touch(
+                    name=sample[0], index=int(sample[1]), timestamp=timestamp
+                )
+
+    @staticmethod
+    def _decode_trials(stream: XdfStream) -> Iterable["Trial"]:
+        if stream is None:
+            return
+
+        if stream.dtype is not None:
+            # Look the indices of a compact stream up in its dictionary at once
+            names, positions = Session.trial_dictionary(stream)
+            samples = np.asarray(stream.time_series, dtype=np.int64).reshape(-1, 2)
+            trial_names = names[samples[:, 0]].tolist()
+            trial_positions = [
+                Session.POSITIONS[code] for code in positions[samples[:, 1]]
+            ]
+        else:
+            trial_names = [sample[0] for sample in stream.time_series]
+            trial_positions = [Position(sample[1]) for sample in stream.time_series]
+
+        for timestamp, name, position in zip(
+            stream.time_stamps.tolist(), trial_names, trial_positions
+        ):
+            yield Logger.Trial(name=name, position=position, timestamp=timestamp)
+
+    @staticmethod
+    def _decode_reactions(stream: XdfStream) -> Iterable["Reaction"]:
+        if stream is not None:
+            for timestamp, sample in zip(stream.time_stamps, stream.time_series):
+                yield Logger.Reaction(
+                    num_frames=sample[0],
+                    reaction=Reaction(sample[1]),
+                    timestamp=timestamp,
+                )
+
+
+class BackgroundLogger(Logger):
+    @dataclass
+    class Statistics:
+        queue_depth: int
+        max_queue_depth: int
+        dropped: int
+        # The duration of 'push' on the calling thread
+        num_pushes: int
+        mean_push_time: float
+        max_push_time: float
+        # The time the oldest record of each chunk waited in the queue until the worker sent it, regardless of the
+        # timestamp of its event
+        num_chunks: int
+        mean_queue_age: float
+        max_queue_age: float
+
+    def __init__(
+        self,
+        capacity: int = 4096,
+        poll_interval: float = 0.1,
+        frame_timing: bool = False,
+        touches: bool = False,
+        journal: Optional[Union[str, Path]] = None,
+        trial_names: Optional[Sequence[str]] = None,
+    ):
+        super().__init__(
+            frame_timing=frame_timing,
+            touches=touches,
+            journal=journal,
+            trial_names=trial_names,
+        )
+        self._trials = RingBuffer(
+            capacity,
+            channel_count=2,
+            dtype=np.int32 if self._trial_codes is not None else None,
+        )
+        self._reactions = RingBuffer(capacity, channel_count=2, dtype=np.int32)
+        self._frame_timings = RingBuffer(capacity, channel_count=3, dtype=np.float64)
+        self._touches = RingBuffer(capacity, channel_count=2)
+        self._buffers = [
+            (self._stream_trial, self._trials),
+            (self._stream_reaction, self._reactions),
+        ]
+        if self._stream_frame_timing is not None:
+            self._buffers.append((self._stream_frame_timing, self._frame_timings))
+        if self._stream_touch is not None:
+            self._buffers.append((self._stream_touch, self._touches))
+
+        self._num_pushes = 0
+        self._total_push_time = 0.0
+        self._max_push_time = 0.0
+        self._num_chunks = 0
+        self._total_queue_age = 0.0
+        self._max_queue_age = 0.0
+
+        self._poll_interval = poll_interval
+        self._pending = threading.Event()
+        self._running = True
+        self._worker = threading.Thread(
+            target=self._drain, name="BackgroundLogger", daemon=True
+        )
+        self._worker.start()
+
+    def __enter__(self) -> "BackgroundLogger":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def push(self, event: Union["Trial", "Reaction", "FrameTiming", "Touch"]):
+        # Only record the event on the calling (render) thread. The worker sends it with its original timestamp.
+        # The age in the queue is measured from now, as the timestamp of the event may be earlier, i.e. a key press.
+        start = time.perf_counter()
+        now = self._local_clock()
+        timestamp = event.timestamp if event.timestamp > 0.0 else now
+        if self._journal is not None:
+            self._write_journal(event, timestamp)
+
+        if isinstance(event, Logger.Trial):
+            self._trials.put(self._encode_trial(event), timestamp, now)
+        elif isinstance(event, Logger.Reaction):
+            self._reactions.put(
+                (event.num_frames, event.reaction.value), timestamp, now
+            )
+        elif isinstance(event, Logger.FrameTiming):
+            if self._stream_frame_timing is not None:
+                self._frame_timings.put(
+                    (event.num_frames, event.num_dropped, event.max_interval),
+                    timestamp,
+                    now,
+                )
+        elif isinstance(event, Logger.Touch):
+            if self._stream_touch is not None:
+                self._touches.put([event.name, str(event.index)], timestamp, now)
+        else:
+            raise NotImplementedError("Unknown event!")
+        self._pending.set()
+
+        duration = time.perf_counter() - start
+        self._num_pushes += 1
+        self._total_push_time += duration
+        if duration > self._max_push_time:
+            self._max_push_time = duration
+
+    def close(self):
+        if self._running:
+            self._running = False
+            self._pending.set()
+            self._worker.join()
+        super().close()
+
+    @property
+    def statistics(self) -> "BackgroundLogger.Statistics":
+        return BackgroundLogger.Statistics(
+            queue_depth=sum(len(buffer) for _, buffer in self._buffers),
+            max_queue_depth=max(buffer.max_depth for _, buffer in self._buffers),
+            dropped=sum(buffer.dropped for _, buffer in self._buffers),
+            num_pushes=self._num_pushes,
+            mean_push_time=self._total_push_time / max(self._num_pushes, 1),
+            max_push_time=self._max_push_time,
+            num_chunks=self._num_chunks,
+            mean_queue_age=self._total_queue_age / max(self._num_chunks, 1),
+            max_queue_age=self._max_queue_age,
+        )
+
+    def _drain(self):
+        running = True
+        while running:
+            self._pending.wait(self._poll_interval)
+            self._pending.clear()
+            running = self._running
+
+            for outlet, buffer in self._buffers:
+                while len(buffer) > 0:
+                    samples, timestamps = buffer.peek()
+                    outlet.push_chunk(samples, timestamps.tolist())
+
+                    # The age is measured for the oldest record of the chunk
+                    age = self._local_clock() - buffer.oldest_enqueued()
+                    self._num_chunks += 1
+                    self._total_queue_age += age
+                    self._max_queue_age = max(self._max_queue_age, age)
+
+                    buffer.release(len(timestamps))
 
 
 if __name__ == "__main__":
@@ -84,7 +423,13 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser("LoggerDecoder")
     parser.add_argument("file")
+    parser.add_argument(
+        "-export", type=str, help="Export the session as '.npy', '.npz' or '.parquet'."
+    )
 
     args = parser.parse_args()
-    for reaction in Logger.load_reactions(args.file):
-        print(reaction)
+    if args.export is not None:
+        Logger.load_session(args.file).save(args.export)
+    else:
+        for reaction in Logger.load_reactions(args.file):
+            print(reaction)
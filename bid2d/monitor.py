@@ -0,0 +1,410 @@
+import argparse
+import math
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Sequence, TextIO, Tuple
+from xml.etree import ElementTree
+
+from bid2d.logger import Logger
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+from bid2d.stimulus import Stimulus
+from bid2d.util.streaming_statistics import P2Quantile, RunningStatistics
+from bid2d.xdf import XdfStream
+
+
+class ConditionStatistics:
+    # The accuracy of the first reactions to a condition and the distribution of the reaction times of the correct
+    # ones, in constant memory
+    QUANTILES = (0.1, 0.5, 0.9)
+
+    def __init__(self):
+        self.num_responses = 0
+        self.num_correct = 0
+        self.rt = RunningStatistics()
+        self.quantiles = [P2Quantile(p) for p in ConditionStatistics.QUANTILES]
+
+    def add(self, rt: float, correct: bool):
+        self.num_responses += 1
+        if correct:
+            self.num_correct += 1
+            self.rt.add(rt)
+            for quantile in self.quantiles:
+                quantile.add(rt)
+
+    @property
+    def accuracy(self) -> float:
+        return (
+            self.num_correct / self.num_responses
+            if self.num_responses > 0
+            else math.nan
+        )
+
+
+class StationMonitor:
+    # Pairs the first reaction of each trial of one station with the trial and aggregates the responses per
+    # condition, i.e. whether the stimulus should be approached (if known) and its position.
+    #
+    # Trials and reactions arrive on separate streams and in chunks, so a reaction is only assigned once the end of
+    # the trial it falls into is known. The first reaction of a trial is the only validated one. Just the recent
+    # trials and a bounded number of unassigned reactions are kept.
+    #
+    # The start and the end of a trial are the same marker, so a marker ends the open trial if it matches it and
+    # starts a new one otherwise. A trial whose end was not received is discarded once the next trial starts, i.e.
+    # when joining during a trial or if a marker was dropped. Only the end of a trial followed by one of the same
+    # stimulus and position cannot be told from a start, so a dropped marker is then noticed one trial later.
+    MAX_RECENT = 16
+    MAX_PENDING = 64
+
+    def __init__(self, should_approach: Optional[Dict[str, bool]] = None):
+        self.should_approach = should_approach if should_approach is not None else {}
+        self.conditions: Dict[Tuple[Optional[bool], Position], ConditionStatistics] = {}
+        self.num_trials = 0
+        self.num_unassigned = 0
+        # The trials without an end and the markers out of order
+        self.num_incomplete = 0
+        self.num_ignored = 0
+
+        # The finished trials as [onset, offset, name, position, answered]
+        self._open: Optional[Tuple[float, str, Position]] = None
+        self._last_marker = -math.inf
+        self._recent: Deque[list] = deque(maxlen=StationMonitor.MAX_RECENT)
+        self._pending: Deque[Tuple[float, bool]] = deque(
+            maxlen=StationMonitor.MAX_PENDING
+        )
+
+    def add_trial(self, timestamp: float, name: str, position: Position):
+        # A marker before the previous one can neither end the open trial nor start a new one
+        if timestamp < self._last_marker:
+            self.num_ignored += 1
+            return
+        self._last_marker = timestamp
+
+        if self._open is None or self._open[1:] != (name, position):
+            if self._open is not None:
+                self.num_incomplete += 1
+            self._open = (timestamp, name, position)
+            return
+
+        trial = [self._open[0], timestamp, name, position, False]
+        self._open = None
+        self._recent.append(trial)
+        self.num_trials += 1
+
+        # The pending reactions happened after the previous trials
+        while self._pending and self._pending[0][0] <= timestamp:
+            reaction_timestamp, correct = self._pending.popleft()
+            if reaction_timestamp >= trial[0] and not trial[4]:
+                self._answer(trial, reaction_timestamp, correct)
+            else:
+                self.num_unassigned += 1
+
+    def add_reaction(self, timestamp: float, reaction: Reaction):
+        if reaction not in (Reaction.CorrectReaction, Reaction.IncorrectReaction):
+            return
+
+        correct = reaction == Reaction.CorrectReaction
+        if not self._recent or timestamp > self._recent[-1][1]:
+            if len(self._pending) == self._pending.maxlen:
+                self.num_unassigned += 1
+            self._pending.append((timestamp, correct))
+            return
+
+        for trial in reversed(self._recent):
+            if trial[0] <= timestamp <= trial[1] and not trial[4]:
+                self._answer(trial, timestamp, correct)
+                return
+        self.num_unassigned += 1
+
+    def total(self) -> ConditionStatistics:
+        total = ConditionStatistics()
+        for condition in self.conditions.values():
+            total.num_responses += condition.num_responses
+            total.num_correct += condition.num_correct
+            total.rt = total.rt.merge(condition.rt)
+        return total
+
+    def congruency_effect(self) -> Tuple[float, float]:
+        # The mean reaction time of correct avoid trials minus the one of correct approach trials, and its
+        # standard error
+        approach, avoid = RunningStatistics(), RunningStatistics()
+        for (should_approach, _), condition in self.conditions.items():
+            if should_approach is True:
+                approach = approach.merge(condition.rt)
+            elif should_approach is False:
+                avoid = avoid.merge(condition.rt)
+        if approach.count < 2 or avoid.count < 2:
+            return math.nan, math.nan
+        return avoid.mean - approach.mean, math.sqrt(
+            approach.variance / approach.count + avoid.variance / avoid.count
+        )
+
+    def report(self, station: str) -> List[str]:
+        total = self.total()
+        effect, error = self.congruency_effect()
+        lines = [
+            f"{station}: {self.num_trials} trials{self._marker_warning()}, "
+            f"{total.num_responses} responses, "
+            f"accuracy {StationMonitor._percent(total.accuracy)}"
+            f"{StationMonitor._chance_warning(total)}, congruency effect "
+            f"{StationMonitor._milliseconds(effect, sign=True)} "
+            f"± {StationMonitor._milliseconds(error)} ms",
+            f"  {'condition':<16}{'n':>6}{'accuracy':>10}{'mean':>8}{'sd':>8}"
+            + "".join(
+                f"{f'p{round(100 * p)}':>8}" for p in ConditionStatistics.QUANTILES
+            ),
+        ]
+        for (should_approach, position), condition in sorted(
+            self.conditions.items(),
+            key=lambda item: (str(item[0][0]), item[0][1].value),
+        ):
+            label = {True: "approach", False: "avoid", None: "any"}[
+                should_approach
+            ] + f" {position.value}"
+            lines.append(
+                f"  {label:<16}{condition.num_responses:>6}"
+                f"{StationMonitor._percent(condition.accuracy):>10}"
+                f"{StationMonitor._milliseconds(condition.rt.mean):>8}"
+                f"{StationMonitor._milliseconds(condition.rt.sd):>8}"
+                + "".join(
+                    f"{StationMonitor._milliseconds(quantile.value):>8}"
+                    for quantile in condition.quantiles
+                )
+            )
+        return lines
+
+    def _answer(self, trial: list, timestamp: float, correct: bool):
+        onset, _, name, position, _ = trial
+        trial[4] = True
+        key = (self.should_approach.get(name, None), position)
+        condition = self.conditions.get(key, None)
+        if condition is None:
+            condition = self.conditions[key] = ConditionStatistics()
+        condition.add(timestamp - onset, correct)
+
+    def _marker_warning(self) -> str:
+        # The trials lost to dropped markers
+        problems = [
+            f"{count} {label}"
+            for count, label in (
+                (self.num_incomplete, "incomplete"),
+                (self.num_ignored, "markers out of order"),
+            )
+            if count > 0
+        ]
+        return f" ({', '.join(problems)})" if problems else ""
+
+    @staticmethod
+    def _chance_warning(statistics: ConditionStatistics) -> str:
+        # Binomial test against guessing, i.e. to notice a participant pressing randomly or an inverted mapping
+        n = statistics.num_responses
+        if n < 20:
+            return ""
+        z = (statistics.num_correct - n / 2) / math.sqrt(n / 4)
+        if z < -2.0:
+            return " (below chance, inverted mapping?)"
+        elif z < 2.0:
+            return " (chance level)"
+        return ""
+
+    @staticmethod
+    def _percent(value: float) -> str:
+        return "-" if math.isnan(value) else f"{100 * value:.1f}%"
+
+    @staticmethod
+    def _milliseconds(value: float, sign: bool = False) -> str:
+        if math.isnan(value):
+            return "-"
+        return f"{1000 * value:+.0f}" if sign else f"{1000 * value:.0f}"
+
+
+class Monitor:
+    # Follows the trial and reaction streams of all stations in the network, one station per host. Stations are
+    # picked up and dropped while running. The inlets are drained without blocking and the cost per sample is
+    # constant, while the display is only redrawn at the refresh interval, so the monitor keeps up with the streams.
+    RESOLVE_INTERVAL = 2.0
+    POLL_INTERVAL = 0.02
+    CHUNK_SIZE = 1024
+
+    def __init__(
+        self,
+        should_approach: Optional[Dict[str, bool]] = None,
+        refresh_interval: float = 1.0,
+    ):
+        # Only the monitor itself requires the Lab Streaming Layer library
+        import pylsl
+
+        self._pylsl = pylsl
+        self.should_approach = should_approach
+        self.refresh_interval = refresh_interval
+        self.stations: Dict[str, StationMonitor] = {}
+
+        self._resolvers = {
+            name: pylsl.ContinuousResolver(prop="name", value=name)
+            for name in (Logger.TRIAL_STREAM_NAME, Logger.REACTION_STREAM_NAME)
+        }
+        self._inlets: Dict[str, Tuple["pylsl.StreamInlet", Optional[Callable]]] = {}
+        # The stations of the compact trial streams whose dictionary did not arrive yet
+        self._undescribed: Dict[str, StationMonitor] = {}
+
+    def resolve(self):
+        available = {}
+        for name, resolver in self._resolvers.items():
+            for info in resolver.results():
+                available[info.uid()] = (name, info)
+
+        for uid in list(self._inlets):
+            if uid not in available:
+                self._inlets.pop(uid)[0].close_stream()
+                self._undescribed.pop(uid, None)
+        for uid, (name, info) in available.items():
+            if uid not in self._inlets:
+                self._inlets[uid] = self._open(uid, name, info)
+
+        # The reactions are drained first. They wait for the end of their trial, while a trial only waits for a
+        # limited time for its reaction.
+        self._inlets = dict(
+            sorted(
+                self._inlets.items(),
+                key=lambda item: available[item[0]][0] != Logger.REACTION_STREAM_NAME,
+            )
+        )
+
+    def update(self) -> int:
+        for uid, station in list(self._undescribed.items()):
+            inlet = self._inlets[uid][0]
+            handle = self._describe(inlet, station)
+            if handle is not None:
+                self._inlets[uid] = (inlet, handle)
+                del self._undescribed[uid]
+
+        num_samples = 0
+        for inlet, handle in self._inlets.values():
+            # The samples of a trial stream stay buffered in its inlet until its dictionary arrived
+            if handle is None:
+                continue
+            samples, timestamps = inlet.pull_chunk(
+                timeout=0.0, max_samples=Monitor.CHUNK_SIZE
+            )
+            for sample, timestamp in zip(samples, timestamps):
+                handle(sample, timestamp)
+            num_samples += len(timestamps)
+        return num_samples
+
+    def render(self) -> str:
+        if not self.stations:
+            return "Waiting for stations..."
+        lines = []
+        for station in sorted(self.stations):
+            lines.extend(self.stations[station].report(station))
+            lines.append("")
+        return "\n".join(lines)
+
+    def run(self, output: TextIO = sys.stdout, duration: Optional[float] = None):
+        start = time.monotonic()
+        next_resolve = next_refresh = start
+        clear = "\x1b[H\x1b[J" if output.isatty() else ""
+        while duration is None or time.monotonic() - start < duration:
+            now = time.monotonic()
+            if now >= next_resolve:
+                self.resolve()
+                next_resolve = now + Monitor.RESOLVE_INTERVAL
+            num_samples = self.update()
+            if now >= next_refresh:
+                output.write(clear + self.render() + "\n")
+                output.flush()
+                next_refresh = now + self.refresh_interval
+            if num_samples == 0:
+                time.sleep(Monitor.POLL_INTERVAL)
+
+    def _open(
+        self, uid: str, name: str, info
+    ) -> Tuple["pylsl.StreamInlet", Optional[Callable]]:
+        station_name = info.hostname()
+        station = self.stations.get(station_name, None)
+        if station is None:
+            station = self.stations[station_name] = StationMonitor(self.should_approach)
+        inlet = self._pylsl.StreamInlet(info)
+
+        if name == Logger.REACTION_STREAM_NAME:
+            return inlet, lambda sample, timestamp: station.add_reaction(
+                timestamp, Reaction(sample[1])
+            )
+
+        if info.channel_format() == self._pylsl.cf_string:
+            return inlet, lambda sample, timestamp: station.add_trial(
+                timestamp, sample[0], Position(sample[1])
+            )
+
+        # The dictionary of a compact trial stream is only part of the full description. It is requested once and
+        # polled without blocking, so a slow station does not stall the others.
+        handle = self._describe(inlet, station)
+        if handle is None:
+            self._undescribed[uid] = station
+        return inlet, handle
+
+    def _describe(
+        self, inlet: "pylsl.StreamInlet", station: StationMonitor
+    ) -> Optional[Callable]:
+        try:
+            info = inlet.info(timeout=0.0)
+        except RuntimeError:
+            # The timeout error of pylsl is a RuntimeError, and lost streams are dropped by the next resolve
+            return None
+        names, positions = Session.trial_dictionary(
+            XdfStream(0, ElementTree.fromstring(info.as_xml()))
+        )
+        names = names.tolist()
+        positions = [Session.POSITIONS[code] for code in positions.tolist()]
+        return lambda sample, timestamp: station.add_trial(
+            timestamp, names[sample[0]], positions[sample[1]]
+        )
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d monitor")
+    parser.add_argument(
+        "-samples",
+        type=str,
+        help="The CSV file with the samples of the sessions. Without it, the conditions are only told apart by "
+        "the position and no congruency effect is shown.",
+        default=None,
+    )
+    parser.add_argument(
+        "-refresh_interval",
+        type=float,
+        help="The interval in seconds between two updates of the display.",
+        default=1.0,
+    )
+    parser.add_argument(
+        "--invert_should_approach",
+        dest="invert_should_approach",
+        action="store_true",
+        help="Invert the given value of 'should_approach', as for the sessions.",
+        default=False,
+    )
+    arguments = parser.parse_args(arguments)
+
+    # The images are not required for monitoring, so the samples are not validated
+    should_approach = None
+    if arguments.samples is not None:
+        should_approach = {
+            sample.get(Stimulus.NAME, sample[Stimulus.IMAGE_PATH].stem): sample[
+                Stimulus.SHOULD_APPROACH
+            ]
+            != arguments.invert_should_approach
+            for sample in Stimulus.parse_csv(Path(arguments.samples))
+        }
+
+    monitor = Monitor(should_approach, refresh_interval=arguments.refresh_interval)
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        print(monitor.render())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from enum import Enum
-from typing import Tuple
+from typing import Tuple, TYPE_CHECKING
 
-from psychopy import visual
+# Positions are required for decoding recordings, which must not depend on the graphics stack
+if TYPE_CHECKING:
+    from psychopy import visual
 
 
 class Position(Enum):
@@ -9,7 +11,7 @@ class Position(Enum):
     Below = "below"
 
     def calculate_avatar_position(
-        self, stimulus: visual.ImageStim
+        self, stimulus: "visual.ImageStim"
     ) -> Tuple[float, float]:
         stim_y = stimulus.pos[1]
         stim_height = stimulus.size[1]
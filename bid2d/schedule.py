@@ -0,0 +1,474 @@
+import argparse
+import json
+import random
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from bid2d.assets import AssetCache
+from bid2d.session import Session
+from bid2d.stimulus import Stimulus
+from bid2d.trial import TrialTable
+from bid2d.util.collision import BoundingBoxes
+from bid2d.util.constrained_shuffle import SequenceConstraints
+from bid2d.util.fixation_point import FixationPoint
+
+
+@dataclass
+class Schedule:
+    MAGIC = b"BID2DSCH"
+    VERSION = 2
+
+    # One row per trial: The stimulus is an index into 'stimuli', the position an index into 'POSITIONS'. The
+    # fixation is given in whole frames and the avatar starts at (0, avatar_y) in normalized units.
+    TRIAL_DTYPE = np.dtype(
+        [
+            ("stimulus", "<i4"),
+            ("position", "i1"),
+            ("fixation_frames", "<i4"),
+            ("avatar_y", "<f8"),
+        ]
+    )
+    POSITIONS = Session.POSITIONS
+    MAX_PLACEMENT_ATTEMPTS = 1000
+
+    trials: np.ndarray
+    stimuli: List[str]
+    seed: int
+    frame_period: float
+    window_size: Tuple[int, int]
+    stimulus_size: float
+    avatar_size: float
+    fixation_jitter: Tuple[float, float]
+    num_distractors: int = 0
+    distractor_size: float = 0.25
+
+    @staticmethod
+    def trial_dtype(num_distractors: int) -> np.dtype:
+        # The distractors are indices into 'stimuli' with the centers of their images in normalized units. Touching
+        # a distractor to approach ends the trial like touching the stimulus to approach.
+        if num_distractors == 0:
+            return Schedule.TRIAL_DTYPE
+        return np.dtype(
+            Schedule.TRIAL_DTYPE.descr
+            + [
+                ("distractors", "<i4", (num_distractors,)),
+                ("distractor_x", "<f8", (num_distractors,)),
+                ("distractor_y", "<f8", (num_distractors,)),
+                ("distractor_approach", "?", (num_distractors,)),
+            ]
+        )
+
+    @staticmethod
+    def factors(stimuli: Sequence[Stimulus]) -> List[str]:
+        # The factors the trial order of a schedule may be constrained by
+        return TrialTable.factors(stimuli, ("position",))
+
+    @staticmethod
+    def compile(
+        stimuli: Sequence[Stimulus],
+        seed: int,
+        fixation_jitter: Tuple[float, float],
+        frame_period: float,
+        window_size: Tuple[int, int],
+        stimulus_size: float,
+        avatar_size: float,
+        num_distractors: int = 0,
+        distractor_size: float = 0.25,
+        constraints: Optional[SequenceConstraints] = None,
+        approach_distractors: bool = False,
+    ) -> "Schedule":
+        # Resolve the random decisions exactly like a session without a schedule did: The trial order from the
+        # seeded shuffle, and the fixation durations drawn one after another from a generator with the same seed.
+        table = TrialTable.generate(
+            stimuli, position=Schedule.POSITIONS, seed=seed, constraints=constraints
+        )
+        trials = np.zeros(len(table), dtype=Schedule.trial_dtype(num_distractors))
+        trials["stimulus"] = table.stimulus_indices
+        trials["position"] = table.codes("position")
+
+        random_generator = random.Random(seed)
+        trials["fixation_frames"] = [
+            FixationPoint.num_frames(
+                random_generator.uniform(*fixation_jitter), frame_period
+            )
+            for _ in range(len(trials))
+        ]
+
+        # The stimuli are centered, so the start of the avatar only depends on the height of the stimulus
+        sizes = [
+            Stimulus.norm_size(stimulus.image, stimulus_size, window_size)
+            for stimulus in stimuli
+        ]
+        avatar_y = np.empty((len(stimuli), len(Schedule.POSITIONS)))
+        for i, size in enumerate(sizes):
+            for j, position in enumerate(Schedule.POSITIONS):
+                avatar_y[i, j] = position.calculate_avatar_position(
+                    _Placement(pos=(0.0, 0.0), size=size)
+                )[1]
+        trials["avatar_y"] = avatar_y[trials["stimulus"], trials["position"]]
+
+        # The distractors are only there to be passed, unless they take the role of their stimulus
+        if num_distractors > 0:
+            Schedule._place_distractors(
+                trials,
+                stimuli,
+                sizes,
+                Stimulus.norm_size(AssetCache.AVATAR, avatar_size, window_size),
+                [
+                    Stimulus.norm_size(stimulus.image, distractor_size, window_size)
+                    for stimulus in stimuli
+                ],
+                np.random.default_rng(seed),
+            )
+            if approach_distractors:
+                trials["distractor_approach"] = np.array(
+                    [stimulus.should_approach for stimulus in stimuli], dtype=bool
+                )[trials["distractors"]]
+
+        return Schedule(
+            trials=trials,
+            stimuli=[stimulus.name for stimulus in stimuli],
+            seed=seed,
+            frame_period=frame_period,
+            window_size=tuple(window_size),
+            stimulus_size=stimulus_size,
+            avatar_size=avatar_size,
+            fixation_jitter=tuple(fixation_jitter),
+            num_distractors=num_distractors,
+            distractor_size=distractor_size,
+        )
+
+    @staticmethod
+    def _place_distractors(
+        trials: np.ndarray,
+        stimuli: Sequence[Stimulus],
+        sizes: Sequence[Tuple[float, float]],
+        avatar_size: Tuple[float, float],
+        distractor_sizes: Sequence[Tuple[float, float]],
+        random_generator: np.random.Generator,
+    ):
+        # Each image is shown at most once per trial, so one image object per distractor suffices. The distractors
+        # are placed anywhere on the screen without covering the stimulus, the start of the avatar or each other.
+        images = {}
+        for i, stimulus in enumerate(stimuli):
+            images.setdefault(stimulus.image, i)
+        num_distractors = trials["distractors"].shape[1]
+        if len(images) <= num_distractors:
+            raise ValueError(
+                f"{num_distractors} distractors require more than {len(images)} different images."
+            )
+        candidates = np.array(list(images.values()))
+
+        for trial in trials:
+            target = int(trial["stimulus"])
+            occupied = [
+                _Placement(pos=(0.0, 0.0), size=sizes[target]),
+                _Placement(pos=(0.0, float(trial["avatar_y"])), size=avatar_size),
+            ]
+            choices = candidates[
+                [stimuli[i].image != stimuli[target].image for i in candidates]
+            ]
+            distractors = random_generator.choice(
+                choices, size=num_distractors, replace=False
+            )
+
+            for k, distractor in enumerate(distractors):
+                width, height = distractor_sizes[distractor]
+                for _ in range(Schedule.MAX_PLACEMENT_ATTEMPTS):
+                    placement = _Placement(
+                        pos=(
+                            random_generator.uniform(-1 + width / 2, 1 - width / 2),
+                            random_generator.uniform(-1 + height / 2, 1 - height / 2),
+                        ),
+                        size=(width, height),
+                    )
+                    if (
+                        not BoundingBoxes.from_objects(occupied)
+                        .overlapping(placement)
+                        .any()
+                    ):
+                        break
+                else:
+                    raise ValueError(
+                        "Unable to place the distractors without overlaps. Reduce their number or size."
+                    )
+
+                occupied.append(placement)
+                trial["distractors"][k] = distractor
+                trial["distractor_x"][k], trial["distractor_y"][k] = placement.pos
+
+    def trial_table(self, stimuli: Sequence[Stimulus]) -> TrialTable:
+        return TrialTable(
+            stimuli,
+            {"position": Schedule.POSITIONS},
+            self.trials["stimulus"].astype(np.int64) * len(Schedule.POSITIONS)
+            + self.trials["position"],
+        )
+
+    def check(
+        self,
+        stimuli: Sequence[Stimulus],
+        window_size: Tuple[int, int],
+        frame_period: float,
+        tolerance: float = 0.01,
+    ):
+        # The schedule is only valid for the catalog, display and refresh rate it was compiled for
+        if [stimulus.name for stimulus in stimuli] != list(self.stimuli):
+            raise ValueError("The schedule was compiled for different stimuli.")
+        if tuple(window_size) != tuple(self.window_size):
+            raise ValueError(
+                f"The schedule was compiled for a window of {self.window_size[0]}x{self.window_size[1]}, "
+                f"but the window has {window_size[0]}x{window_size[1]} pixels."
+            )
+        if abs(frame_period - self.frame_period) > tolerance * self.frame_period:
+            raise ValueError(
+                f"The schedule was compiled for {1 / self.frame_period:.2f} Hz, "
+                f"but the display runs at {1 / frame_period:.2f} Hz."
+            )
+
+    @dataclass
+    class Verification:
+        num_planned: int
+        num_recorded: int
+        num_mismatches: int
+        first_mismatch: int
+        max_fixation_error: float
+
+        def __bool__(self):
+            return self.num_planned == self.num_recorded and self.num_mismatches == 0
+
+    def verify(self, session: Session) -> "Schedule.Verification":
+        # Compare the recorded trials with the planned ones in order
+        num_compared = min(len(self.trials), len(session.trials))
+        planned = self.trials[:num_compared]
+        recorded = session.trials[:num_compared]
+
+        mismatches = (
+            np.asarray(self.stimuli, dtype=object)[planned["stimulus"]]
+            != np.asarray(session.names, dtype=object)[recorded["name"]]
+        ) | (planned["position"] != recorded["position"])
+
+        # The fixation is shown between the end of a trial and the start of the next one
+        fixation_error = (
+            recorded["onset"][1:]
+            - recorded["offset"][:-1]
+            - planned["fixation_frames"][1:] * self.frame_period
+        )
+        fixation_error = fixation_error[np.isfinite(fixation_error)]
+
+        return Schedule.Verification(
+            num_planned=len(self.trials),
+            num_recorded=len(session.trials),
+            num_mismatches=int(np.count_nonzero(mismatches)),
+            first_mismatch=int(np.argmax(mismatches)) if np.any(mismatches) else -1,
+            max_fixation_error=(
+                float(np.max(np.abs(fixation_error)))
+                if len(fixation_error) > 0
+                else 0.0
+            ),
+        )
+
+    def save(self, file: Union[str, Path]):
+        # The magic, the version and the length of the JSON header, followed by the header and the raw trials
+        header = json.dumps(self._header()).encode()
+        offset = len(Schedule.MAGIC) + 8 + len(header)
+        padding = -offset % 16
+        with Path(file).open("wb") as output:
+            output.write(Schedule.MAGIC)
+            output.write(
+                np.array([Schedule.VERSION, len(header) + padding], "<u4").tobytes()
+            )
+            output.write(header + b" " * padding)
+            output.write(self.trials.tobytes())
+
+    @staticmethod
+    def load(file: Union[str, Path]) -> "Schedule":
+        file = Path(file)
+        with file.open("rb") as schedule:
+            if schedule.read(len(Schedule.MAGIC)) != Schedule.MAGIC:
+                raise IOError(f"Invalid schedule file '{file}'.")
+            version, header_length = np.frombuffer(schedule.read(8), "<u4")
+            if version != Schedule.VERSION:
+                raise IOError(f"Unsupported version {version} of schedule '{file}'.")
+            header = json.loads(schedule.read(int(header_length)))
+
+        # The trials are memory-mapped and only read while the session proceeds
+        offset = len(Schedule.MAGIC) + 8 + int(header_length)
+        dtype = Schedule.trial_dtype(header.get("num_distractors", 0))
+        trials = (
+            np.memmap(file, dtype=dtype, mode="r", offset=offset)
+            if file.stat().st_size > offset
+            else np.zeros(0, dtype=dtype)
+        )
+        return Schedule(
+            trials=trials,
+            stimuli=header["stimuli"],
+            seed=header["seed"],
+            frame_period=header["frame_period"],
+            window_size=tuple(header["window_size"]),
+            stimulus_size=header["stimulus_size"],
+            avatar_size=header["avatar_size"],
+            fixation_jitter=tuple(header["fixation_jitter"]),
+            num_distractors=header.get("num_distractors", 0),
+            distractor_size=header.get("distractor_size", 0.25),
+        )
+
+    def _header(self) -> Dict[str, Any]:
+        return {
+            "stimuli": list(self.stimuli),
+            "seed": self.seed,
+            "frame_period": self.frame_period,
+            "window_size": list(self.window_size),
+            "stimulus_size": self.stimulus_size,
+            "avatar_size": self.avatar_size,
+            "fixation_jitter": list(self.fixation_jitter),
+            "num_distractors": self.num_distractors,
+            "distractor_size": self.distractor_size,
+        }
+
+
+@dataclass
+class _Placement:
+    pos: Tuple[float, float]
+    size: Tuple[float, float]
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d compile-schedule")
+    parser.add_argument(
+        "samples", type=str, help="The CSV file with the required samples."
+    )
+    parser.add_argument("output", type=str, help="The schedule file to write.")
+    parser.add_argument(
+        "-seed", type=int, help="The seed for the random generator", default=42
+    )
+    parser.add_argument(
+        "-frame_rate", type=float, help="The refresh rate of the display.", default=60.0
+    )
+    parser.add_argument(
+        "-resolution",
+        type=int,
+        nargs=2,
+        help="The resolution of the window in pixels.",
+        default=(1920, 1080),
+    )
+    parser.add_argument(
+        "-avatar_size",
+        type=float,
+        help="The relative size of the avatar regarding its largest size.",
+        default=0.15,
+    )
+    parser.add_argument(
+        "-stimulus_size",
+        type=float,
+        help="The relative size of the stimulus regarding its largest size.",
+        default=0.75,
+    )
+    parser.add_argument(
+        "-fixation_jitter_min",
+        type=float,
+        help="Minimal duration of the fixation cross",
+        default=0.75,
+    )
+    parser.add_argument(
+        "-fixation_jitter_max",
+        type=float,
+        help="Maximal duration of the fixation cross",
+        default=1.25,
+    )
+    parser.add_argument(
+        "-distractors",
+        type=int,
+        help="The number of distractor images shown next to the stimulus.",
+        default=0,
+    )
+    parser.add_argument(
+        "-distractor_size",
+        type=float,
+        help="The relative size of the distractors regarding their largest size.",
+        default=0.25,
+    )
+    parser.add_argument(
+        "--approach_distractors",
+        dest="approach_distractors",
+        action="store_true",
+        help="Touching a distractor of a stimulus to approach ends the trial, too.",
+        default=False,
+    )
+    parser.add_argument(
+        "-max_run",
+        type=str,
+        nargs="*",
+        help="Limit the consecutive trials of the same level as 'FACTOR=N', i.e. 'position=3', "
+        "'should_approach=3' or 'stimulus=1' against immediate repeats.",
+        default=[],
+    )
+    parser.add_argument(
+        "-balance_transitions",
+        type=str,
+        nargs="*",
+        help="Balance the transitions between the levels of these factors, i.e. 'position'.",
+        default=[],
+    )
+    arguments = parser.parse_args(arguments)
+
+    stimuli = list(Stimulus.from_csv(arguments.samples))
+    try:
+        constraints = SequenceConstraints.parse(
+            arguments.max_run,
+            arguments.balance_transitions,
+            factors=Schedule.factors(stimuli),
+        )
+    except ValueError as error:
+        parser.error(str(error))
+
+    schedule = Schedule.compile(
+        stimuli,
+        seed=arguments.seed,
+        fixation_jitter=(arguments.fixation_jitter_min, arguments.fixation_jitter_max),
+        frame_period=1.0 / arguments.frame_rate,
+        window_size=tuple(arguments.resolution),
+        stimulus_size=arguments.stimulus_size,
+        avatar_size=arguments.avatar_size,
+        num_distractors=arguments.distractors,
+        distractor_size=arguments.distractor_size,
+        constraints=constraints,
+        approach_distractors=arguments.approach_distractors,
+    )
+    schedule.save(arguments.output)
+    print(
+        f"Compiled {len(schedule.trials)} trials of {len(schedule.stimuli)} stimuli into '{arguments.output}'.",
+        file=sys.stderr,
+    )
+
+
+def verify_main(arguments: Optional[Sequence[str]] = None):
+    from bid2d.analysis import Analysis
+    from bid2d.logger import Logger
+
+    parser = argparse.ArgumentParser("bid2d verify-schedule")
+    parser.add_argument("schedule", type=str, help="The compiled schedule.")
+    parser.add_argument(
+        "recordings",
+        type=str,
+        nargs="+",
+        help="The XDF files or directories containing them.",
+    )
+    arguments = parser.parse_args(arguments)
+
+    schedule = Schedule.load(arguments.schedule)
+    all_valid = True
+    for file in Analysis.find_recordings(arguments.recordings):
+        verification = schedule.verify(Logger.load_session(str(file)))
+        all_valid &= bool(verification)
+        print(f"{file}: {'OK' if verification else 'MISMATCH'} {verification}")
+    if not all_valid:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Union, Optional, Tuple, Sequence
+from xml.etree import ElementTree
+
+import numpy as np
+
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.xdf import XdfStream
+
+
+@dataclass
+class Session:
+    # All trials, one row per trial. The name is an index into 'names', the position an index into 'POSITIONS'.
+    TRIAL_DTYPE = np.dtype(
+        [("onset", "f8"), ("offset", "f8"), ("name", "i4"), ("position", "i1")]
+    )
+    # All logged reactions. The reaction is the value of the corresponding 'Reaction'.
+    REACTION_DTYPE = np.dtype(
+        [("timestamp", "f8"), ("num_frames", "i4"), ("reaction", "i1")]
+    )
+    # The per-trial summaries of the frame timing, if it was recorded
+    FRAME_TIMING_DTYPE = np.dtype(
+        [
+            ("timestamp", "f8"),
+            ("num_frames", "i4"),
+            ("num_dropped", "i4"),
+            ("max_interval", "f8"),
+        ]
+    )
+    # The first reaction of each trial, joined with the trial it belongs to
+    RESPONSE_DTYPE = np.dtype(
+        [("rt", "f8"), ("num_frames", "i4"), ("reaction", "i1"), ("correct", "?")]
+    )
+    POSITIONS = tuple(Position)
+
+    trials: np.ndarray
+    reactions: np.ndarray
+    names: np.ndarray
+    frame_timings: np.ndarray = field(
+        default_factory=lambda: np.zeros(0, dtype=Session.FRAME_TIMING_DTYPE)
+    )
+
+    @staticmethod
+    def from_streams(
+        trial_stream: Optional[XdfStream],
+        reaction_stream: Optional[XdfStream],
+        frame_timing_stream: Optional[XdfStream] = None,
+    ) -> "Session":
+        trials, names = Session._decode_trials(trial_stream)
+        return Session(
+            trials=trials,
+            reactions=Session._decode_reactions(reaction_stream),
+            names=names,
+            frame_timings=Session._decode_frame_timings(frame_timing_stream),
+        )
+
+    def responses(self) -> np.ndarray:
+        responses = np.zeros(len(self.trials), dtype=Session.RESPONSE_DTYPE)
+        responses["rt"] = np.nan
+        responses["num_frames"] = -1
+        responses["reaction"] = Reaction.NoReaction.value
+        if len(self.reactions) == 0 or len(self.trials) == 0:
+            return responses
+
+        # Find the first reaction after the onset of each trial and check that it happened before its end
+        first = np.searchsorted(
+            self.reactions["timestamp"], self.trials["onset"], side="left"
+        )
+        clipped = np.minimum(first, len(self.reactions) - 1)
+        offsets = np.where(
+            np.isnan(self.trials["offset"]), np.inf, self.trials["offset"]
+        )
+        valid = (first < len(self.reactions)) & (
+            self.reactions["timestamp"][clipped] <= offsets
+        )
+
+        reactions = self.reactions[clipped[valid]]
+        responses["rt"][valid] = reactions["timestamp"] - self.trials["onset"][valid]
+        responses["num_frames"][valid] = reactions["num_frames"]
+        responses["reaction"][valid] = reactions["reaction"]
+        responses["correct"] = responses["reaction"] == Reaction.CorrectReaction.value
+        return responses
+
+    def dropped_frames(self) -> np.ndarray:
+        # The number of dropped frames per trial or -1, if the frame timing of the trial is unknown
+        dropped = np.full(len(self.trials), -1, dtype=np.int32)
+        if len(self.frame_timings) == 0 or len(self.trials) == 0:
+            return dropped
+
+        # The summary is pushed right before the end of the trial it belongs to
+        trial_indices = (
+            np.searchsorted(
+                self.trials["onset"], self.frame_timings["timestamp"], side="right"
+            )
+            - 1
+        )
+        valid = trial_indices >= 0
+        dropped[trial_indices[valid]] = self.frame_timings["num_dropped"][valid]
+        return dropped
+
+    def save(self, file: Union[str, Path]):
+        # A '.npy' or '.parquet' session is a directory of one file per table, which is memory-mapped on loading. A
+        # '.npz' session is a single file, but read into memory as a whole.
+        file = file if isinstance(file, Path) else Path(file)
+        if file.suffix == ".npy":
+            file.mkdir(parents=True, exist_ok=True)
+            for name, table in self._tables().items():
+                np.save(file / f"{name}.npy", table)
+        elif file.suffix == ".npz":
+            # Uncompressed on purpose: Loading a column is then a plain read without any decoding.
+            np.savez(file, **self._tables())
+        elif file.suffix == ".parquet":
+            pyarrow, parquet = Session._import_pyarrow()
+            file.mkdir(parents=True, exist_ok=True)
+            parquet.write_table(
+                pyarrow.table(
+                    {
+                        "onset": self.trials["onset"],
+                        "offset": self.trials["offset"],
+                        "name": pyarrow.DictionaryArray.from_arrays(
+                            self.trials["name"], self.names.tolist()
+                        ),
+                        "position": self.trials["position"],
+                    }
+                ),
+                file / "trials.parquet",
+            )
+            parquet.write_table(
+                pyarrow.table(
+                    {
+                        name: self.reactions[name]
+                        for name in Session.REACTION_DTYPE.names
+                    }
+                ),
+                file / "reactions.parquet",
+            )
+            parquet.write_table(
+                pyarrow.table(
+                    {
+                        name: self.frame_timings[name]
+                        for name in Session.FRAME_TIMING_DTYPE.names
+                    }
+                ),
+                file / "frame_timings.parquet",
+            )
+        else:
+            raise ValueError(f"Unsupported file format '{file.suffix}'.")
+
+    @staticmethod
+    def load(file: Union[str, Path]) -> "Session":
+        file = file if isinstance(file, Path) else Path(file)
+        if file.suffix == ".npy":
+            tables = {
+                name: np.load(file / f"{name}.npy", mmap_mode="r")
+                for name in ("trials", "reactions", "names")
+            }
+            frame_timings = file / "frame_timings.npy"
+            return Session(
+                **tables,
+                frame_timings=(
+                    np.load(frame_timings, mmap_mode="r")
+                    if frame_timings.is_file()
+                    else np.zeros(0, dtype=Session.FRAME_TIMING_DTYPE)
+                ),
+            )
+        elif file.suffix == ".npz":
+            with np.load(file) as data:
+                return Session(
+                    trials=data["trials"],
+                    reactions=data["reactions"],
+                    names=data["names"],
+                    frame_timings=(
+                        data["frame_timings"]
+                        if "frame_timings" in data
+                        else np.zeros(0, dtype=Session.FRAME_TIMING_DTYPE)
+                    ),
+                )
+        elif file.suffix == ".parquet":
+            _, parquet = Session._import_pyarrow()
+            trial_table = parquet.read_table(file / "trials.parquet", memory_map=True)
+            names = trial_table.column("name").combine_chunks()
+            trials = np.zeros(trial_table.num_rows, dtype=Session.TRIAL_DTYPE)
+            for column in ("onset", "offset", "position"):
+                trials[column] = trial_table.column(column).to_numpy()
+            trials["name"] = names.indices.to_numpy(zero_copy_only=False)
+
+            return Session(
+                trials=trials,
+                reactions=Session._read_parquet(
+                    parquet, file / "reactions.parquet", Session.REACTION_DTYPE
+                ),
+                names=np.asarray(names.dictionary.to_pylist(), dtype=np.str_),
+                frame_timings=Session._read_parquet(
+                    parquet, file / "frame_timings.parquet", Session.FRAME_TIMING_DTYPE
+                ),
+            )
+        raise ValueError(f"Unsupported file format '{file.suffix}'.")
+
+    def _tables(self) -> Dict[str, np.ndarray]:
+        return {
+            "trials": self.trials,
+            "reactions": self.reactions,
+            "names": self.names,
+            "frame_timings": self.frame_timings,
+        }
+
+    @staticmethod
+    def trial_description(names: Sequence[str]) -> ElementTree.Element:
+        # The description of a compact trial stream, as the logger writes it
+        desc = ElementTree.Element("desc")
+        names_element = ElementTree.SubElement(desc, "names")
+        for name in names:
+            ElementTree.SubElement(names_element, "name").text = name
+        positions_element = ElementTree.SubElement(desc, "positions")
+        for position in Session.POSITIONS:
+            ElementTree.SubElement(positions_element, "position").text = position.value
+        return desc
+
+    @staticmethod
+    def trial_dictionary(stream: XdfStream) -> Tuple[np.ndarray, np.ndarray]:
+        # A compact trial stream carries indices into the names and the positions listed in its description. The
+        # positions are returned as indices into 'POSITIONS'.
+        desc = stream.description
+        names = np.array(
+            [name.text or "" for name in desc.iterfind("names/name")], dtype=np.str_
+        )
+        positions = Session._position_codes(
+            [position.text for position in desc.iterfind("positions/position")]
+        )
+        return names, positions
+
+    @staticmethod
+    def _decode_trials(stream: Optional[XdfStream]):
+        if stream is None or len(stream.time_stamps) == 0:
+            return np.zeros(0, dtype=Session.TRIAL_DTYPE), np.zeros(0, dtype=np.str_)
+
+        # Each trial is logged twice: Once at its start and once at its end
+        num_samples = len(stream.time_stamps)
+        trials = np.zeros((num_samples + 1) // 2, dtype=Session.TRIAL_DTYPE)
+        trials["onset"] = stream.time_stamps[0::2]
+        trials["offset"] = np.nan
+        trials["offset"][: num_samples // 2] = stream.time_stamps[1::2]
+
+        if stream.dtype is not None:
+            names, positions = Session.trial_dictionary(stream)
+            samples = np.asarray(stream.time_series, dtype=np.int64)
+            trials["name"] = samples[0::2, 0]
+            trials["position"] = positions[samples[0::2, 1]]
+            return trials, names
+
+        samples = np.asarray(stream.time_series, dtype=np.str_)
+        names, trials["name"] = np.unique(samples[0::2, 0], return_inverse=True)
+        positions, position_indices = np.unique(samples[0::2, 1], return_inverse=True)
+        trials["position"] = Session._position_codes(positions)[position_indices]
+        return trials, names
+
+    @staticmethod
+    def _position_codes(values) -> np.ndarray:
+        # The index into 'POSITIONS' of each value or -1, if unknown
+        return np.array(
+            [
+                next(
+                    (i for i, p in enumerate(Session.POSITIONS) if p.value == value), -1
+                )
+                for value in values
+            ],
+            dtype=np.int8,
+        )
+
+    @staticmethod
+    def _decode_reactions(stream: Optional[XdfStream]) -> np.ndarray:
+        if stream is None:
+            return np.zeros(0, dtype=Session.REACTION_DTYPE)
+
+        reactions = np.zeros(len(stream.time_stamps), dtype=Session.REACTION_DTYPE)
+        reactions["timestamp"] = stream.time_stamps
+        reactions["num_frames"] = stream.time_series[:, 0]
+        reactions["reaction"] = stream.time_series[:, 1]
+        return reactions
+
+    @staticmethod
+    def _decode_frame_timings(stream: Optional[XdfStream]) -> np.ndarray:
+        if stream is None:
+            return np.zeros(0, dtype=Session.FRAME_TIMING_DTYPE)
+
+        frame_timings = np.zeros(
+            len(stream.time_stamps), dtype=Session.FRAME_TIMING_DTYPE
+        )
+        frame_timings["timestamp"] = stream.time_stamps
+        frame_timings["num_frames"] = stream.time_series[:, 0]
+        frame_timings["num_dropped"] = stream.time_series[:, 1]
+        frame_timings["max_interval"] = stream.time_series[:, 2]
+        return frame_timings
+
+    @staticmethod
+    def _read_parquet(parquet, file: Path, dtype: np.dtype) -> np.ndarray:
+        if not file.is_file():
+            return np.zeros(0, dtype=dtype)
+
+        table = parquet.read_table(file, memory_map=True)
+        data = np.zeros(table.num_rows, dtype=dtype)
+        for column in dtype.names:
+            data[column] = table.column(column).to_numpy()
+        return data
+
+    @staticmethod
+    def _import_pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as error:
+            raise ImportError(
+                "Exporting to Parquet requires the optional dependency 'pyarrow'."
+            ) from error
+        return pyarrow, pyarrow.parquet
@@ -0,0 +1,416 @@
+import argparse
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from bid2d.assets import AssetCache
+from bid2d.experiment import Experiment
+from bid2d.logger import Logger
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.schedule import Schedule
+from bid2d.stimulus import Stimulus
+from bid2d.trial import Trial
+from bid2d.util.avatar_motion import AvatarMotion
+from bid2d.util.fixation_point import FixationPoint
+from bid2d.util.keyboard import KeyState, UP, DOWN
+from bid2d.util.profiler import Profiler
+
+
+class NullWindow:
+    # A window without any output. Flipping returns immediately with the time the flip would have happened, counted
+    # in frames from the given start.
+    def __init__(self, size: Tuple[int, int], frame_rate: float, start: float = 0.0):
+        self.size = size
+        self.monitorFramePeriod = 1.0 / frame_rate
+        self.start = start
+        self.on_flip: Optional[Callable[[], None]] = None
+
+        # The flips are counted as a float, as CPython allocates each int beyond 256 but recycles floats
+        self._num_flips = 0.0
+
+    @property
+    def num_flips(self) -> int:
+        return int(self._num_flips)
+
+    def flip(self) -> float:
+        self._num_flips += 1.0
+        if self.on_flip is not None:
+            self.on_flip()
+        return self.time()
+
+    def skip(self, num_frames: int):
+        # Advances the time by frames nobody reacts to, without presenting them
+        self._num_flips += num_frames
+
+    def time(self) -> float:
+        return self.start + self._num_flips * self.monitorFramePeriod
+
+
+class NullStimulus:
+    def __init__(self, pos: Tuple[float, float], size: Tuple[float, float]):
+        self.pos = pos
+        self.size = size
+
+    def draw(self, window=None):
+        pass
+
+
+class NullAvatar(AvatarMotion, NullStimulus):
+    def __init__(self, size: Tuple[float, float]):
+        super().__init__(pos=(0.0, 0.0), size=size)
+        self.speed = 0.01
+        self.place(0.0, 0.0)
+
+
+class NullFixationPoint(FixationPoint):
+    def __init__(self, window: NullWindow):
+        self._window = window
+
+    def draw(self):
+        pass
+
+    def show_frames(self, num_frames: int, flip: Optional[Callable[[], float]] = None):
+        # The participant does not react to the fixation cross, so its frames are skipped
+        self._window.skip(num_frames)
+
+
+@dataclass
+class ResponseModel:
+    # The reaction time (in seconds) follows a log-normal distribution with the given mean and standard deviation.
+    # Erroneous first reactions are corrected after the given delay.
+    rt_mean: float = 0.6
+    rt_sd: float = 0.15
+    error_rate: float = 0.05
+    correction_delay: float = 0.25
+
+    def sample_rt(self, random_generator: random.Random) -> float:
+        sigma = math.sqrt(math.log(1 + (self.rt_sd / self.rt_mean) ** 2))
+        return random_generator.lognormvariate(
+            math.log(self.rt_mean) - sigma**2 / 2, sigma
+        )
+
+
+class SimulatedParticipant:
+    # Presses and releases the keys through the same handlers as the window does. Like the events of a window, a
+    # press only arrives on the first flip after it happened. The modeled reaction time of each trial is kept, so
+    # the latency of the logged one is measurable.
+    def __init__(
+        self,
+        keyboard: KeyState,
+        frame_period: float,
+        models: Dict[Tuple[Position, bool], ResponseModel],
+        seed: int = 42,
+    ):
+        self.keyboard = keyboard
+        self.frame_period = frame_period
+        self.models = models
+        self._random_generator = random.Random(seed)
+        self.reaction_times: List[float] = []
+
+        self._frame = 0
+        self._key = None
+        self._correct_key = None
+        self._response_frame = -1
+        self._correction_frame = -1
+
+    def start_trial(self, position: Position, should_approach: bool):
+        for key in (UP, DOWN):
+            self.keyboard.on_key_release(key, 0)
+
+        model = self.models[(position, should_approach)]
+        self._correct_key = SimulatedParticipant.correct_key(position, should_approach)
+        self._frame = 0
+        rt = model.sample_rt(self._random_generator)
+        self.reaction_times.append(rt)
+        self._response_frame = max(1, math.ceil(rt / self.frame_period))
+        if self._random_generator.random() < model.error_rate:
+            self._key = UP if self._correct_key == DOWN else DOWN
+            self._correction_frame = self._response_frame + max(
+                1, round(model.correction_delay / self.frame_period)
+            )
+        else:
+            self._key = self._correct_key
+            self._correction_frame = -1
+
+    def step(self):
+        self._frame += 1
+        if self._frame == self._response_frame:
+            self.keyboard.on_key_press(self._key, 0)
+        elif self._frame == self._correction_frame:
+            self.keyboard.on_key_release(self._key, 0)
+            self.keyboard.on_key_press(self._correct_key, 0)
+
+    @staticmethod
+    def correct_key(position: Position, should_approach: bool) -> int:
+        for key, reaction in ((UP, Reaction.Up), (DOWN, Reaction.Down)):
+            if (
+                reaction.validate(position=position, should_approach=should_approach)
+                == Reaction.CorrectReaction
+            ):
+                return key
+        raise ValueError("No correct reaction available")
+
+    @staticmethod
+    def create_models(
+        rt_mean: float,
+        rt_sd: float,
+        error_rate: float,
+        avoid_slowdown: float = 0.0,
+    ) -> Dict[Tuple[Position, bool], ResponseModel]:
+        return {
+            (position, should_approach): ResponseModel(
+                rt_mean=rt_mean + (0.0 if should_approach else avoid_slowdown),
+                rt_sd=rt_sd,
+                error_rate=error_rate,
+            )
+            for position in Position
+            for should_approach in (True, False)
+        }
+
+
+class HeadlessExperiment(Experiment):
+    # Runs the unmodified trial loop without a display as fast as possible. The simulated participant reacts to
+    # the trials and the events are logged as usual. Unless another clock is given, the key presses and events are
+    # timestamped with the simulated time of the frames from 'start', so the reaction times are the modeled ones.
+    def __init__(
+        self,
+        samples: Sequence[Stimulus],
+        logger: Logger,
+        models: Dict[Tuple[Position, bool], ResponseModel],
+        seed: int = 42,
+        win_size: Tuple[int, int] = (1920, 1080),
+        frame_rate: float = 60.0,
+        record_frame_timing: bool = False,
+        clock: Optional[Callable[[], float]] = None,
+        prefetch: Optional[int] = None,
+        profiler: Optional[Profiler] = None,
+        start: float = 0.0,
+    ):
+        self.frame_rate = frame_rate
+        self.start = start
+        super().__init__(
+            samples,
+            logger,
+            win_size=win_size,
+            fullscreen=False,
+            record_frame_timing=record_frame_timing,
+            prefetch=prefetch,
+            profiler=profiler,
+            clock=clock,
+        )
+        if self.clock is None:
+            self.clock = self._window.time
+        self.keyboard = KeyState(clock=self.clock)
+        self.participant = SimulatedParticipant(
+            self.keyboard, self._window.monitorFramePeriod, models, seed=seed
+        )
+        self._window.on_flip = self.participant.step
+        self._stimuli = {}
+        self._stimulus_size = 0.5
+
+    def prepare(self):
+        # Waiting for the consumers does not take any simulated time
+        super().prepare()
+        self._window.skip(-self._window.num_flips)
+
+    def _create_window(self, win_size: Tuple[int, int], fullscreen: bool):
+        return NullWindow(win_size, self.frame_rate, start=self.start)
+
+    def _create_keyboard(self) -> KeyState:
+        return self.keyboard
+
+    def _create_fixation_point(self):
+        return NullFixationPoint(self._window)
+
+    def _create_avatar(self, avatar_size: float):
+        return NullAvatar(
+            Stimulus.norm_size(AssetCache.AVATAR, avatar_size, self._window.size)
+        )
+
+    def _create_distractor(
+        self, stimulus: Stimulus, distractor_size: float, decoded: Any = None
+    ):
+        return NullStimulus(
+            (0.0, 0.0),
+            Stimulus.norm_size(stimulus.image, distractor_size, self._window.size),
+        )
+
+    def _load_stimuli(self, stimulus_size: float):
+        self._stimulus_size = stimulus_size
+
+    def _create_stimulus(self, image: Path, decoded: Any, stimulus_size: float):
+        # The images are still decoded, but only their size is used
+        return NullStimulus(
+            (0.0, 0.0), Stimulus.norm_size(image, stimulus_size, self._window.size)
+        )
+
+    def _load_stimulus(self, trial: Trial):
+        if self.prefetcher is not None:
+            stimulus = super()._load_stimulus(trial)
+        else:
+            stimulus = self._stimuli.get(trial.stimulus.image, None)
+            if stimulus is None:
+                stimulus = NullStimulus(
+                    (0.0, 0.0),
+                    Stimulus.norm_size(
+                        trial.stimulus.image, self._stimulus_size, self._window.size
+                    ),
+                )
+                self._stimuli[trial.stimulus.image] = stimulus
+
+        self.participant.start_trial(trial["position"], trial.should_approach)
+        return stimulus
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d simulate")
+    parser.add_argument(
+        "samples", type=str, help="The CSV file with the required samples."
+    )
+    parser.add_argument(
+        "-participants", type=int, help="The number of sessions.", default=1
+    )
+    parser.add_argument(
+        "-repetitions",
+        type=int,
+        help="How often each sample is repeated within a session.",
+        default=1,
+    )
+    parser.add_argument(
+        "-seed", type=int, help="The seed for the random generator", default=42
+    )
+    parser.add_argument(
+        "-frame_rate", type=float, help="The simulated refresh rate.", default=60.0
+    )
+    parser.add_argument(
+        "-rt_mean", type=float, help="The mean reaction time in seconds.", default=0.6
+    )
+    parser.add_argument(
+        "-rt_sd",
+        type=float,
+        help="The standard deviation of the reaction time in seconds.",
+        default=0.15,
+    )
+    parser.add_argument(
+        "-error_rate",
+        type=float,
+        help="The probability of an incorrect first reaction.",
+        default=0.05,
+    )
+    parser.add_argument(
+        "-avoid_slowdown",
+        type=float,
+        help="The additional mean reaction time in avoid trials in seconds.",
+        default=0.05,
+    )
+    parser.add_argument(
+        "-distractors",
+        type=int,
+        help="The number of distractor images shown next to the stimulus.",
+        default=0,
+    )
+    parser.add_argument(
+        "--approach_distractors",
+        dest="approach_distractors",
+        action="store_true",
+        help="Touching a distractor of a stimulus to approach ends the trial, too.",
+        default=False,
+    )
+    parser.add_argument(
+        "-schedule",
+        type=str,
+        help="Replay the session compiled by 'bid2d compile-schedule' for every participant.",
+        default=None,
+    )
+    parser.add_argument(
+        "--wait_for_lsl",
+        dest="prepare",
+        action="store_true",
+        help="Wait for a consumer for the Lab Streaming Layer streams",
+        default=False,
+    )
+    parser.add_argument(
+        "--frame_timing",
+        dest="frame_timing",
+        action="store_true",
+        help="Stream a per-trial summary of the (simulated) frame timing.",
+        default=False,
+    )
+    parser.add_argument(
+        "--compact_trials",
+        dest="compact_trials",
+        action="store_true",
+        help="Stream the trials as indices into the names and positions listed in the stream description.",
+        default=False,
+    )
+    arguments = parser.parse_args(arguments)
+
+    from pylsl import local_clock
+
+    stimuli = list(Stimulus.from_csv(arguments.samples)) * arguments.repetitions
+    models = SimulatedParticipant.create_models(
+        rt_mean=arguments.rt_mean,
+        rt_sd=arguments.rt_sd,
+        error_rate=arguments.error_rate,
+        avoid_slowdown=arguments.avoid_slowdown,
+    )
+    schedule = (
+        Schedule.load(arguments.schedule) if arguments.schedule is not None else None
+    )
+    logger = Logger(
+        frame_timing=arguments.frame_timing,
+        touches=(
+            schedule.num_distractors if schedule is not None else arguments.distractors
+        )
+        > 0,
+        trial_names=(
+            [stimulus.name for stimulus in stimuli]
+            if arguments.compact_trials
+            else None
+        ),
+    )
+
+    # The sessions follow each other in simulated time, which runs ahead of the clock of the streams
+    session_start = local_clock()
+    for participant in range(arguments.participants):
+        experiment = HeadlessExperiment(
+            stimuli,
+            logger,
+            models,
+            seed=arguments.seed + participant,
+            frame_rate=arguments.frame_rate,
+            record_frame_timing=arguments.frame_timing,
+            start=session_start,
+        )
+        if arguments.prepare:
+            experiment.prepare()
+
+        start = time.perf_counter()
+        if schedule is not None:
+            experiment.run_schedule(schedule)
+        else:
+            experiment.run(
+                fixation_cross_jitter=(0.75, 1.25),
+                seed=arguments.seed + participant,
+                avatar_size=0.15,
+                stimulus_size=0.75,
+                num_distractors=arguments.distractors,
+                approach_distractors=arguments.approach_distractors,
+            )
+        duration = time.perf_counter() - start
+        session_start = max(local_clock(), experiment._window.time())
+        num_trials = len(stimuli) * len(Position)
+        print(
+            f"Participant {participant}: {num_trials} trials, {experiment._window.num_flips} frames in "
+            f"{duration:.3f}s ({num_trials / duration:.0f} trials/s)",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+import argparse
+import csv
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from pathlib import Path
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from bid2d.analysis import Analysis
+from bid2d.session import Session
+from bid2d.stimulus import Stimulus
+
+
+@dataclass
+class Trials:
+    # The columnar table of all trials of a study, as tabulated by 'bid2d analyze'. The participants are indices into
+    # 'participants', the positions indices into 'Session.POSITIONS' (or -1 for a trial without one) and the reaction
+    # time is NaN for trials without a response.
+    participants: np.ndarray
+    participant: np.ndarray
+    position: np.ndarray
+    should_approach: np.ndarray
+    rt: np.ndarray
+    correct: np.ndarray
+
+    # The conditions of each participant, approach before avoid
+    NUM_CONDITIONS = len(Session.POSITIONS) * 2
+
+    def __len__(self) -> int:
+        return len(self.participant)
+
+    @staticmethod
+    def from_rows(
+        rows: Sequence[Sequence],
+        should_approach: Dict[str, bool],
+        inverted: Collection[str] = (),
+    ) -> "Trials":
+        # The instruction per stimulus, i.e. from the samples, is inverted for the participants of the inverted group
+        columns = {name: index for index, name in enumerate(Analysis.COLUMNS)}
+        participants, participant = np.unique(
+            np.array([row[columns["participant"]] for row in rows], dtype=str),
+            return_inverse=True,
+        )
+        positions = {str(position): i for i, position in enumerate(Session.POSITIONS)}
+        approach = np.array(
+            [should_approach[row[columns["stimulus"]]] for row in rows], dtype=bool
+        )
+        return Trials(
+            participants=participants,
+            participant=participant.astype(np.int64),
+            position=np.array(
+                [positions.get(row[columns["position"]], -1) for row in rows],
+                dtype=np.int64,
+            ),
+            should_approach=approach
+            ^ np.isin(participants, list(inverted))[participant],
+            rt=np.array([row[columns["rt"]] for row in rows], dtype=np.float64),
+            correct=np.array([row[columns["correct"]] for row in rows], dtype=bool),
+        )
+
+    @staticmethod
+    def load_csv(
+        file: Union[str, Path],
+        should_approach: Dict[str, bool],
+        inverted: Collection[str] = (),
+    ) -> "Trials":
+        # The reaction time is empty for trials without a response
+        with Path(file).open("r", newline="") as csv_file:
+            rows = [
+                (
+                    row["participant"],
+                    int(row["trial"]),
+                    row["stimulus"],
+                    row["position"],
+                    float(row["onset"]),
+                    float(row["rt"]) if row["rt"] not in ("", "nan") else math.nan,
+                    int(row["num_frames"]),
+                    row["reaction"],
+                    row["correct"].strip().lower() == "true",
+                    int(row["dropped_frames"]),
+                )
+                for row in csv.DictReader(csv_file)
+            ]
+        return Trials.from_rows(rows, should_approach, inverted)
+
+    def condition_means(
+        self,
+        min_rt: float = 0.15,
+        max_rt: float = 2.0,
+        outlier_sd: Optional[float] = 2.5,
+        trim: float = 0.1,
+    ) -> "ConditionMeans":
+        # Only the correct responses within the absolute bounds count for the reaction times. Of those, the outliers
+        # beyond 'outlier_sd' standard deviations of their condition of the participant are excluded, while the
+        # trimmed mean drops the fraction 'trim' of the fastest and the slowest ones instead.
+        num_groups = len(self.participants) * Trials.NUM_CONDITIONS
+        valid = self.position >= 0
+        groups = (
+            self.participant * Trials.NUM_CONDITIONS
+            + self.position * 2
+            + (~self.should_approach).astype(np.int64)
+        )[valid]
+        correct = self.correct[valid]
+        rt = self.rt[valid]
+
+        num_trials = np.bincount(groups, minlength=num_groups)
+        num_correct = np.bincount(groups, weights=correct, minlength=num_groups)
+
+        kept = correct & (rt >= min_rt) & (rt <= max_rt)
+        bounded_groups, bounded_rt = groups[kept], rt[kept]
+        rt_mean, rt_sd = Trials.group_mean(bounded_rt, bounded_groups, num_groups)
+        if outlier_sd is not None:
+            inside = (
+                np.abs(bounded_rt - rt_mean[bounded_groups])
+                <= outlier_sd * rt_sd[bounded_groups]
+            )
+            # A single response has no standard deviation
+            inside |= np.isnan(rt_sd[bounded_groups])
+            filtered_groups = bounded_groups[inside]
+            rt_mean, _ = Trials.group_mean(
+                bounded_rt[inside], filtered_groups, num_groups
+            )
+        else:
+            filtered_groups = bounded_groups
+
+        shape = (len(self.participants), len(Session.POSITIONS), 2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            accuracy = num_correct / num_trials
+        return ConditionMeans(
+            participants=self.participants,
+            num_trials=num_trials.reshape(shape),
+            num_kept=np.bincount(filtered_groups, minlength=num_groups).reshape(shape),
+            accuracy=accuracy.reshape(shape),
+            rt=rt_mean.reshape(shape),
+            trimmed_rt=Trials.trimmed_mean(
+                bounded_rt, bounded_groups, num_groups, trim
+            ).reshape(shape),
+        )
+
+    @staticmethod
+    def group_mean(
+        values: np.ndarray, groups: np.ndarray, num_groups: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # The mean and the sample standard deviation per group, NaN for too small groups
+        counts = np.bincount(groups, minlength=num_groups)
+        sums = np.bincount(groups, weights=values, minlength=num_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+            # Around the mean, as the sum of squares cancels for the small variances of reaction times
+            squares = np.bincount(
+                groups,
+                weights=np.square(values - means[groups]),
+                minlength=num_groups,
+            )
+            sds = np.sqrt(squares / (counts - 1))
+        sds[counts < 2] = np.nan
+        return means, sds
+
+    @staticmethod
+    def trimmed_mean(
+        values: np.ndarray, groups: np.ndarray, num_groups: int, trim: float
+    ) -> np.ndarray:
+        # Sorts the values by group and value once. The rank within its group decides whether a value is kept.
+        order = np.lexsort((values, groups))
+        sorted_groups, sorted_values = groups[order], values[order]
+        counts = np.bincount(groups, minlength=num_groups)
+        starts = np.cumsum(counts) - counts
+        ranks = np.arange(len(values)) - starts[sorted_groups]
+        cut = np.floor(counts * trim).astype(np.int64)
+        kept = (ranks >= cut[sorted_groups]) & (ranks < (counts - cut)[sorted_groups])
+        return Trials.group_mean(sorted_values[kept], sorted_groups[kept], num_groups)[
+            0
+        ]
+
+
+@dataclass
+class ConditionMeans:
+    # Per participant, position and instruction, approach before avoid
+    participants: np.ndarray
+    num_trials: np.ndarray
+    num_kept: np.ndarray
+    accuracy: np.ndarray
+    rt: np.ndarray
+    trimmed_rt: np.ndarray
+
+    def effect(self, trimmed: bool = False) -> np.ndarray:
+        # The congruency effect per participant: The reaction time of avoid trials minus the one of approach trials,
+        # averaged over the positions
+        rt = self.trimmed_rt if trimmed else self.rt
+        return np.mean(rt[:, :, 1] - rt[:, :, 0], axis=1)
+
+    def accuracy_effect(self) -> np.ndarray:
+        # The accuracy of approach trials minus the one of avoid trials, so both effects are positive if avoiding is
+        # harder
+        return np.mean(self.accuracy[:, :, 0] - self.accuracy[:, :, 1], axis=1)
+
+    def rows(self) -> Iterable[Tuple]:
+        effects, trimmed_effects = self.effect(), self.effect(trimmed=True)
+        accuracy_effects = self.accuracy_effect()
+        for i, participant in enumerate(self.participants.tolist()):
+            yield (
+                participant,
+                float(effects[i]),
+                float(trimmed_effects[i]),
+                float(accuracy_effects[i]),
+                *(
+                    float(values[i, position, condition])
+                    for position in range(len(Session.POSITIONS))
+                    for condition in range(2)
+                    for values in (self.accuracy, self.rt, self.trimmed_rt)
+                ),
+            )
+
+    @staticmethod
+    def columns() -> Tuple[str, ...]:
+        return (
+            "participant",
+            "effect",
+            "trimmed_effect",
+            "accuracy_effect",
+            *(
+                f"{column}_{condition}_{position.value}"
+                for position in Session.POSITIONS
+                for condition in ("approach", "avoid")
+                for column in ("accuracy", "rt", "trimmed_rt")
+            ),
+        )
+
+    def save(self, file: Union[str, Path]):
+        with Path(file).open("w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(ConditionMeans.columns())
+            writer.writerows(self.rows())
+
+
+@dataclass
+class GroupEffect:
+    # The mean of an effect over the participants with its percentile bootstrap confidence interval and the p-value
+    # of a two-sided sign-flip permutation test against no effect
+    mean: float
+    ci_low: float
+    ci_high: float
+    p_value: float
+    num_participants: int
+    num_resamples: int
+
+    # The resamples are drawn in chunks of a fixed size from seeds spawned by the seed of the study. So the result
+    # only depends on the seed, but not on the number of worker processes.
+    CHUNK_SIZE = 1000
+
+    def __str__(self):
+        return (
+            f"{1000 * self.mean:+.1f} ms [{1000 * self.ci_low:+.1f}, {1000 * self.ci_high:+.1f}], "
+            f"p = {self.p_value:.4f} (n = {self.num_participants})"
+        )
+
+    @staticmethod
+    def estimate(
+        effects: np.ndarray,
+        num_resamples: int = 10000,
+        seed: int = 42,
+        confidence: float = 0.95,
+        processes: Optional[int] = None,
+    ) -> "GroupEffect":
+        # Participants without an effect, i.e. missing a condition, are excluded
+        effects = np.asarray(effects, dtype=np.float64)
+        effects = effects[~np.isnan(effects)]
+        mean = float(np.mean(effects)) if len(effects) > 0 else math.nan
+        if len(effects) < 2:
+            return GroupEffect(mean, math.nan, math.nan, math.nan, len(effects), 0)
+
+        num_chunks = -(-num_resamples // GroupEffect.CHUNK_SIZE)
+        sizes = [GroupEffect.CHUNK_SIZE] * num_chunks
+        sizes[-1] = num_resamples - GroupEffect.CHUNK_SIZE * (num_chunks - 1)
+        seeds = np.random.SeedSequence(seed).spawn(num_chunks)
+        arguments = (repeat(effects), seeds, sizes)
+        if processes == 1:
+            chunks = list(map(GroupEffect._resample, *arguments))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                chunks = list(executor.map(GroupEffect._resample, *arguments))
+        bootstrap = np.concatenate([chunk[0] for chunk in chunks])
+        permutations = np.concatenate([chunk[1] for chunk in chunks])
+
+        alpha = (1.0 - confidence) / 2.0
+        ci_low, ci_high = np.quantile(bootstrap, (alpha, 1.0 - alpha))
+        # The observed effect counts as one of the permutations, so the p-value is never 0
+        extreme = np.count_nonzero(np.abs(permutations) >= abs(mean) - 1e-12)
+        return GroupEffect(
+            mean,
+            float(ci_low),
+            float(ci_high),
+            (extreme + 1) / (num_resamples + 1),
+            len(effects),
+            num_resamples,
+        )
+
+    @staticmethod
+    def _resample(
+        effects: np.ndarray, seed: np.random.SeedSequence, size: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # The means of the bootstrap samples of the participants and of the effects with random signs
+        generator = np.random.default_rng(seed)
+        samples = generator.integers(0, len(effects), size=(size, len(effects)))
+        bootstrap = effects[samples].mean(axis=1)
+        signs = generator.integers(0, 2, size=(size, len(effects)), dtype=np.int8)
+        permutations = np.where(signs == 1, effects, -effects).mean(axis=1)
+        return bootstrap, permutations
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d stats")
+    parser.add_argument(
+        "trials", type=str, help="The CSV table of the trials of 'bid2d analyze'."
+    )
+    parser.add_argument(
+        "-samples",
+        type=str,
+        help="The CSV file with the samples, for the instruction of each stimulus.",
+        required=True,
+    )
+    parser.add_argument(
+        "-inverted",
+        type=str,
+        nargs="*",
+        help="The participants who were instructed inversely, i.e. with '--invert_should_approach'.",
+        default=[],
+    )
+    parser.add_argument(
+        "-output",
+        type=str,
+        help="The resulting CSV table of the condition means per participant.",
+        default="participants.csv",
+    )
+    parser.add_argument(
+        "-min_rt",
+        type=float,
+        help="Exclude faster reactions, in seconds.",
+        default=0.15,
+    )
+    parser.add_argument(
+        "-max_rt",
+        type=float,
+        help="Exclude slower reactions, in seconds.",
+        default=2.0,
+    )
+    parser.add_argument(
+        "-outlier_sd",
+        type=float,
+        help="Exclude reactions further from the mean of their condition than this many standard deviations.",
+        default=2.5,
+    )
+    parser.add_argument(
+        "-trim",
+        type=float,
+        help="The fraction of the fastest and slowest reactions dropped by the trimmed means.",
+        default=0.1,
+    )
+    parser.add_argument(
+        "-resamples",
+        type=int,
+        help="The number of bootstrap samples and permutations.",
+        default=10000,
+    )
+    parser.add_argument(
+        "-seed", type=int, help="The seed for the random generator", default=42
+    )
+    parser.add_argument(
+        "-processes",
+        type=int,
+        help="The number of worker processes. Defaults to the number of CPUs.",
+        default=None,
+    )
+    arguments = parser.parse_args(arguments)
+
+    start = time.perf_counter()
+    should_approach = {
+        sample.get(Stimulus.NAME, sample[Stimulus.IMAGE_PATH].stem): sample[
+            Stimulus.SHOULD_APPROACH
+        ]
+        for sample in Stimulus.parse_csv(Path(arguments.samples))
+    }
+    trials = Trials.load_csv(arguments.trials, should_approach, arguments.inverted)
+    means = trials.condition_means(
+        min_rt=arguments.min_rt,
+        max_rt=arguments.max_rt,
+        outlier_sd=arguments.outlier_sd,
+        trim=arguments.trim,
+    )
+    means.save(arguments.output)
+
+    lines: List[str] = []
+    for label, effects in (
+        ("Congruency effect", means.effect()),
+        ("Trimmed congruency effect", means.effect(trimmed=True)),
+    ):
+        group = GroupEffect.estimate(
+            effects,
+            num_resamples=arguments.resamples,
+            seed=arguments.seed,
+            processes=arguments.processes,
+        )
+        lines.append(f"{label}: {group}")
+    accuracy = GroupEffect.estimate(
+        means.accuracy_effect(),
+        num_resamples=arguments.resamples,
+        seed=arguments.seed,
+        processes=arguments.processes,
+    )
+    lines.append(
+        f"Accuracy effect: {100 * accuracy.mean:+.1f}% [{100 * accuracy.ci_low:+.1f}, "
+        f"{100 * accuracy.ci_high:+.1f}], p = {accuracy.p_value:.4f}"
+    )
+    print("\n".join(lines))
+    print(
+        f"Analyzed {len(trials)} trials of {len(trials.participants)} participants in "
+        f"{time.perf_counter() - start:.2f}s.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 import csv
 from collections.abc import MutableMapping
 from pathlib import Path
-from typing import Any, Iterable, Union, Tuple
+from typing import Any, Dict, Iterable, Union, Tuple, Optional, TYPE_CHECKING
 
-from psychopy.visual import ImageStim, Window
+from PIL import Image
+
+from bid2d.util.texture_cache import TextureCache
+
+# Only import PsychoPy once a stimulus is shown. Loading the catalog does not require it.
+if TYPE_CHECKING:
+    from psychopy.visual import ImageStim, Window
+
+    from bid2d.catalog import CatalogIndex
 
 
 class Stimulus(MutableMapping):
@@ -12,13 +20,18 @@ class Stimulus(MutableMapping):
     SHOULD_APPROACH = "should_approach"
 
     def __init__(
-        self, image: Union[str, Path], should_approach: bool, **extra_data: Any
+        self,
+        image: Union[str, Path],
+        should_approach: bool,
+        check_file: bool = True,
+        **extra_data: Any,
     ):
         self.should_approach = should_approach
         self.extra_data = extra_data
 
+        # The check may be skipped for images already validated by a catalog index
         self._image = image if isinstance(image, Path) else Path(image)
-        if not self._image.is_file():
+        if check_file and not self._image.is_file():
             raise FileNotFoundError(f"Unable to find image '{self._image}'.")
         self.name = extra_data.pop(Stimulus.NAME, image.stem)
 
@@ -27,6 +40,10 @@ class Stimulus(MutableMapping):
     def __str__(self):
         return self.name
 
+    @property
+    def image(self) -> Path:
+        return self._image
+
     def __bool__(self):
         return self.should_approach
 
@@ -59,34 +76,94 @@ class Stimulus(MutableMapping):
         yield Stimulus.SHOULD_APPROACH
         yield from self.extra_data.keys()
 
-    def load(self, window: Window, stimulus_size: float = 0.5, **kwargs) -> ImageStim:
+    def load(
+        self,
+        window: "Window",
+        stimulus_size: float = 0.5,
+        cache: Optional[TextureCache] = None,
+        **kwargs,
+    ) -> "ImageStim":
         if self._loaded_image is None:
-            self._loaded_image = ImageStim(window, image=str(self._image), **kwargs)
-
-            # Scale stimulus relative to scene
-            scale_factor = [
-                value / max(self._loaded_image.size)
-                for value in self._loaded_image.size
-            ]
-            self._loaded_image.units = "norm"
-            self._loaded_image.size = (
-                stimulus_size * scale_factor[0],
-                stimulus_size * scale_factor[1],
-            )
+            if cache is None:
+                self._loaded_image = Stimulus._create_image(
+                    window, str(self._image), stimulus_size, **kwargs
+                )
+            else:
+                # Stimuli sharing the same image, i.e. copies for different conditions, share the texture, too
+                self._loaded_image = cache.get(
+                    (self._image, stimulus_size),
+                    lambda: Stimulus._create_image(
+                        window, cache.decode(self._image), stimulus_size, **kwargs
+                    ),
+                )
 
         return self._loaded_image
 
-    def draw(self, win: Window, **kwargs):
+    def draw(self, win: "Window", **kwargs):
         self.load(win, **kwargs).draw(win)
 
+    @staticmethod
+    def _create_image(
+        window: "Window", image: Any, stimulus_size: float, **kwargs
+    ) -> "ImageStim":
+        from psychopy.visual import ImageStim
+
+        loaded_image = ImageStim(window, image=image, **kwargs)
+
+        # Scale stimulus relative to scene
+        scale_factor = [value / max(loaded_image.size) for value in loaded_image.size]
+        loaded_image.units = "norm"
+        loaded_image.size = (
+            stimulus_size * scale_factor[0],
+            stimulus_size * scale_factor[1],
+        )
+        return loaded_image
+
+    @staticmethod
+    def norm_size(
+        image: Path, stimulus_size: float, window_size: Tuple[int, int]
+    ) -> Tuple[float, float]:
+        # The size '_create_image' scales the image to, but only the header of the image is read
+        with Image.open(image) as header:
+            width, height = header.size
+        native_size = (2 * width / window_size[0], 2 * height / window_size[1])
+        return (
+            stimulus_size * native_size[0] / max(native_size),
+            stimulus_size * native_size[1] / max(native_size),
+        )
+
     @staticmethod
     def from_csv(
         asset_file: Union[Path, str],
         delimiter: str = ",",
         dialect: str = "excel",
         invert_should_approach: bool = False,
+        index: Optional[Union[Path, str, "CatalogIndex"]] = None,
     ) -> Iterable["Stimulus"]:
         asset_file = asset_file if isinstance(asset_file, Path) else Path(asset_file)
+        if index is not None:
+            from bid2d.catalog import CatalogIndex
+
+            # The index checked that the images are still present and validated them, if they changed
+            index = index if isinstance(index, CatalogIndex) else CatalogIndex(index)
+            samples = index.rows(asset_file, delimiter=delimiter, dialect=dialect)
+        else:
+            samples = Stimulus.parse_csv(
+                asset_file, delimiter=delimiter, dialect=dialect
+            )
+
+        for sample in samples:
+            # Allow the invert operation for other group
+            if invert_should_approach:
+                sample[Stimulus.SHOULD_APPROACH] = not sample[Stimulus.SHOULD_APPROACH]
+
+            yield Stimulus(check_file=index is None, **sample)
+
+    @staticmethod
+    def parse_csv(
+        asset_file: Path, delimiter: str = ",", dialect: str = "excel"
+    ) -> Iterable[Dict[str, Any]]:
+        # The arguments of the stimuli, with the image path resolved relative to the catalog
         with asset_file.open(mode="r", newline="") as csv_file:
             reader = csv.DictReader(csv_file, dialect=dialect, delimiter=delimiter)
             for sample in reader:
@@ -98,24 +175,22 @@ class Stimulus(MutableMapping):
 
                 if path is None:
                     raise ValueError("Missing image path in CSV.")
-                if not path.is_absolute():
-                    sample[Stimulus.IMAGE_PATH] = Path(asset_file.parent, path)
+                sample[Stimulus.IMAGE_PATH] = (
+                    path if path.is_absolute() else Path(asset_file.parent, path)
+                )
 
                 sample[Stimulus.SHOULD_APPROACH] = (
                     sample.pop(Stimulus.SHOULD_APPROACH).lower().strip() == "true"
                 )
-
-                # Allow the invert operation for other group
-                if invert_should_approach:
-                    sample[Stimulus.SHOULD_APPROACH] = not sample[
-                        Stimulus.SHOULD_APPROACH
-                    ]
-
-                yield Stimulus(**sample)
+                yield sample
 
     def plain_data(self) -> Iterable[Tuple[str, Union[int, float, str, bool]]]:
         for key in self:
             value = self[key]
-            yield key, str(value) if not isinstance(value, int) and not isinstance(
-                value, float
-            ) and not isinstance(value, bool) else value
+            yield key, (
+                str(value)
+                if not isinstance(value, int)
+                and not isinstance(value, float)
+                and not isinstance(value, bool)
+                else value
+            )
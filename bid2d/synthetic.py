@@ -0,0 +1,366 @@
+import argparse
+import random
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from bid2d.logger import Logger
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+from bid2d.simulation import ResponseModel, SimulatedParticipant
+from bid2d.stimulus import Stimulus
+from bid2d.xdf import XdfWriter
+
+
+@dataclass
+class FillerStream:
+    # A regular stream recorded next to the experiment, i.e. EEG, filled with noise
+    name: str
+    channel_count: int
+    nominal_srate: float
+    channel_format: str = "float32"
+
+    @staticmethod
+    def parse(text: str) -> "FillerStream":
+        # 'NAME:CHANNELS:RATE', i.e. 'EEG:64:1000'
+        name, channel_count, nominal_srate = text.split(":")
+        return FillerStream(name, int(channel_count), float(nominal_srate))
+
+
+class RecordingGenerator:
+    # Writes synthetic sessions as LabRecorder would record them, without running the experiment. The trials are
+    # shuffled in blocks of the full design and the reactions follow the response models of the simulated
+    # participant: The first reaction is validated, the following ones are logged for every frame until the avatar
+    # arrives. Erroneous reactions are corrected, so the avatar turns around.
+    #
+    # The events and the filler streams are written trial by trial. Each filler stream repeats a block of noise, so
+    # neither the memory nor the cost of a chunk depend on the length of the session.
+    TRIAL_STREAM_ID = 1
+    REACTION_STREAM_ID = 2
+    CLOCK_OFFSET_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        stimuli: Sequence[Stimulus],
+        models: Dict[Tuple[Position, bool], ResponseModel],
+        fillers: Sequence[FillerStream] = (),
+        frame_rate: float = 60.0,
+        fixation_jitter: Tuple[float, float] = (0.75, 1.25),
+        movement_frames: int = 40,
+        compact_trials: bool = False,
+        chunk_duration: float = 1.0,
+    ):
+        self.stimuli = stimuli
+        self.models = models
+        self.fillers = fillers
+        self.frame_period = 1.0 / frame_rate
+        self.fixation_jitter = fixation_jitter
+        self.movement_frames = movement_frames
+        self.compact_trials = compact_trials
+        self.chunk_duration = chunk_duration
+
+        # The same names as the logger streams, so stimuli of the same name share an index
+        self._names = list(dict.fromkeys(stimulus.name for stimulus in stimuli))
+        self._name_codes = {name: index for index, name in enumerate(self._names)}
+
+    def write(self, file: Union[str, Path], num_trials: int, seed: int = 42) -> float:
+        # Returns the duration of the session in seconds
+        random_generator = random.Random(seed)
+        noise_generator = np.random.default_rng(seed)
+
+        with XdfWriter(file) as writer:
+            self._add_streams(writer)
+            fillers = [
+                (
+                    stream_id,
+                    filler,
+                    noise_generator.standard_normal(
+                        (
+                            max(1, round(self.chunk_duration * filler.nominal_srate)),
+                            filler.channel_count,
+                        )
+                    ).astype(filler.channel_format),
+                )
+                for stream_id, filler in enumerate(
+                    self.fillers, start=RecordingGenerator.REACTION_STREAM_ID + 1
+                )
+            ]
+
+            # The clock of the streams as 'pylsl.local_clock' after the machine ran for a while
+            timestamp = session_start = 1000.0
+            filler_time = session_start
+            next_clock_offset = session_start
+            order = np.zeros(0, dtype=np.int64)
+            block_trial = 0
+            for _ in range(num_trials):
+                if block_trial == len(order):
+                    order = noise_generator.permutation(
+                        len(self.stimuli) * len(Session.POSITIONS)
+                    )
+                    block_trial = 0
+                stimulus_index, position_code = divmod(
+                    int(order[block_trial]), len(Session.POSITIONS)
+                )
+                block_trial += 1
+
+                onset = timestamp + random_generator.uniform(*self.fixation_jitter)
+                timestamp = self._write_trial(
+                    writer,
+                    self.stimuli[stimulus_index],
+                    Session.POSITIONS[position_code],
+                    onset,
+                    random_generator,
+                )
+
+                # The filler streams catch up with the events in chunks
+                while filler_time + self.chunk_duration <= timestamp:
+                    for stream_id, filler, noise in fillers:
+                        writer.write_samples(
+                            stream_id,
+                            filler_time + np.arange(len(noise)) / filler.nominal_srate,
+                            noise,
+                        )
+                    filler_time += self.chunk_duration
+
+                while next_clock_offset <= timestamp:
+                    for stream_id in range(
+                        RecordingGenerator.TRIAL_STREAM_ID,
+                        RecordingGenerator.REACTION_STREAM_ID + 1 + len(fillers),
+                    ):
+                        writer.write_clock_offset(stream_id, next_clock_offset, 0.0)
+                    next_clock_offset += RecordingGenerator.CLOCK_OFFSET_INTERVAL
+
+        return timestamp - session_start
+
+    def _add_streams(self, writer: XdfWriter):
+        if self.compact_trials:
+            writer.add_stream(
+                RecordingGenerator.TRIAL_STREAM_ID,
+                Logger.TRIAL_STREAM_NAME,
+                "int32",
+                2,
+                desc=Session.trial_description(self._names),
+            )
+        else:
+            writer.add_stream(
+                RecordingGenerator.TRIAL_STREAM_ID,
+                Logger.TRIAL_STREAM_NAME,
+                "string",
+                2,
+            )
+        writer.add_stream(
+            RecordingGenerator.REACTION_STREAM_ID,
+            Logger.REACTION_STREAM_NAME,
+            "int32",
+            2,
+        )
+        for stream_id, filler in enumerate(
+            self.fillers, start=RecordingGenerator.REACTION_STREAM_ID + 1
+        ):
+            writer.add_stream(
+                stream_id,
+                filler.name,
+                filler.channel_format,
+                filler.channel_count,
+                nominal_srate=filler.nominal_srate,
+            )
+
+    def _write_trial(
+        self,
+        writer: XdfWriter,
+        stimulus: Stimulus,
+        position: Position,
+        onset: float,
+        random_generator: random.Random,
+    ) -> float:
+        # Returns the end of the trial
+        model = self.models[(position, stimulus.should_approach)]
+        correct = (
+            Reaction.Up
+            if Reaction.Up.validate(position, stimulus.should_approach)
+            == Reaction.CorrectReaction
+            else Reaction.Down
+        )
+        rt = model.sample_rt(random_generator)
+        response_frame = max(1, round(rt / self.frame_period))
+
+        # An erroneous reaction moves the avatar away until it is corrected, so it takes as long to come back
+        reactions = [correct.value] * self.movement_frames
+        first = Reaction.CorrectReaction
+        if random_generator.random() < model.error_rate:
+            correction_frames = max(
+                1, round(model.correction_delay / self.frame_period)
+            )
+            wrong = Reaction.Down if correct == Reaction.Up else Reaction.Up
+            reactions = (
+                [wrong.value] * correction_frames
+                + [correct.value] * correction_frames
+                + reactions
+            )
+            first = Reaction.IncorrectReaction
+        reactions[0] = first.value
+
+        num_frames = response_frame + np.arange(len(reactions), dtype=np.int32)
+        time_stamps = onset + num_frames * self.frame_period
+        time_stamps[0] = onset + rt
+        offset = onset + (num_frames[-1] + 1) * self.frame_period
+
+        sample = (
+            np.array(
+                [
+                    [
+                        self._name_codes[stimulus.name],
+                        Session.POSITIONS.index(position),
+                    ]
+                ],
+                dtype=np.int32,
+            )
+            if self.compact_trials
+            else [[stimulus.name, position.value]]
+        )
+        writer.write_samples(
+            RecordingGenerator.TRIAL_STREAM_ID, np.array([onset]), sample
+        )
+        writer.write_samples(
+            RecordingGenerator.REACTION_STREAM_ID,
+            time_stamps,
+            np.column_stack((num_frames, reactions)).astype(np.int32),
+        )
+        writer.write_samples(
+            RecordingGenerator.TRIAL_STREAM_ID, np.array([offset]), sample
+        )
+        return offset
+
+    @staticmethod
+    def synthetic_stimuli(num_stimuli: int) -> Sequence[Stimulus]:
+        # Half of them to approach. The images do not exist, as only the names are recorded.
+        return [
+            Stimulus(
+                Path(f"stimulus{i}.png"), should_approach=i % 2 == 0, check_file=False
+            )
+            for i in range(num_stimuli)
+        ]
+
+
+def main(arguments: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser("bid2d synthesize")
+    parser.add_argument(
+        "output", type=str, help="The directory for the recordings of the sessions."
+    )
+    parser.add_argument(
+        "-samples",
+        type=str,
+        help="The CSV file with the samples. The images are not required. Defaults to synthetic stimuli.",
+        default=None,
+    )
+    parser.add_argument(
+        "-stimuli",
+        type=int,
+        help="The number of synthetic stimuli, if no samples are given.",
+        default=100,
+    )
+    parser.add_argument(
+        "-participants", type=int, help="The number of sessions.", default=1
+    )
+    parser.add_argument(
+        "-trials", type=int, help="The number of trials per session.", default=400
+    )
+    parser.add_argument(
+        "-filler",
+        type=str,
+        nargs="*",
+        help="Regular streams of noise recorded next to the experiment as 'NAME:CHANNELS:RATE', "
+        "i.e. 'EEG:64:1000'.",
+        default=[],
+    )
+    parser.add_argument(
+        "-seed", type=int, help="The seed for the random generator", default=42
+    )
+    parser.add_argument(
+        "-frame_rate", type=float, help="The simulated refresh rate.", default=60.0
+    )
+    parser.add_argument(
+        "-rt_mean", type=float, help="The mean reaction time in seconds.", default=0.6
+    )
+    parser.add_argument(
+        "-rt_sd",
+        type=float,
+        help="The standard deviation of the reaction time in seconds.",
+        default=0.15,
+    )
+    parser.add_argument(
+        "-error_rate",
+        type=float,
+        help="The probability of an incorrect first reaction.",
+        default=0.05,
+    )
+    parser.add_argument(
+        "-avoid_slowdown",
+        type=float,
+        help="The additional mean reaction time in avoid trials in seconds.",
+        default=0.05,
+    )
+    parser.add_argument(
+        "--compact_trials",
+        dest="compact_trials",
+        action="store_true",
+        help="Record the trials as indices into the names and positions listed in the stream description.",
+        default=False,
+    )
+    parser.add_argument(
+        "--compress",
+        dest="compress",
+        action="store_true",
+        help="Write gzip compressed '.xdfz' files.",
+        default=False,
+    )
+    arguments = parser.parse_args(arguments)
+
+    stimuli = (
+        [
+            Stimulus(check_file=False, **sample)
+            for sample in Stimulus.parse_csv(Path(arguments.samples))
+        ]
+        if arguments.samples is not None
+        else RecordingGenerator.synthetic_stimuli(arguments.stimuli)
+    )
+    generator = RecordingGenerator(
+        stimuli,
+        SimulatedParticipant.create_models(
+            rt_mean=arguments.rt_mean,
+            rt_sd=arguments.rt_sd,
+            error_rate=arguments.error_rate,
+            avoid_slowdown=arguments.avoid_slowdown,
+        ),
+        fillers=[FillerStream.parse(filler) for filler in arguments.filler],
+        frame_rate=arguments.frame_rate,
+        compact_trials=arguments.compact_trials,
+    )
+
+    output = Path(arguments.output)
+    output.mkdir(parents=True, exist_ok=True)
+    for participant in range(arguments.participants):
+        file = (
+            output
+            / f"participant{participant:04d}.{'xdfz' if arguments.compress else 'xdf'}"
+        )
+        start = time.perf_counter()
+        duration = generator.write(
+            file, arguments.trials, seed=arguments.seed + participant
+        )
+        elapsed = time.perf_counter() - start
+        size = file.stat().st_size
+        print(
+            f"{file}: {arguments.trials} trials, {duration / 60:.1f} min, {size / 2**20:.1f} MiB in "
+            f"{elapsed:.3f}s ({size / 2**20 / elapsed:.0f} MiB/s)",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
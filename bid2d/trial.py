@@ -0,0 +1,154 @@
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from bid2d.stimulus import Stimulus
+from bid2d.util.constrained_shuffle import ConstrainedShuffle, SequenceConstraints
+
+
+class Trial:
+    # A lightweight view on a single trial. It references the shared stimulus instead of copying it.
+    __slots__ = ("table", "index", "stimulus", "codes")
+
+    def __init__(
+        self, table: "TrialTable", index: int, stimulus: Stimulus, codes: Tuple[int]
+    ):
+        self.table = table
+        self.index = index
+        self.stimulus = stimulus
+        self.codes = codes
+
+    def __str__(self):
+        return str(self.stimulus)
+
+    def __getitem__(self, key: str) -> Any:
+        condition = self.table.condition_index.get(key, None)
+        if condition is not None:
+            return self.table.levels[condition][self.codes[condition]]
+        return self.stimulus[key]
+
+    @property
+    def name(self) -> str:
+        return self.stimulus.name
+
+    @property
+    def should_approach(self) -> bool:
+        return self[Stimulus.SHOULD_APPROACH]
+
+    def load(self, window, **kwargs):
+        return self.stimulus.load(window, **kwargs)
+
+    def draw(self, window, **kwargs):
+        self.stimulus.draw(window, **kwargs)
+
+
+class TrialTable(Sequence):
+    # The full factorial design of stimuli and conditions in a (shuffled) order. Each trial is stored as a single
+    # integer indexing the design, i.e. the stimulus and the integer codes of the conditions. The 'Trial' objects
+    # are only created on access.
+    STIMULUS = "stimulus"
+
+    def __init__(
+        self,
+        stimuli: Sequence[Stimulus],
+        conditions: Dict[str, Sequence[Any]],
+        order: np.ndarray,
+    ):
+        self.stimuli = stimuli
+        self.condition_names = tuple(conditions.keys())
+        self.condition_index = {name: i for i, name in enumerate(self.condition_names)}
+        self.levels = tuple(tuple(levels) for levels in conditions.values())
+        self.order = order
+
+        # The number of design cells spanned by one step of the stimulus or the corresponding condition
+        self._strides = np.cumprod(
+            [1] + [len(levels) for levels in reversed(self.levels)]
+        )[::-1]
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Trial, List[Trial]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        cell = int(self.order[index])
+        stimulus_index, cell = divmod(cell, int(self._strides[0]))
+        codes = []
+        for stride in self._strides[1:]:
+            code, cell = divmod(cell, int(stride))
+            codes.append(code)
+        return Trial(self, index, self.stimuli[stimulus_index], tuple(codes))
+
+    @property
+    def stimulus_indices(self) -> np.ndarray:
+        return self.order // self._strides[0]
+
+    def codes(self, condition: str) -> np.ndarray:
+        i = self.condition_index[condition]
+        return (self.order // self._strides[i + 1]) % len(self.levels[i])
+
+    def factor_codes(self, factor: str) -> np.ndarray:
+        # The codes of a condition, of the stimulus itself or of an attribute of the stimuli, i.e. 'should_approach'
+        if factor in self.condition_index:
+            return self.codes(factor)
+        if factor == TrialTable.STIMULUS:
+            return self.stimulus_indices
+        codes: Dict[Any, int] = {}
+        return np.array(
+            [
+                codes.setdefault(stimulus[factor], len(codes))
+                for stimulus in self.stimuli
+            ],
+            dtype=np.int64,
+        )[self.stimulus_indices]
+
+    @staticmethod
+    def generate(
+        stimuli: Sequence[Stimulus],
+        seed: int = 42,
+        constraints: Optional[SequenceConstraints] = None,
+        **conditions: Sequence[Any],
+    ) -> "TrialTable":
+        num_cells = len(stimuli) * int(
+            np.prod([len(levels) for levels in conditions.values()], dtype=np.int64)
+        )
+        order = np.arange(num_cells, dtype=np.int64)
+        random_generator = random.Random(seed)
+        TrialTable.shuffle(order, random_generator)
+
+        # The constrained order is drawn from the shuffled one, while the order of unconstrained designs is kept
+        if constraints is not None:
+            constraints.validate(TrialTable.factors(stimuli, conditions))
+            design = TrialTable(
+                stimuli, conditions, np.arange(num_cells, dtype=np.int64)
+            )
+            ConstrainedShuffle(
+                {factor: design.factor_codes(factor) for factor in constraints.factors},
+                constraints,
+            ).shuffle(order, random_generator)
+        return TrialTable(stimuli, conditions, order)
+
+    @staticmethod
+    def factors(
+        stimuli: Sequence[Stimulus], condition_names: Sequence[str]
+    ) -> List[str]:
+        # The factors to constrain an order by: The conditions, the stimulus itself and the attributes all stimuli
+        # share, i.e. 'should_approach'
+        shared = [
+            key
+            for key in (stimuli[0] if len(stimuli) > 0 else ())
+            if all(key in stimulus for stimulus in stimuli)
+        ]
+        return [*condition_names, TrialTable.STIMULUS, *shared]
+
+    @staticmethod
+    def shuffle(order: np.ndarray, random_generator: random.Random):
+        # The Fisher-Yates shuffle of 'random.shuffle(x, random=...)', which was removed in Python 3.11. Using it
+        # keeps the trial orders of existing seeds.
+        values = order.tolist()
+        for i in reversed(range(1, len(values))):
+            j = int(random_generator.random() * (i + 1))
+            values[i], values[j] = values[j], values[i]
+        order[:] = values
@@ -0,0 +1,70 @@
+from typing import Tuple
+
+import numpy as np
+
+
+class AvatarMotion:
+    # The movement and collision logic of the avatar. It only requires 'pos', 'size' and 'speed' in normalized units
+    # and is therefore shared by the rendered and the simulated avatar.
+    #
+    # The position and the bounding rectangle (left, right, top, bottom) are preallocated vectors, which are updated
+    # in place, and 'edges' are zero-dimensional views of the rectangle. Neither moving the avatar nor testing it
+    # allocates in the frame loop. 'pos' refers to the position from 'place' on, a stimulus copying it on assignment
+    # has to pick up the moves itself.
+    SCREEN_SIGNS = np.array([-1.0, 1.0, 1.0, -1.0])
+    SCREEN_BOUNDS = np.ones(4)
+
+    position: np.ndarray = None
+    rect: np.ndarray = None
+    edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] = None
+
+    def place(self, x: float, y: float):
+        # Once per trial: Also picks up changes of the size and the speed
+        if self.position is None:
+            self.position = np.zeros(2, dtype=np.float64)
+            self.rect = np.zeros(4, dtype=np.float64)
+            self._position_step = np.zeros(2, dtype=np.float64)
+            self._rect_step = np.zeros(4, dtype=np.float64)
+            self.edges = tuple(self.rect[k, ...] for k in range(4))
+            self._signed_rect = np.zeros(4, dtype=np.float64)
+            self._inside = np.zeros(4, dtype=bool)
+
+        w, h = self.size
+        self.position[:] = x, y
+        self.rect[:] = x - w / 2, x + w / 2, y + h / 2, y - h / 2
+        self._position_step[1] = self.speed
+        self._rect_step[2:] = self.speed
+        self.pos = self.position
+
+    def up(self):
+        np.add(self.position, self._position_step, out=self.position)
+        np.add(self.rect, self._rect_step, out=self.rect)
+
+    def down(self):
+        np.subtract(self.position, self._position_step, out=self.position)
+        np.subtract(self.rect, self._rect_step, out=self.rect)
+
+    def is_on_screen(self) -> bool:
+        # The rectangle is within the screen if none of (-left, right, top, -bottom) exceeds 1. Reading the
+        # elements of a boolean array does not allocate, unlike 'ndarray.all'.
+        np.multiply(self.rect, AvatarMotion.SCREEN_SIGNS, out=self._signed_rect)
+        np.less_equal(self._signed_rect, AvatarMotion.SCREEN_BOUNDS, out=self._inside)
+        inside = self._inside
+        return bool(inside[0] & inside[1] & inside[2] & inside[3])
+
+    def is_overlapping(self, stimulus):
+        x1, x2, y1, y2 = self.rect.tolist()
+        o_x1, o_x2, o_y1, o_y2 = AvatarMotion._calculate_rect(stimulus)
+
+        if x1 > o_x2 or o_x1 > x2:
+            return False
+        elif y1 < o_y2 or o_y1 < y2:
+            return False
+        else:
+            return True
+
+    @staticmethod
+    def _calculate_rect(stimulus) -> Tuple[float, float, float, float]:
+        x, y = stimulus.pos
+        w, h = stimulus.size
+        return x - w / 2, x + w / 2, y + h / 2, y - h / 2
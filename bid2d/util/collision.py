@@ -0,0 +1,65 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+from bid2d.util.avatar_motion import AvatarMotion
+
+
+class BoundingBoxes:
+    # The bounding boxes of all objects of a trial, one row of (left, right, top, bottom) in normalized units each.
+    # The objects do not move during a trial, so the avatar is tested against all of them in a single vectorized
+    # operation per frame and the cost does not grow with the number of objects.
+    def __init__(self, rects: np.ndarray):
+        self.rects = rects
+        self._left, self._right, self._top, self._bottom = (
+            np.ascontiguousarray(column) for column in rects.T
+        )
+
+        # The results are written into preallocated buffers, so testing does not allocate in the frame loop. NumPy
+        # copies an input which is also the output, so none of them is updated in place.
+        self._tests = tuple(np.zeros((4, len(rects)), dtype=bool))
+        self._horizontal = np.zeros(len(rects), dtype=bool)
+        self._vertical = np.zeros(len(rects), dtype=bool)
+        self._overlapping = np.zeros(len(rects), dtype=bool)
+
+        # Whether any object overlaps is read from a cumulative OR, as 'ndarray.any' sets up a reduction which
+        # allocates
+        self._masked = np.zeros(len(rects), dtype=bool)
+        self._accumulated = np.zeros(len(rects), dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    def overlapping(self, avatar) -> np.ndarray:
+        # The same test as 'AvatarMotion.is_overlapping', for all objects at once. The edges of the avatar are
+        # compared as views, as converting them to scalars would allocate. The returned array is reused by the next
+        # call.
+        x1, x2, y1, y2 = (
+            avatar.edges
+            if isinstance(avatar, AvatarMotion)
+            else AvatarMotion._calculate_rect(avatar)
+        )
+        right_of_left, left_of_right, below_top, above_bottom = self._tests
+        np.greater_equal(self._right, x1, out=right_of_left)
+        np.less_equal(self._left, x2, out=left_of_right)
+        np.less_equal(self._bottom, y1, out=below_top)
+        np.greater_equal(self._top, y2, out=above_bottom)
+        np.logical_and(right_of_left, left_of_right, out=self._horizontal)
+        np.logical_and(below_top, above_bottom, out=self._vertical)
+        return np.logical_and(self._horizontal, self._vertical, out=self._overlapping)
+
+    def any(self, where: Optional[np.ndarray] = None) -> bool:
+        # Whether the avatar overlapped any of the objects, or any of the masked ones, in the last test
+        overlapping = self._overlapping
+        if where is not None:
+            overlapping = np.logical_and(overlapping, where, out=self._masked)
+        np.logical_or.accumulate(overlapping, out=self._accumulated)
+        return len(self._accumulated) > 0 and bool(self._accumulated[-1])
+
+    @staticmethod
+    def from_objects(objects: Sequence) -> "BoundingBoxes":
+        return BoundingBoxes(
+            np.array(
+                [AvatarMotion._calculate_rect(obj) for obj in objects], dtype=np.float64
+            ).reshape(-1, 4)
+        )
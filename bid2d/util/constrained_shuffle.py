@@ -0,0 +1,350 @@
+import random
+from dataclasses import dataclass, field
+from typing import Collection, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class SequenceConstraints:
+    # The limits on the order of a sequence of items, each described by the level of several factors. A factor in
+    # 'max_run' must not keep the same level for more consecutive items, i.e. 1 forbids immediate repeats. The
+    # transitions between the levels of a factor in 'balanced_transitions' occur as often as expected for a random
+    # order of the same items, give or take 'transition_tolerance'.
+    max_run: Dict[str, int] = field(default_factory=dict)
+    balanced_transitions: Sequence[str] = ()
+    transition_tolerance: float = 1.0
+    max_iterations: Optional[int] = None
+
+    @property
+    def factors(self) -> List[str]:
+        return list(dict.fromkeys([*self.max_run, *self.balanced_transitions]))
+
+    @staticmethod
+    def parse(
+        max_run: Sequence[str],
+        balanced_transitions: Sequence[str],
+        factors: Optional[Collection[str]] = None,
+    ) -> Optional["SequenceConstraints"]:
+        # The maximal runs as 'FACTOR=N', i.e. 'position=3'. Given the available factors, unknown ones are rejected,
+        # too. Without any constraint, the trials are only shuffled.
+        if len(max_run) == 0 and len(balanced_transitions) == 0:
+            return None
+        lengths = {}
+        for text in max_run:
+            factor, _, length = text.partition("=")
+            try:
+                lengths[factor] = int(length)
+            except ValueError:
+                lengths[factor] = 0
+            if len(factor) == 0 or lengths[factor] < 1:
+                raise ValueError(
+                    f"Invalid maximal run '{text}', expected 'FACTOR=N' with a positive N, i.e. 'position=3'."
+                )
+        constraints = SequenceConstraints(lengths, tuple(balanced_transitions))
+        if factors is not None:
+            constraints.validate(factors)
+        return constraints
+
+    def validate(self, factors: Collection[str]):
+        unknown = [factor for factor in self.factors if factor not in factors]
+        if len(unknown) > 0:
+            raise ValueError(
+                f"Unknown factors {', '.join(map(repr, unknown))}, expected any of "
+                f"{', '.join(map(repr, factors))}."
+            )
+
+
+class ConstrainedShuffle:
+    # Orders a shuffled sequence of items under the constraints in two passes, instead of shuffling again until a
+    # random order happens to satisfy them. First, the sequence is built item by item, each drawn at random from the
+    # remaining ones until one neither extends a run which is too long nor a transition ahead of its share. Only
+    # the last items may not fit anymore, so second, the remaining violations are repaired by swaps. Each swap is
+    # only evaluated on the few windows and transitions it touches, and swaps not increasing the violations are
+    # kept, so the search walks across plateaus.
+    MAX_DRAWS = 8
+    ITERATIONS_PER_ITEM = 50
+
+    def __init__(
+        self, factors: Mapping[str, np.ndarray], constraints: SequenceConstraints
+    ):
+        # The level of each factor per item
+        self.factors = factors
+        self.constraints = constraints
+        for factor, length in constraints.max_run.items():
+            if length < 1:
+                raise ValueError(f"The maximal run of '{factor}' must be positive.")
+
+    def shuffle(self, order: np.ndarray, random_generator: random.Random):
+        # Reorders the items in place, the same ones for the same random generator
+        if len(order) < 2:
+            return
+        for factor, length in self.constraints.max_run.items():
+            # The other items separate the runs of the most frequent level
+            _, counts = np.unique(
+                np.asarray(self.factors[factor])[order], return_counts=True
+            )
+            largest = int(counts.max())
+            if largest > length * (len(order) - largest + 1):
+                raise ValueError(
+                    f"{largest} of {len(order)} items share a level of '{factor}', too many for runs of at most "
+                    f"{length}."
+                )
+        items = order.tolist()
+        self._construct(items, random_generator)
+        self._repair(items, random_generator)
+        order[:] = items
+
+    def _construct(self, items: List[int], random_generator: random.Random):
+        n = len(items)
+        runs = [
+            (np.asarray(self.factors[factor]).tolist(), length)
+            for factor, length in self.constraints.max_run.items()
+        ]
+        run_levels = [None] * len(runs)
+        run_lengths = [0] * len(runs)
+        transitions = [
+            _Transitions(
+                np.asarray(self.factors[factor]), self.constraints.transition_tolerance
+            )
+            for factor in self.constraints.balanced_transitions
+        ]
+        previous = [-1] * len(transitions)
+        uniform = random_generator.random
+
+        for t in range(n):
+            # The levels continuing a run which is already as long as allowed
+            blocked = [
+                (levels, run_levels[f])
+                for f, (levels, length) in enumerate(runs)
+                if run_lengths[f] >= length
+            ]
+            # The transitions may only be ahead of their expected count so far by the tolerance
+            share = (t - 1) / (n - 1)
+            balanced = [
+                (
+                    transition.item_levels,
+                    transition.counts[a],
+                    transition.expected[a],
+                    transition.tolerance,
+                )
+                for transition, a in zip(transitions, previous)
+                if a >= 0
+            ]
+
+            chosen = None
+            for _ in range(ConstrainedShuffle.MAX_DRAWS):
+                r = t + int(uniform() * (n - t))
+                item = items[r]
+                for levels, level in blocked:
+                    if levels[item] == level:
+                        break
+                else:
+                    for levels, counts, expected, tolerance in balanced:
+                        b = levels[item]
+                        if counts[b] >= expected[b] * share + tolerance:
+                            break
+                    else:
+                        chosen = r
+                        break
+
+            # Otherwise, the first remaining item not extending a run from a random start, if there is any
+            if chosen is None and len(blocked) > 0:
+                offset = int(uniform() * (n - t))
+                for k in range(n - t):
+                    r = t + (offset + k) % (n - t)
+                    item = items[r]
+                    for levels, level in blocked:
+                        if levels[item] == level:
+                            break
+                    else:
+                        chosen = r
+                        break
+            if chosen is None:
+                chosen = t + int(uniform() * (n - t))
+
+            item = items[chosen]
+            items[t], items[chosen] = item, items[t]
+            for f, (levels, _) in enumerate(runs):
+                if levels[item] == run_levels[f]:
+                    run_lengths[f] += 1
+                else:
+                    run_levels[f] = levels[item]
+                    run_lengths[f] = 1
+            for k, transition in enumerate(transitions):
+                b = transition.item_levels[item]
+                if previous[k] >= 0:
+                    transition.counts[previous[k]][b] += 1
+                previous[k] = b
+
+    def _repair(self, items: List[int], random_generator: random.Random):
+        n = len(items)
+        levels = {
+            factor: np.asarray(self.factors[factor])[items].tolist()
+            for factor in self.constraints.factors
+        }
+        runs = [
+            (levels[factor], length)
+            for factor, length in self.constraints.max_run.items()
+        ]
+        max_length = max((length for _, length in runs), default=0)
+        transitions = [
+            _Transitions(
+                np.asarray(self.factors[factor]),
+                self.constraints.transition_tolerance,
+                levels[factor],
+            )
+            for factor in self.constraints.balanced_transitions
+        ]
+
+        def violates(start: int) -> int:
+            # The number of factors repeating the same level from 'start' for too long
+            count = 0
+            for values, length in runs:
+                if 0 <= start and start + length < n:
+                    value = values[start]
+                    if all(
+                        values[k] == value for k in range(start + 1, start + length + 1)
+                    ):
+                        count += 1
+            return count
+
+        def starts(i: int, j: int) -> List[int]:
+            # The windows containing either position
+            return sorted(
+                set(range(max(0, i - max_length), i + 1))
+                | set(range(max(0, j - max_length), j + 1))
+            )
+
+        def swap(i: int, j: int):
+            items[i], items[j] = items[j], items[i]
+            for values in levels.values():
+                values[i], values[j] = values[j], values[i]
+
+        violations = np.zeros(n, dtype=np.int64)
+        for values, length in runs:
+            violations[: n - length] += ConstrainedShuffle._long_runs(
+                np.asarray(values), length
+            )
+        conflicts = np.flatnonzero(violations).tolist()
+        cost = int(violations.sum()) + sum(
+            transition.cost() for transition in transitions
+        )
+        max_iterations = (
+            self.constraints.max_iterations
+            if self.constraints.max_iterations is not None
+            else ConstrainedShuffle.ITERATIONS_PER_ITEM * n
+        )
+        uniform = random_generator.random
+        for _ in range(max_iterations):
+            if cost <= 1e-9:
+                return
+
+            # Move an item of a run which is too long, or of a transition occurring too often
+            i = None
+            while len(conflicts) > 0 and i is None:
+                k = int(uniform() * len(conflicts))
+                start = conflicts[k]
+                if violates(start) > 0:
+                    i = min(n - 1, start + int(uniform() * (max_length + 1)))
+                else:
+                    conflicts[k] = conflicts[-1]
+                    conflicts.pop()
+            for _ in range(ConstrainedShuffle.MAX_DRAWS if i is None else 0):
+                edge = int(uniform() * (n - 1))
+                if any(transition.too_often(edge) for transition in transitions):
+                    i = edge + int(uniform() * 2)
+                    break
+            if i is None:
+                i = int(uniform() * n)
+            j = int(uniform() * n)
+            if i == j:
+                continue
+
+            touched = starts(i, j)
+            edges = sorted({e for e in (i - 1, i, j - 1, j) if 0 <= e < n - 1})
+            before = [transition.pairs(edges) for transition in transitions]
+            delta = -sum(violates(start) for start in touched)
+            swap(i, j)
+            delta += sum(violates(start) for start in touched)
+            after = [transition.pairs(edges) for transition in transitions]
+            delta += sum(
+                transition.move(old, new)
+                for transition, old, new in zip(transitions, before, after)
+            )
+
+            if delta <= 1e-9:
+                cost += delta
+                conflicts.extend(start for start in touched if violates(start) > 0)
+            else:
+                for transition, old, new in zip(transitions, before, after):
+                    transition.move(new, old)
+                swap(i, j)
+
+        if cost > 1e-9:
+            raise ValueError(
+                f"Unable to order {n} items under the constraints {self.constraints}."
+            )
+
+    @staticmethod
+    def _long_runs(values: np.ndarray, length: int) -> np.ndarray:
+        # Whether the level at each start is repeated by the next 'length' values
+        repeats = np.concatenate(([0], np.cumsum(values[1:] == values[:-1])))
+        return (repeats[length:] - repeats[:-length]) == length
+
+
+class _Transitions:
+    # The counts of the transitions between consecutive levels of a factor, as indices into its sorted levels. The
+    # expected count of the transition from a to b in a random order is c_a * (c_b - [a == b]) / n for the counts c
+    # of the levels.
+    def __init__(
+        self, codes: np.ndarray, tolerance: float, values: Optional[List[int]] = None
+    ):
+        # Either counts the transitions of the values in order, or starts without any
+        levels, indices, counts = np.unique(
+            codes, return_inverse=True, return_counts=True
+        )
+        self.tolerance = tolerance
+        self.item_levels = indices.tolist()
+        self.expected = (
+            counts[:, None] * (counts[None, :] - np.eye(len(counts))) / len(codes)
+        ).tolist()
+        self.values = values
+        self._index = {level: i for i, level in enumerate(levels.tolist())}
+        transitions = np.zeros((len(counts), len(counts)), dtype=np.int64)
+        if values is not None:
+            pairs = np.searchsorted(levels, values)
+            np.add.at(transitions, (pairs[:-1], pairs[1:]), 1)
+        self.counts = transitions.tolist()
+
+    def cost(self) -> float:
+        return sum(
+            self._excess(a, b)
+            for a in range(len(self.counts))
+            for b in range(len(self.counts))
+        )
+
+    def pairs(self, edges: Sequence[int]) -> List[Tuple[int, int]]:
+        return [
+            (self._index[self.values[edge]], self._index[self.values[edge + 1]])
+            for edge in edges
+        ]
+
+    def move(
+        self, old: Sequence[Tuple[int, int]], new: Sequence[Tuple[int, int]]
+    ) -> float:
+        # Replaces the transitions and returns the change of the excess
+        touched = set(old) | set(new)
+        before = sum(self._excess(a, b) for a, b in touched)
+        for a, b in old:
+            self.counts[a][b] -= 1
+        for a, b in new:
+            self.counts[a][b] += 1
+        return sum(self._excess(a, b) for a, b in touched) - before
+
+    def too_often(self, edge: int) -> bool:
+        a, b = self._index[self.values[edge]], self._index[self.values[edge + 1]]
+        return self.counts[a][b] > self.expected[a][b] + self.tolerance
+
+    def _excess(self, a: int, b: int) -> float:
+        return max(0.0, abs(self.counts[a][b] - self.expected[a][b]) - self.tolerance)
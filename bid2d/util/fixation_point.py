@@ -1,24 +1,57 @@
-import psychopy
+from typing import Callable, Optional, TYPE_CHECKING
+
+from bid2d.util.static_scene import StaticScene
+
+if TYPE_CHECKING:
+    from psychopy import visual
 
 
 class FixationPoint:
-    def __init__(self, x, y, radius, window: psychopy.visual.Window):
-        self._circle = psychopy.visual.Circle(window, radius=radius, edges=64)
+    def __init__(self, x, y, radius, window: "visual.Window"):
+        from psychopy import visual
+
+        self._circle = visual.Circle(window, radius=radius, edges=64)
         self._circle.units = "height"  # Otherwise, we draw a ellipse
         self._circle.pos = (x, y)
         self._circle.setColor((0, 0, 0), "rgb255")
         self._window = window
+        self._drawable = self._circle
 
     def draw(self):
-        self._circle.draw()
+        self._drawable.draw()
+
+    def capture(self, scene: StaticScene):
+        # Draw the circle from a captured texture instead of tessellating it every frame. Its position and radius
+        # are given in height units, i.e. relative to the height of the window.
+        width, height = self._window.size
+        x, y = self._circle.pos
+        radius = self._circle.radius
+        self._drawable = scene.capture(
+            "fixation_point",
+            [self._circle],
+            StaticScene.bounding_rect(
+                (2 * x * height / width, 2 * y),
+                (4 * radius * height / width, 4 * radius),
+                (width, height),
+            ),
+        )
 
-    def show(self, duration: float):
-        fixation_frame_durations = int((1 / self._window.monitorFramePeriod) * duration)
+    def show(self, duration: float, flip: Optional[Callable[[], float]] = None):
+        self.show_frames(
+            FixationPoint.num_frames(duration, self._window.monitorFramePeriod), flip
+        )
 
-        for _ in range(fixation_frame_durations):
+    def show_frames(self, num_frames: int, flip: Optional[Callable[[], float]] = None):
+        flip = flip if flip is not None else self._window.flip
+
+        for _ in range(num_frames):
             self.draw()
-            self._window.flip()
+            flip()
+
+    @staticmethod
+    def num_frames(duration: float, frame_period: float) -> int:
+        return int((1 / frame_period) * duration)
 
     @staticmethod
-    def create(window: psychopy.visual.Window, size: float = 0.01) -> "FixationPoint":
+    def create(window: "visual.Window", size: float = 0.01) -> "FixationPoint":
         return FixationPoint(0, 0, size, window)
@@ -0,0 +1,45 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+class FrameTimer:
+    @dataclass
+    class Summary:
+        num_frames: int
+        num_dropped: int
+        max_interval: float
+
+    def __init__(self, window, capacity: int = 2**16, tolerance: float = 0.5):
+        self._window = window
+        self._flip_times = np.zeros(capacity, dtype=np.float64)
+        self._num_flips = 0
+        self._last_flip = np.nan
+
+        # An interval longer than this threshold means at least one frame was dropped
+        self.frame_period = window.monitorFramePeriod
+        self.threshold = self.frame_period * (1.0 + tolerance)
+
+    def flip(self) -> float:
+        flip_time = self._window.flip()
+        if self._num_flips < len(self._flip_times):
+            self._flip_times[self._num_flips] = flip_time
+            self._num_flips += 1
+        self._last_flip = flip_time
+        return flip_time
+
+    def start(self):
+        # Include the last flip before the start. Otherwise, a late first frame would go unnoticed.
+        self._num_flips = 0
+        if not np.isnan(self._last_flip):
+            self._flip_times[0] = self._last_flip
+            self._num_flips = 1
+
+    def stop(self) -> "FrameTimer.Summary":
+        intervals = np.diff(self._flip_times[: self._num_flips])
+        late = intervals[intervals > self.threshold]
+        return FrameTimer.Summary(
+            num_frames=len(intervals),
+            num_dropped=int(np.sum(np.round(late / self.frame_period) - 1)),
+            max_interval=float(intervals.max()) if len(intervals) > 0 else 0.0,
+        )
@@ -0,0 +1,48 @@
+from collections import deque
+from typing import Callable, Collection, Deque, Optional, Tuple
+
+# The key symbols of pyglet, which are defined here to keep the keyboard handling usable without a display
+UP = 0xFF52
+DOWN = 0xFF54
+
+
+class KeyState(dict):
+    # Equivalent to 'pyglet.window.key.KeyStateHandler': The window (or a simulated participant) calls the handlers
+    # and the experiment queries the state of the keys.
+    #
+    # Given a clock, each key press is additionally timestamped as soon as its event is dispatched. The presses are
+    # appended to a deque, which is safe without locking for a single producer and consumer, and drained by the frame
+    # loop. So the first of several keys pressed within a frame is known, and the timestamp does not depend on
+    # counting frames, which may be dropped.
+    #
+    # However, pyglet dispatches the events of the window only when it is flipped, and the operating system does not
+    # tell when a key was pressed. A press is therefore timestamped on the first flip after it happened, i.e. late
+    # by up to a frame period and by half of it on average (8 ms at 60 Hz). The simulated participant reproduces
+    # this and its test measures it.
+    def __init__(self, clock: Optional[Callable[[], float]] = None):
+        super().__init__()
+        self.clock = clock
+        self.presses: Deque[Tuple[int, float]] = deque()
+
+    def on_key_press(self, symbol: int, modifiers: int):
+        if self.clock is not None:
+            self.presses.append((symbol, self.clock()))
+        self[symbol] = True
+
+    def on_key_release(self, symbol: int, modifiers: int):
+        self[symbol] = False
+
+    def __getitem__(self, symbol: int) -> bool:
+        return self.get(symbol, False)
+
+    def first_press(self, symbols: Collection[int]) -> Optional[Tuple[int, float]]:
+        # Drain the pending presses and return the earliest one of the given keys
+        first = None
+        while self.presses:
+            press = self.presses.popleft()
+            if first is None and press[0] in symbols:
+                first = press
+        return first
+
+    def clear_presses(self):
+        self.presses.clear()
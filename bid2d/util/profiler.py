@@ -0,0 +1,170 @@
+import cProfile
+import functools
+import itertools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, TypeVar, Union
+
+import numpy as np
+
+T = TypeVar("T", bound=Callable)
+
+
+class Profiler:
+    # Records spans of time with nanosecond resolution into preallocated arrays and exports them as a Chrome trace,
+    # which Perfetto (or chrome://tracing) shows as a timeline per thread. The functions to measure are wrapped once
+    # before use, so the code does not pay anything without a profiler. Once the buffer is full, further spans are
+    # dropped and only counted.
+    #
+    # Optionally, the session is profiled by cProfile and the allocations are traced, too. Their results are
+    # written next to the trace with the suffixes '.prof' and '.tracemalloc'.
+    CAPACITY = 1 << 20
+
+    def __init__(
+        self,
+        file: Union[str, Path],
+        capacity: int = CAPACITY,
+        cprofile: bool = False,
+        trace_allocations: bool = False,
+    ):
+        self.file = file if isinstance(file, Path) else Path(file)
+        self.capacity = capacity
+        self._names: Dict[str, int] = {}
+        self._codes = np.zeros(capacity, dtype=np.int32)
+        self._starts = np.zeros(capacity, dtype=np.int64)
+        self._ends = np.zeros(capacity, dtype=np.int64)
+        self._threads = np.zeros(capacity, dtype=np.uint64)
+        self._thread_names: Dict[int, str] = {}
+
+        # Taking the next index is atomic, so spans may be recorded from several threads
+        self._indices = itertools.count()
+        self._size: Optional[int] = None
+        self._origin = time.perf_counter_ns()
+
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self._trace_allocations = trace_allocations
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return min(self._size, self.capacity) if self._size is not None else 0
+
+    @property
+    def num_dropped(self) -> int:
+        return max(0, self._size - self.capacity) if self._size is not None else 0
+
+    def start(self):
+        if self._trace_allocations:
+            tracemalloc.start()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def code(self, name: str) -> int:
+        code = self._names.get(name, None)
+        if code is None:
+            code = self._names[name] = len(self._names)
+        return code
+
+    def record(self, code: int, start: int, end: int):
+        index = next(self._indices)
+        if index < self.capacity:
+            self._codes[index] = code
+            self._starts[index] = start
+            self._ends[index] = end
+            thread = threading.get_ident()
+            self._threads[index] = thread
+
+            # The threads may have finished before the trace is written
+            if thread not in self._thread_names:
+                self._thread_names[thread] = threading.current_thread().name
+
+    def clear(self):
+        # Discards the recorded spans, unless they were written already
+        if self._size is None:
+            self._indices = itertools.count()
+
+    def wrap(self, name: str, function: T) -> T:
+        code = self.code(name)
+        record = self.record
+        clock = time.perf_counter_ns
+
+        @functools.wraps(function)
+        def profiled(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(code, start, clock())
+
+        return profiled
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(self.code(name), start, time.perf_counter_ns())
+
+    def close(self):
+        # Only the first call stops the profiling and writes the results
+        if self._size is not None:
+            return
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.file.with_suffix(".prof"))
+        if self._trace_allocations:
+            tracemalloc.take_snapshot().dump(str(self.file.with_suffix(".tracemalloc")))
+            tracemalloc.stop()
+
+        self._size = next(self._indices)
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file, "w") as stream:
+            json.dump(self.trace(), stream)
+
+    def trace(self) -> Dict:
+        # Complete events in microseconds since the creation of the profiler, one track per thread. The spans are
+        # complete once the profiler was closed.
+        size = len(self)
+        names = list(self._names)
+        idents, threads = np.unique(self._threads[:size], return_inverse=True)
+        starts = ((self._starts[:size] - self._origin) / 1000.0).tolist()
+        durations = ((self._ends[:size] - self._starts[:size]) / 1000.0).tolist()
+
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 0,
+                "tid": tid,
+                "args": {"name": self._thread_names.get(ident, str(ident))},
+            }
+            for tid, ident in enumerate(idents.tolist())
+        ]
+        events.extend(
+            {
+                "name": names[code],
+                "ph": "X",
+                "ts": start,
+                "dur": duration,
+                "pid": 0,
+                "tid": tid,
+            }
+            for code, start, duration, tid in zip(
+                self._codes[:size].tolist(), starts, durations, threads.tolist()
+            )
+        )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ns",
+            "otherData": {"num_dropped": self.num_dropped},
+        }
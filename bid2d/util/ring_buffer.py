@@ -0,0 +1,56 @@
+from typing import Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class RingBuffer:
+    # A preallocated single-producer/single-consumer queue of fixed-size records. The producer only ever advances
+    # 'head', the consumer only 'tail'. Integer assignment is atomic in CPython, so no lock is required. Next to its
+    # timestamp, each record keeps the time it was enqueued, which differs for events timestamped by the caller.
+    def __init__(self, capacity: int, channel_count: int, dtype: Optional[Any] = None):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.enqueued = np.zeros(capacity, dtype=np.float64)
+        self.values = (
+            np.zeros((capacity, channel_count), dtype=dtype)
+            if dtype is not None
+            else [None] * capacity
+        )
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self) -> int:
+        return self.head - self.tail
+
+    def put(
+        self, sample: Sequence[Any], timestamp: float, enqueued: Optional[float] = None
+    ) -> bool:
+        depth = self.head - self.tail
+        if depth >= self.capacity:
+            self.dropped += 1
+            return False
+
+        index = self.head % self.capacity
+        self.values[index] = sample
+        self.timestamps[index] = timestamp
+        self.enqueued[index] = enqueued if enqueued is not None else timestamp
+        self.head += 1
+
+        if depth + 1 > self.max_depth:
+            self.max_depth = depth + 1
+        return True
+
+    def peek(self) -> Tuple[Any, np.ndarray]:
+        # Returns the oldest contiguous block of records. Call 'release' after they were consumed.
+        start = self.tail % self.capacity
+        end = start + min(self.head - self.tail, self.capacity - start)
+        return self.values[start:end], self.timestamps[start:end]
+
+    def oldest_enqueued(self) -> float:
+        # When the oldest record was enqueued
+        return float(self.enqueued[self.tail % self.capacity])
+
+    def release(self, count: int):
+        self.tail += count
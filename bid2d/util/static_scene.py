@@ -0,0 +1,56 @@
+from typing import Any, Dict, Hashable, List, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from psychopy import visual
+
+
+class StaticScene:
+    # Captures stimuli which do not change during a trial once into a single buffer image. Each frame then only draws
+    # that texture instead of every stimulus on its own. The capture is limited to the bounding box of the stimuli,
+    # so the texture is not larger than the stimuli themselves.
+    def __init__(self, window: "visual.Window"):
+        self._window = window
+        self._scenes: Dict[Hashable, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._scenes)
+
+    def capture(
+        self, key: Hashable, stimuli: Sequence[Any], rect: List[float]
+    ) -> "visual.BufferImageStim":
+        scene = self._scenes.get(key, None)
+        if scene is None:
+            from psychopy import visual
+
+            scene = visual.BufferImageStim(
+                self._window, stim=list(stimuli), rect=rect, interpolate=False
+            )
+
+            # Capturing draws into the back buffer, which must not show up in the next frame
+            self._window.clearBuffer()
+            self._scenes[key] = scene
+        return scene
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self._scenes.get(key, default)
+
+    def release(self, key: Hashable):
+        # The texture is freed with the last reference to the scene
+        self._scenes.pop(key, None)
+
+    @staticmethod
+    def bounding_rect(
+        center: Tuple[float, float],
+        size: Tuple[float, float],
+        window_size: Tuple[int, int],
+        margin: int = 1,
+    ) -> List[float]:
+        # In normalized units as [left, top, right, bottom], extended by a margin in pixels for the antialiasing
+        width = size[0] / 2 + 2 * margin / window_size[0]
+        height = size[1] / 2 + 2 * margin / window_size[1]
+        return [
+            max(-1.0, center[0] - width),
+            min(1.0, center[1] + height),
+            min(1.0, center[0] + width),
+            max(-1.0, center[1] - height),
+        ]
@@ -0,0 +1,121 @@
+import math
+from typing import List
+
+
+class RunningStatistics:
+    # The count, mean and variance of a stream of values in constant memory (Welford's algorithm). The update is
+    # numerically stable, unlike accumulating the sum of squares.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def merge(self, other: "RunningStatistics") -> "RunningStatistics":
+        # The statistics of both streams together (Chan et al.), i.e. of several conditions or stations
+        merged = RunningStatistics()
+        merged.count = self.count + other.count
+        if merged.count > 0:
+            delta = other.mean - self.mean
+            merged.mean = self.mean + delta * other.count / merged.count
+            merged._m2 = (
+                self._m2
+                + other._m2
+                + delta**2 * self.count * other.count / merged.count
+            )
+        return merged
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def sd(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def standard_error(self) -> float:
+        return math.sqrt(self.variance / self.count) if self.count > 1 else math.nan
+
+
+class P2Quantile:
+    # Estimates a quantile of a stream of values from five markers (the P² algorithm by Jain and Chlamtac), so
+    # neither memory nor the cost of an update grow with the number of values. The markers are the minimum, the
+    # maximum, the quantile itself and the quantiles halfway towards the extremes. Their heights are adjusted by
+    # piecewise-parabolic interpolation whenever a marker drifts from its desired position.
+    def __init__(self, p: float):
+        if not 0.0 < p < 1.0:
+            raise ValueError(f"The quantile {p} is not in (0, 1).")
+        self.p = p
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1.0 + 2.0 * p, 1.0 + 4.0 * p, 3.0 + 2.0 * p, 5.0]
+        self._increments = [0.0, p / 2.0, p, (1.0 + p) / 2.0, 1.0]
+
+    def add(self, value: float):
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        # Find the cell of the value, extending the extremes if necessary
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+
+        positions = self._positions
+        for i in range(cell + 1, 5):
+            positions[i] += 1.0
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        for i in (1, 2, 3):
+            offset = self._desired[i] - positions[i]
+            if (offset >= 1.0 and positions[i + 1] - positions[i] > 1.0) or (
+                offset <= -1.0 and positions[i - 1] - positions[i] < -1.0
+            ):
+                step = 1 if offset > 0.0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (
+                        positions[i + step] - positions[i]
+                    )
+                heights[i] = height
+                positions[i] += step
+
+    @property
+    def value(self) -> float:
+        if self.count == 0:
+            return math.nan
+        elif self.count > 5:
+            return self._heights[2]
+
+        # Interpolate between the few values seen so far
+        rank = self.p * (self.count - 1)
+        lower = math.floor(rank)
+        upper = min(lower + 1, self.count - 1)
+        return self._heights[lower] + (rank - lower) * (
+            self._heights[upper] - self._heights[lower]
+        )
+
+    def _parabolic(self, i: int, step: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
@@ -0,0 +1,62 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from PIL import Image
+
+
+class TextureCache:
+    # Shares the textures of stimuli between all trials showing them. The images are decoded in a thread pool,
+    # while the textures are created by the caller on the thread owning the OpenGL context.
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        decode: Optional[Callable[[Path], Image.Image]] = None,
+    ):
+        self._decode = decode if decode is not None else TextureCache.decode_file
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="TextureCache"
+        )
+        self._decoded: Dict[Path, Future] = {}
+        self._textures: Dict[Hashable, Any] = {}
+
+    def __enter__(self) -> "TextureCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._textures)
+
+    def prefetch(self, paths: Iterable[Path]):
+        for path in paths:
+            self._decode_async(path)
+
+    def decode(self, path: Path) -> Image.Image:
+        return self._decode_async(path).result()
+
+    def get(self, key: Hashable, create: Callable[[], Any]) -> Any:
+        texture = self._textures.get(key, None)
+        if texture is None:
+            texture = create()
+            self._textures[key] = texture
+        return texture
+
+    def close(self):
+        # The decoded images are only required until their texture was created
+        self._executor.shutdown(wait=True)
+        self._decoded.clear()
+
+    def _decode_async(self, path: Path) -> Future:
+        future = self._decoded.get(path, None)
+        if future is None:
+            future = self._executor.submit(self._decode, path)
+            self._decoded[path] = future
+        return future
+
+    @staticmethod
+    def decode_file(path: Path) -> Image.Image:
+        image = Image.open(path)
+        image.load()
+        return image
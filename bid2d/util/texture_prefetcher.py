@@ -0,0 +1,131 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence
+
+from bid2d.util.texture_cache import TextureCache
+
+
+class TexturePrefetcher:
+    # Keeps only the textures of a sliding window of trials resident, i.e. the current and the next 'window' ones,
+    # instead of those of all stimuli. Given the image of each trial in order, the images of the next trials are
+    # decoded in a background thread, while the texture of a trial is created by the caller on the thread owning
+    # the OpenGL context before its fixation cross. Textures not shown within the window are released. A trial may
+    # show several images, i.e. its distractors, whose keys are then consecutive, 'keys_per_trial' each.
+    @dataclass
+    class Statistics:
+        num_created: int = 0
+        num_released: int = 0
+        max_resident: int = 0
+        # Trials whose image was not decoded yet when their texture was created, and the time spent waiting
+        num_waits: int = 0
+        wait_time: float = 0.0
+        # Trials whose texture was not resident when their stimulus appeared
+        num_misses: int = 0
+
+    def __init__(
+        self,
+        keys: Sequence[Hashable],
+        window: int,
+        create: Callable[[Hashable, Any], Any],
+        decode: Optional[Callable[[Hashable], Any]] = None,
+        release: Optional[Callable[[Hashable, Any], None]] = None,
+        max_workers: int = 1,
+        keys_per_trial: int = 1,
+    ):
+        if window < 1:
+            raise ValueError(f"The window of {window} trials is empty.")
+        if keys_per_trial < 1 or len(keys) % keys_per_trial != 0:
+            raise ValueError(
+                f"The {len(keys)} keys are not split into trials of {keys_per_trial}."
+            )
+        self.keys = keys
+        self.window = window
+        self.keys_per_trial = keys_per_trial
+        self.statistics = TexturePrefetcher.Statistics()
+
+        self._create = create
+        self._decode = decode if decode is not None else TextureCache.decode_file
+        self._release = release
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="TexturePrefetcher"
+        )
+        self._decoded: Dict[Hashable, Future] = {}
+        self._textures: Dict[Hashable, Any] = {}
+
+    def __enter__(self) -> "TexturePrefetcher":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._textures)
+
+    def prepare(self, index: int):
+        # Before the fixation cross of the trial: Releases the textures of finished trials, creates the textures of
+        # this trial and decodes the images of the next ones while the fixation cross and the trial are shown.
+        start = index * self.keys_per_trial
+        end = start + self.keys_per_trial
+        upcoming = set(self.keys[start : end + self.window * self.keys_per_trial])
+        for key in [key for key in self._textures if key not in upcoming]:
+            texture = self._textures.pop(key)
+            if self._release is not None:
+                self._release(key, texture)
+            self.statistics.num_released += 1
+        for key in [key for key in self._decoded if key not in upcoming]:
+            self._decoded.pop(key).cancel()
+
+        # The images of this trial are all decoded before the first texture is created
+        for key in self.keys[start:end]:
+            if key not in self._textures:
+                self._decode_async(key)
+        for key in self.keys[start:end]:
+            if key in self._textures:
+                continue
+            future = self._decoded[key]
+            if not future.done():
+                wait_start = time.perf_counter()
+                future.result()
+                self.statistics.num_waits += 1
+                self.statistics.wait_time += time.perf_counter() - wait_start
+
+            # The decoded image is only required until its texture was created
+            self._textures[key] = self._create(key, self._decoded.pop(key).result())
+            self.statistics.num_created += 1
+            self.statistics.max_resident = max(
+                self.statistics.max_resident, len(self._textures)
+            )
+
+        for next_key in self.keys[end : end + self.window * self.keys_per_trial]:
+            if next_key not in self._textures:
+                self._decode_async(next_key)
+
+    def get(self, index: int, k: int = 0) -> Any:
+        # When the k-th image of the trial appears. Only falls back to loading if the trial was not prepared.
+        key = self.keys[index * self.keys_per_trial + k]
+        texture = self._textures.get(key, None)
+        if texture is None:
+            self.statistics.num_misses += 1
+            self.prepare(index)
+            texture = self._textures[key]
+        return texture
+
+    def close(self):
+        # The decodes which did not start yet are cancelled, as 'cancel_futures' requires Python 3.9
+        for future in self._decoded.values():
+            future.cancel()
+        self._decoded.clear()
+        self._executor.shutdown(wait=True)
+        for key, texture in self._textures.items():
+            if self._release is not None:
+                self._release(key, texture)
+            self.statistics.num_released += 1
+        self._textures.clear()
+
+    def _decode_async(self, key: Hashable) -> Future:
+        future = self._decoded.get(key, None)
+        if future is None:
+            future = self._executor.submit(self._decode, key)
+            self._decoded[key] = future
+        return future
@@ -0,0 +1,397 @@
+import gzip
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Collection, Dict, List, Union
+from xml.etree import ElementTree
+
+import numpy as np
+
+
+class XdfChunk:
+    FILE_HEADER = 1
+    STREAM_HEADER = 2
+    SAMPLES = 3
+    CLOCK_OFFSET = 4
+    BOUNDARY = 5
+    STREAM_FOOTER = 6
+
+    # Chunks which carry a stream id right after their tag
+    WITH_STREAM_ID = (STREAM_HEADER, SAMPLES, CLOCK_OFFSET, STREAM_FOOTER)
+
+
+@dataclass
+class XdfStream:
+    FORMATS = {
+        "double64": np.float64,
+        "float32": np.float32,
+        "int64": np.int64,
+        "int32": np.int32,
+        "int16": np.int16,
+        "int8": np.int8,
+    }
+
+    stream_id: int
+    header: ElementTree.Element
+    time_stamps: np.ndarray = field(default_factory=lambda: np.zeros((0,)))
+    time_series: Union[np.ndarray, List[List[str]]] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.name = self.header.findtext("name")
+        self.channel_format = self.header.findtext("channel_format")
+        self.channel_count = int(self.header.findtext("channel_count"))
+        self.nominal_srate = float(self.header.findtext("nominal_srate", "0"))
+        self.dtype = (
+            np.dtype(XdfStream.FORMATS[self.channel_format]).newbyteorder("<")
+            if self.channel_format != "string"
+            else None
+        )
+        # A sample with its own timestamp, as LSL writes them for irregular streams
+        self._record = (
+            np.dtype(
+                [
+                    ("flag", "u1"),
+                    ("timestamp", "<f8"),
+                    ("values", self.dtype, (self.channel_count,)),
+                ]
+            )
+            if self.dtype is not None
+            else None
+        )
+
+        self._stamp_chunks = []
+        self._value_chunks = []
+        self._clock_times = []
+        self._clock_values = []
+        self._last_timestamp = 0.0
+        self._time_delta = 1.0 / self.nominal_srate if self.nominal_srate > 0 else 0.0
+
+    @property
+    def description(self) -> ElementTree.Element:
+        return self.header.find("desc")
+
+    def _read_samples(self, content: bytes):
+        view = memoryview(content)
+        num_samples, offset = XdfReader.parse_varlen_int(view, 0)
+
+        # Fast path: every sample carries its own timestamp, as LSL does for irregular streams
+        if self._record is not None:
+            if len(view) - offset == num_samples * self._record.itemsize:
+                samples = np.frombuffer(view, dtype=self._record, offset=offset)
+                if (samples["flag"] == 8).all():
+                    self._append(samples["timestamp"], samples["values"])
+                    return
+
+        time_stamps = np.empty(num_samples)
+        values = (
+            np.empty((num_samples, self.channel_count), dtype=self.dtype)
+            if self.dtype is not None
+            else []
+        )
+        sample_size = (
+            0 if self.dtype is None else self.dtype.itemsize * self.channel_count
+        )
+        for i in range(num_samples):
+            if view[offset] != 0:
+                (self._last_timestamp,) = struct.unpack_from("<d", view, offset + 1)
+                offset += 9
+            else:
+                self._last_timestamp += self._time_delta
+                offset += 1
+            time_stamps[i] = self._last_timestamp
+
+            if self.dtype is not None:
+                values[i] = np.frombuffer(
+                    view, dtype=self.dtype, count=self.channel_count, offset=offset
+                )
+                offset += sample_size
+            else:
+                sample = []
+                for _ in range(self.channel_count):
+                    length, offset = XdfReader.parse_varlen_int(view, offset)
+                    sample.append(
+                        bytes(view[offset : offset + length]).decode(errors="replace")
+                    )
+                    offset += length
+                values.append(sample)
+        self._append(time_stamps, values)
+
+    def _append(self, time_stamps: np.ndarray, values: Union[np.ndarray, List]):
+        if len(time_stamps) > 0:
+            self._last_timestamp = float(time_stamps[-1])
+        self._stamp_chunks.append(np.array(time_stamps, dtype=np.float64))
+        self._value_chunks.append(values)
+
+    def _read_clock_offset(self, content: bytes):
+        collection_time, offset_value = struct.unpack_from("<dd", content)
+        self._clock_times.append(collection_time)
+        self._clock_values.append(offset_value)
+
+    def _finalize(self, synchronize_clocks: bool):
+        self.time_stamps = (
+            np.concatenate(self._stamp_chunks) if self._stamp_chunks else np.zeros((0,))
+        )
+        if self.dtype is not None:
+            self.time_series = (
+                np.concatenate(self._value_chunks)
+                if self._value_chunks
+                else np.zeros((0, self.channel_count), dtype=self.dtype)
+            )
+        else:
+            self.time_series = [
+                sample for chunk in self._value_chunks for sample in chunk
+            ]
+        self._stamp_chunks, self._value_chunks = [], []
+
+        # Map the timestamps into the clock domain of the recorder by a linear fit of the offsets
+        if synchronize_clocks and self._clock_times and len(self.time_stamps) > 0:
+            clock_times = np.asarray(self._clock_times)
+            clock_values = np.asarray(self._clock_values)
+            if len(clock_times) == 1 or np.ptp(clock_times) == 0:
+                self.time_stamps = self.time_stamps + np.mean(clock_values)
+            else:
+                slope, intercept = np.polyfit(clock_times, clock_values, deg=1)
+                self.time_stamps = self.time_stamps + (
+                    intercept + slope * self.time_stamps
+                )
+
+
+class XdfReader:
+    MAGIC = b"XDF:"
+
+    def __init__(self, file: Union[str, Path]):
+        self.file = file if isinstance(file, Path) else Path(file)
+
+    def load(
+        self, stream_names: Collection[str], synchronize_clocks: bool = True
+    ) -> Dict[str, XdfStream]:
+        # Walk through the chunks once and decode only the requested streams. The samples of all other streams,
+        # i.e. EEG recorded next to the experiment, are skipped by seeking without being read into memory. A
+        # recording cut off within a chunk keeps what was decoded before it.
+        streams_by_id: Dict[int, XdfStream] = {}
+
+        with self._open() as file:
+            while True:
+                try:
+                    chunk_length = XdfReader.read_varlen_int(file)
+                except EOFError:
+                    break
+
+                header = file.read(2)
+                if len(header) < 2:
+                    break
+                (tag,) = struct.unpack("<H", header)
+                content_length = chunk_length - 2
+
+                if tag not in XdfChunk.WITH_STREAM_ID:
+                    file.seek(content_length, 1)
+                    continue
+
+                stream_id = file.read(4)
+                if len(stream_id) < 4:
+                    break
+                (stream_id,) = struct.unpack("<I", stream_id)
+                content_length -= 4
+                stream = streams_by_id.get(stream_id, None)
+
+                if tag == XdfChunk.STREAM_HEADER:
+                    content = file.read(content_length)
+                    if len(content) < content_length:
+                        break
+                    info = ElementTree.fromstring(content)
+                    if info.findtext("name") in stream_names:
+                        streams_by_id[stream_id] = XdfStream(stream_id, info)
+                elif stream is None:
+                    file.seek(content_length, 1)
+                elif tag == XdfChunk.SAMPLES:
+                    content = file.read(content_length)
+                    if len(content) < content_length:
+                        break
+                    stream._read_samples(content)
+                elif tag == XdfChunk.CLOCK_OFFSET:
+                    content = file.read(content_length)
+                    if len(content) < content_length:
+                        break
+                    stream._read_clock_offset(content)
+                else:
+                    file.seek(content_length, 1)
+
+        for stream in streams_by_id.values():
+            stream._finalize(synchronize_clocks=synchronize_clocks)
+        return {stream.name: stream for stream in streams_by_id.values()}
+
+    def _open(self) -> BinaryIO:
+        file = (
+            gzip.open(self.file, "rb")
+            if self.file.suffix == ".xdfz"
+            else self.file.open("rb")
+        )
+        if file.read(4) != XdfReader.MAGIC:
+            file.close()
+            raise IOError(f"Invalid XDF file '{self.file}'.")
+        return file
+
+    @staticmethod
+    def read_varlen_int(file: BinaryIO) -> int:
+        num_bytes = file.read(1)
+        if not num_bytes:
+            raise EOFError()
+        data = file.read(num_bytes[0])
+        if len(data) < num_bytes[0]:
+            raise EOFError()
+        return XdfReader._decode_varlen_int(num_bytes[0], data)
+
+    @staticmethod
+    def parse_varlen_int(buffer: memoryview, offset: int):
+        num_bytes = buffer[offset]
+        value = XdfReader._decode_varlen_int(
+            num_bytes, buffer[offset + 1 : offset + 1 + num_bytes]
+        )
+        return value, offset + 1 + num_bytes
+
+    @staticmethod
+    def _decode_varlen_int(num_bytes: int, data: bytes) -> int:
+        if num_bytes == 1:
+            return data[0]
+        elif num_bytes == 4:
+            return struct.unpack("<I", data)[0]
+        elif num_bytes == 8:
+            return struct.unpack("<Q", data)[0]
+        raise IOError("Invalid variable-length integer in XDF file.")
+
+
+class XdfWriter:
+    # Writes recordings in the layout of LabRecorder, i.e. for benchmarks and synthetic test data. The chunks are
+    # written directly to the file, so arbitrarily long recordings require constant memory.
+    def __init__(self, file: Union[str, Path]):
+        self.file = file if isinstance(file, Path) else Path(file)
+        self._file = (
+            gzip.open(self.file, "wb")
+            if self.file.suffix == ".xdfz"
+            else self.file.open("wb")
+        )
+        self._streams: Dict[int, XdfStream] = {}
+
+        self._file.write(XdfReader.MAGIC)
+        self._write_chunk(
+            XdfChunk.FILE_HEADER,
+            b"<?xml version='1.0'?><info><version>1.0</version></info>",
+        )
+
+    def __enter__(self) -> "XdfWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_stream(
+        self,
+        stream_id: int,
+        name: str,
+        channel_format: str,
+        channel_count: int,
+        nominal_srate: float = 0.0,
+        desc: Union[ElementTree.Element, None] = None,
+    ) -> ElementTree.Element:
+        header = ElementTree.Element("info")
+        for tag, value in (
+            ("name", name),
+            ("channel_format", channel_format),
+            ("channel_count", str(channel_count)),
+            ("nominal_srate", repr(float(nominal_srate))),
+        ):
+            ElementTree.SubElement(header, tag).text = value
+        header.append(desc if desc is not None else ElementTree.Element("desc"))
+
+        self._streams[stream_id] = XdfStream(stream_id, header)
+        self._write_chunk(
+            XdfChunk.STREAM_HEADER,
+            b"<?xml version='1.0'?>" + ElementTree.tostring(header),
+            stream_id,
+        )
+        return header
+
+    def write_samples(
+        self,
+        stream_id: int,
+        time_stamps: np.ndarray,
+        values: Union[np.ndarray, List[List[str]]],
+    ):
+        stream = self._streams[stream_id]
+        num_samples = len(time_stamps)
+        if num_samples == 0:
+            return
+
+        content = bytearray(b"\x08" + struct.pack("<Q", num_samples))
+        if stream.dtype is None:
+            for timestamp, sample in zip(time_stamps, values):
+                content += b"\x08" + struct.pack("<d", timestamp)
+                for value in sample:
+                    encoded = value.encode()
+                    content += XdfWriter.varlen_int(len(encoded)) + encoded
+        elif stream.nominal_srate > 0:
+            # Regular streams only carry the timestamp of the first sample of each chunk, like LabRecorder writes them
+            values = np.asarray(values, dtype=stream.dtype).reshape(
+                num_samples, stream.channel_count
+            )
+            content += b"\x08" + struct.pack("<d", time_stamps[0])
+            content += values[0].tobytes()
+            samples = np.zeros(
+                num_samples - 1,
+                dtype=[
+                    ("flag", "u1"),
+                    ("values", stream.dtype, (stream.channel_count,)),
+                ],
+            )
+            samples["values"] = values[1:]
+            content += samples.tobytes()
+        else:
+            samples = np.empty(
+                num_samples,
+                dtype=[
+                    ("flag", "u1"),
+                    ("timestamp", "<f8"),
+                    ("values", stream.dtype, (stream.channel_count,)),
+                ],
+            )
+            samples["flag"] = 8
+            samples["timestamp"] = time_stamps
+            samples["values"] = np.asarray(values, dtype=stream.dtype).reshape(
+                num_samples, stream.channel_count
+            )
+            content += samples.tobytes()
+        self._write_chunk(XdfChunk.SAMPLES, bytes(content), stream_id)
+
+    def write_clock_offset(
+        self, stream_id: int, collection_time: float, offset_value: float
+    ):
+        self._write_chunk(
+            XdfChunk.CLOCK_OFFSET,
+            struct.pack("<dd", collection_time, offset_value),
+            stream_id,
+        )
+
+    def close(self):
+        if not self._file.closed:
+            for stream_id in self._streams:
+                self._write_chunk(
+                    XdfChunk.STREAM_FOOTER,
+                    b"<?xml version='1.0'?><info></info>",
+                    stream_id,
+                )
+            self._file.close()
+
+    def _write_chunk(self, tag: int, content: bytes, stream_id: int = None):
+        if stream_id is not None:
+            content = struct.pack("<I", stream_id) + content
+        self._file.write(
+            XdfWriter.varlen_int(len(content) + 2) + struct.pack("<H", tag) + content
+        )
+
+    @staticmethod
+    def varlen_int(value: int) -> bytes:
+        if value < 256:
+            return bytes((1, value))
+        elif value < 2**32:
+            return b"\x04" + struct.pack("<I", value)
+        return b"\x08" + struct.pack("<Q", value)
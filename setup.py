@@ -16,7 +16,12 @@ setup(
     python_requires=">=3.7",
     install_requires=requirements,
     zip_safe=True,
-    entry_points={"console_scripts": ["bid2d=bid2d.__main__:main"]},
+    entry_points={
+        "console_scripts": [
+            "bid2d=bid2d.__main__:main",
+            "bid2d-analyze=bid2d.analysis:main",
+        ]
+    },
     package_data={"bid2d": ["assets/avatar.png"]},
     include_package_data=True,
 )
@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from bid2d.analysis import Analysis
+from bid2d.simulation import SimulatedParticipant
+from bid2d.synthetic import RecordingGenerator
+
+
+class TestAnalysis(unittest.TestCase):
+    def test_participants(self):
+        files = [Path("a/p1.xdf"), Path("b/p1.xdf"), Path("b/p2.session1.xdfz")]
+        self.assertEqual(
+            ["a/p1", "b/p1", "b/p2.session1"],
+            list(Analysis.participants(files).values()),
+        )
+        self.assertEqual({files[0]: "p1"}, Analysis.participants(files[:1]))
+
+    def test_failed_recording(self):
+        generator = RecordingGenerator(
+            RecordingGenerator.synthetic_stimuli(4),
+            SimulatedParticipant.create_models(rt_mean=0.5, rt_sd=0.05, error_rate=0.0),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            files = [directory / "a" / "p1.xdf", directory / "b" / "p1.xdf"]
+            for i, file in enumerate(files):
+                file.parent.mkdir()
+                generator.write(file, 20, seed=i)
+
+            # A recording which is not an XDF file does not abort the others
+            corrupt = directory / "b" / "p2.xdf"
+            corrupt.write_bytes(b"corrupt" + files[0].read_bytes())
+
+            analysis = Analysis(Analysis.find_recordings([directory]))
+            rows = analysis.run(processes=1)
+
+            self.assertEqual({"a/p1", "b/p1"}, {row[0] for row in rows})
+            self.assertEqual(40, len(rows))
+            self.assertEqual([corrupt], [file for file, _ in analysis.failed])
+
+            # Neither does a missing one, also while looking up the cache
+            missing = directory / "a" / "missing.xdf"
+            analysis = Analysis(
+                [files[0], missing, files[1]], cache_directory=directory / "cache"
+            )
+            rows = analysis.run(processes=1)
+
+        self.assertEqual(40, len(rows))
+        self.assertEqual([missing], [file for file, _ in analysis.failed])
+        self.assertIn("FileNotFoundError", analysis.failed[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
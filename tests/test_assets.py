@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from bid2d.assets import AssetCache
+
+
+class TestAssetCache(unittest.TestCase):
+    def test_display_size(self):
+        self.assertEqual(
+            (480, 240), AssetCache.display_size((1000, 500), 0.5, (1920, 1080))
+        )
+        self.assertEqual((100, 50), AssetCache.display_size((100, 50), 1.0, (800, 600)))
+
+    def test_prepare_and_invalidate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            image = Path(directory) / "stimulus.png"
+            shutil.copy(Path(__file__).parent / "example" / "stim1.png", image)
+            cache = AssetCache(Path(directory) / AssetCache.DIRECTORY)
+
+            self.assertTrue(cache.prepare(image, 0.1, (640, 480)))
+            self.assertFalse(cache.prepare(image, 0.1, (640, 480)))
+            self.assertEqual((24, 24), cache.load(image, 0.1, (640, 480)).size)
+
+            # Modifying the source invalidates the entry
+            stat = image.stat()
+            os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertEqual((128, 128), cache.load(image, 0.1, (640, 480)).size)
+            self.assertTrue(cache.prepare(image, 0.1, (640, 480)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from bid2d import benchmark
+from bid2d.benchmark import Result
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_compare_reports_regressions(self):
+        baseline = {
+            "fast": Result(best=1.0, median=1.0, number=1, repeat=1),
+            "slow": Result(best=1.0, median=1.0, number=1, repeat=1),
+        }
+        results = {
+            "fast": Result(best=1.1, median=1.1, number=1, repeat=1),
+            "slow": Result(best=1.5, median=1.5, number=1, repeat=1),
+            "new": Result(best=9.0, median=9.0, number=1, repeat=1),
+        }
+        self.assertEqual(["slow"], benchmark.compare(baseline, results, 0.25))
+
+    def test_baseline_roundtrip(self):
+        results = benchmark.run(
+            ["reaction.validate", "experiment.generate_trials"],
+            repeat=2,
+            min_time=0.001,
+            scale=0.01,
+        )
+        self.assertEqual(
+            {"reaction.validate", "experiment.generate_trials"}, set(results.keys())
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory) / "baseline.json"
+            benchmark.save(file, results)
+            self.assertEqual(results, benchmark.load(file))
+
+
+if __name__ == "__main__":
+    unittest.main()
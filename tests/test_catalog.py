@@ -0,0 +1,102 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+from bid2d.catalog import CatalogIndex
+from bid2d.stimulus import Stimulus
+
+
+class TestCatalogIndex(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+        for i in range(4):
+            Image.new("RGB", (10 + i, 20)).save(self.directory / f"image{i}.png")
+        self.catalog = self.directory / "samples.csv"
+        self._write(["image0.png,A,True", "image1.png,B,False", "image2.png,C,True"])
+        self.index = CatalogIndex(self.directory / "index" / "catalog.sqlite")
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _write(self, rows):
+        self.catalog.write_text("\n".join(["image,name,should_approach"] + rows))
+
+    def _load(self):
+        return [
+            (stimulus.name, stimulus.image.name, stimulus.should_approach)
+            for stimulus in Stimulus.from_csv(self.catalog, index=self.index)
+        ]
+
+    def test_matches_csv(self):
+        expected = [
+            (stimulus.name, stimulus.image.name, stimulus.should_approach)
+            for stimulus in Stimulus.from_csv(self.catalog)
+        ]
+        self.assertEqual(expected, self._load())
+        self.assertEqual((11, 20), self.index.image_size(self.directory / "image1.png"))
+
+    def test_unchanged_catalog_is_not_parsed(self):
+        self._load()
+        with mock.patch.object(
+            Stimulus, "parse_csv", side_effect=AssertionError
+        ), mock.patch.object(CatalogIndex, "_inspect", side_effect=AssertionError):
+            self.assertEqual(3, len(self._load()))
+
+    def test_only_changed_rows_are_revalidated(self):
+        self._load()
+        self._write(["image0.png,A,True", "image3.png,Bee,False", "image2.png,C,True"])
+
+        inspected = []
+        inspect = CatalogIndex._inspect
+
+        def record(path):
+            inspected.append(path.name)
+            return inspect(path)
+
+        with mock.patch.object(CatalogIndex, "_inspect", side_effect=record):
+            self.assertEqual(
+                [
+                    ("A", "image0.png", True),
+                    ("Bee", "image3.png", False),
+                    ("C", "image2.png", True),
+                ],
+                self._load(),
+            )
+        self.assertEqual(["image3.png"], inspected)
+
+    def test_modified_image_is_revalidated(self):
+        self._load()
+        Image.new("RGB", (40, 30)).save(self.directory / "image1.png")
+
+        inspected = []
+        inspect = CatalogIndex._inspect
+
+        def record(path):
+            inspected.append(path.name)
+            return inspect(path)
+
+        with mock.patch.object(
+            Stimulus, "parse_csv", side_effect=AssertionError
+        ), mock.patch.object(CatalogIndex, "_inspect", side_effect=record):
+            self.assertEqual(3, len(self._load()))
+        self.assertEqual(["image1.png"], inspected)
+        self.assertEqual((40, 30), self.index.image_size(self.directory / "image1.png"))
+
+    def test_deleted_image(self):
+        self._load()
+        (self.directory / "image2.png").unlink()
+        with self.assertRaises(FileNotFoundError):
+            self._load()
+
+    def test_missing_image(self):
+        self._write(["image0.png,A,True", "missing.png,B,False"])
+        with self.assertRaises(FileNotFoundError):
+            self._load()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import itertools
+import unittest
+
+import numpy as np
+
+from bid2d.util.collision import BoundingBoxes
+from bid2d.simulation import NullAvatar, NullStimulus
+
+
+class TestBoundingBoxes(unittest.TestCase):
+    def test_matches_scalar_overlap(self):
+        random_generator = np.random.default_rng(0)
+        objects = [
+            NullStimulus(tuple(random_generator.uniform(-1, 1, 2)), (0.3, 0.2))
+            for _ in range(50)
+        ]
+        bounding_boxes = BoundingBoxes.from_objects(objects)
+        avatar = NullAvatar((0.1, 0.15))
+
+        for x, y in itertools.product(np.linspace(-1, 1, 9), repeat=2):
+            avatar.place(x, y)
+            np.testing.assert_array_equal(
+                [avatar.is_overlapping(obj) for obj in objects],
+                bounding_boxes.overlapping(avatar),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from bid2d.util.frame_timer import FrameTimer
+
+
+class _Window:
+    def __init__(self, flip_times):
+        self.monitorFramePeriod = 0.01
+        self._flip_times = iter(flip_times)
+
+    def flip(self) -> float:
+        return next(self._flip_times)
+
+
+class TestFrameTimer(unittest.TestCase):
+    def test_dropped_frames(self):
+        timer = FrameTimer(_Window([0.0, 0.01, 0.02, 0.05, 0.06, 0.075]))
+        timer.flip()
+        timer.start()
+        for _ in range(5):
+            timer.flip()
+        summary = timer.stop()
+
+        self.assertEqual(5, summary.num_frames)
+        self.assertEqual(2, summary.num_dropped)
+        self.assertAlmostEqual(0.03, summary.max_interval)
+
+
+if __name__ == "__main__":
+    unittest.main()
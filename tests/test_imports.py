@@ -0,0 +1,59 @@
+import json
+import subprocess
+import sys
+import unittest
+
+# Runs in a fresh interpreter, in which importing the graphics stack or LSL fails loudly
+_SCRIPT = """
+import importlib.abc, json, sys, time
+
+class Blocker(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] in ("psychopy", "pyglet", "pylsl"):
+            raise ImportError(f"Blocked import of '{name}'")
+        return None
+
+sys.meta_path.insert(0, Blocker())
+start = time.perf_counter()
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+print(json.dumps(time.perf_counter() - start))
+"""
+
+
+class TestImports(unittest.TestCase):
+    # The modules required for decoding and analysing recordings on headless machines
+    GRAPHICS_FREE_MODULES = (
+        "bid2d.analysis",
+        "bid2d.assets",
+        "bid2d.benchmark",
+        "bid2d.catalog",
+        "bid2d.journal",
+        "bid2d.logger",
+        "bid2d.monitor",
+        "bid2d.position",
+        "bid2d.reaction",
+        "bid2d.schedule",
+        "bid2d.session",
+        "bid2d.simulation",
+        "bid2d.stats",
+        "bid2d.stimulus",
+        "bid2d.synthetic",
+        "bid2d.trial",
+        "bid2d.xdf",
+    )
+    # About 0.2s here, so only a slow import like that of the graphics stack exceeds it
+    MAX_IMPORT_TIME = 2.0
+
+    def test_graphics_free_imports(self):
+        result = subprocess.run(
+            [sys.executable, "-c", _SCRIPT, *TestImports.GRAPHICS_FREE_MODULES],
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertLess(json.loads(result.stdout), TestImports.MAX_IMPORT_TIME)
+
+
+if __name__ == "__main__":
+    unittest.main()
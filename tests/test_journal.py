@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.journal import EventJournal
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+
+
+class TestEventJournal(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_roundtrip(self):
+        file = self.directory / "session.journal"
+        long_name = "A rather long name of a stimulus, which needs several records"
+        with EventJournal(file, capacity=4) as journal:
+            journal.write_trial("Red", Position.Above, 1.0)
+            journal.write_reaction(30, Reaction.CorrectReaction, 1.5)
+            journal.write_frame_timing(40, 2, 0.05, 1.9)
+            journal.write_trial("Red", Position.Above, 2.0)
+            journal.write_trial(long_name, Position.Below, 3.0)
+            journal.write_reaction(45, Reaction.IncorrectReaction, 3.75)
+            journal.write_trial(long_name, Position.Below, 4.0)
+
+        session = EventJournal.load(file)
+        np.testing.assert_array_equal(["Red", long_name], session.names)
+        np.testing.assert_array_equal([1.0, 3.0], session.trials["onset"])
+        np.testing.assert_array_equal([2.0, 4.0], session.trials["offset"])
+        np.testing.assert_array_equal(
+            [
+                Session.POSITIONS.index(Position.Above),
+                Session.POSITIONS.index(Position.Below),
+            ],
+            session.trials["position"],
+        )
+        np.testing.assert_array_equal([30, 45], session.reactions["num_frames"])
+        np.testing.assert_array_equal([2, -1], session.dropped_frames())
+        np.testing.assert_array_equal([True, False], session.responses()["correct"])
+
+    def test_partial_record_after_crash(self):
+        file = self.directory / "session.journal"
+        journal = EventJournal(file)
+        journal.write_trial("Red", Position.Above, 1.0)
+        journal.write_reaction(30, Reaction.CorrectReaction, 1.5)
+        journal.flush()
+
+        # Simulate a crash while writing the next record: everything but its kind is already written
+        records = np.memmap(
+            file,
+            dtype=EventJournal.RECORD_DTYPE,
+            mode="r+",
+            offset=EventJournal.HEADER_SIZE,
+            shape=(len(journal) + 1,),
+        )
+        records[len(journal)] = (0, 0, 0, 31, 1.6, 0, 0.0, b"")
+        records.flush()
+        del records
+
+        session = EventJournal.load(file)
+        self.assertEqual(1, len(session.trials))
+        self.assertTrue(np.isnan(session.trials["offset"][0]))
+        np.testing.assert_array_equal([1.5], session.reactions["timestamp"])
+
+        # The next session appends to the journal and starts a trial of its own
+        with EventJournal(file) as journal:
+            journal.write_trial("Green", Position.Below, 10.0)
+            journal.write_trial("Green", Position.Below, 11.0)
+        session = EventJournal.load(file)
+        np.testing.assert_array_equal(["Red", "Green"], session.names)
+        np.testing.assert_array_equal([1.0, 10.0], session.trials["onset"])
+        np.testing.assert_array_equal([np.nan, 11.0], session.trials["offset"])
+
+    def test_merge(self):
+        files = [self.directory / "a.journal", self.directory / "b.journal"]
+        with EventJournal(files[1]) as journal:
+            journal.write_trial("Green", Position.Below, 5.0)
+            journal.write_trial("Green", Position.Below, 6.0)
+        with EventJournal(files[0]) as journal:
+            journal.write_trial("Red", Position.Above, 1.0)
+
+        session = EventJournal.merge(files)
+        np.testing.assert_array_equal(["Red", "Green"], session.names)
+        np.testing.assert_array_equal([1.0, 5.0], session.trials["onset"])
+        np.testing.assert_array_equal([0, 1], session.trials["name"])
+        np.testing.assert_array_equal([np.nan, 6.0], session.trials["offset"])
+
+    def test_invalid_file(self):
+        file = self.directory / "session.journal"
+        file.write_bytes(b"Not a journal")
+        with self.assertRaises(ValueError):
+            EventJournal(file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import tempfile
+import unittest
+from pathlib import Path
+from xml.etree import ElementTree
+
+import numpy as np
+
+from bid2d.logger import BackgroundLogger, Logger
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+from bid2d.xdf import XdfStream, XdfWriter
+
+
+class TestCompactTrials(unittest.TestCase):
+    NAMES = ["Red", "Green", "Blue"]
+
+    def _write(self, file: Path, compact: bool):
+        trials = [("Green", Position.Below), ("Red", Position.Above)]
+        with XdfWriter(file) as writer:
+            if compact:
+                writer.add_stream(
+                    1,
+                    Logger.TRIAL_STREAM_NAME,
+                    "int32",
+                    2,
+                    desc=Session.trial_description(TestCompactTrials.NAMES),
+                )
+            else:
+                writer.add_stream(1, Logger.TRIAL_STREAM_NAME, "string", 2)
+
+            for i, (name, position) in enumerate(trials):
+                sample = (
+                    np.array(
+                        [
+                            [
+                                TestCompactTrials.NAMES.index(name),
+                                Session.POSITIONS.index(position),
+                            ]
+                        ],
+                        dtype=np.int32,
+                    )
+                    if compact
+                    else [[name, position.value]]
+                )
+                writer.write_samples(1, np.array([2.0 * i]), sample)
+                writer.write_samples(1, np.array([2.0 * i + 1.0]), sample)
+
+    def test_same_trials_as_strings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files = {
+                compact: Path(directory) / f"recording_{compact}.xdf"
+                for compact in (False, True)
+            }
+            for compact, file in files.items():
+                self._write(file, compact)
+            trials = {
+                compact: list(Logger.load_trials(str(file)))
+                for compact, file in files.items()
+            }
+            sessions = {
+                compact: Logger.load_session(str(file))
+                for compact, file in files.items()
+            }
+
+        self.assertEqual(trials[False], trials[True])
+        self.assertEqual(
+            [Position.Below, Position.Below, Position.Above, Position.Above],
+            [trial.position for trial in trials[True]],
+        )
+        for session in sessions.values():
+            np.testing.assert_array_equal(
+                ["Green", "Red"], session.names[session.trials["name"]]
+            )
+            np.testing.assert_array_equal([1, 0], session.trials["position"])
+            np.testing.assert_array_equal([1.0, 3.0], session.trials["offset"])
+
+    def test_outlet_description(self):
+        # The dictionary announced by the outlet is the one the decoder expects
+        logger = Logger(trial_names=TestCompactTrials.NAMES + ["Red"])
+        stream = XdfStream(
+            1, ElementTree.fromstring(logger._stream_trial.get_info().as_xml())
+        )
+        names, positions = Session.trial_dictionary(stream)
+
+        self.assertEqual("int32", stream.channel_format)
+        np.testing.assert_array_equal(TestCompactTrials.NAMES, names)
+        np.testing.assert_array_equal(np.arange(len(Session.POSITIONS)), positions)
+        self.assertEqual(
+            [2, 1], logger._encode_trial(Logger.Trial("Blue", Position.Below))
+        )
+
+
+class TestBackgroundLogger(unittest.TestCase):
+    def test_statistics(self):
+        with BackgroundLogger(poll_interval=0.01) as logger:
+            for i in range(10):
+                logger.push(Logger.Trial(name="Red", position=Position.Above))
+                logger.push(
+                    Logger.Reaction(num_frames=i, reaction=Reaction.Up, timestamp=1.0)
+                )
+        statistics = logger.statistics
+
+        # Each push is timed on the calling thread, apart from the age of the chunks the worker sent
+        self.assertEqual(20, statistics.num_pushes)
+        self.assertLessEqual(statistics.mean_push_time, statistics.max_push_time)
+        self.assertGreater(statistics.mean_push_time, 0.0)
+        self.assertGreaterEqual(statistics.num_chunks, 2)
+        self.assertLessEqual(statistics.mean_queue_age, statistics.max_queue_age)
+
+        # The age counts from the push, not from the earlier timestamps of the reactions
+        self.assertLess(statistics.max_queue_age, 1.0)
+        self.assertEqual((0, 0), (statistics.queue_depth, statistics.dropped))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import math
+import unittest
+
+import numpy as np
+
+from bid2d.monitor import StationMonitor
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.util.streaming_statistics import P2Quantile, RunningStatistics
+
+
+class TestStreamingStatistics(unittest.TestCase):
+    def test_running_statistics(self):
+        values = np.random.default_rng(1).normal(0.6, 0.15, 1000)
+        first, second = RunningStatistics(), RunningStatistics()
+        for value in values[:300]:
+            first.add(value)
+        for value in values[300:]:
+            second.add(value)
+        merged = first.merge(second)
+
+        self.assertEqual(len(values), merged.count)
+        self.assertAlmostEqual(np.mean(values), merged.mean)
+        self.assertAlmostEqual(np.var(values, ddof=1), merged.variance)
+        self.assertTrue(math.isnan(RunningStatistics().variance))
+
+    def test_p2_quantile(self):
+        values = np.random.default_rng(2).lognormal(-0.5, 0.3, 10000)
+        for p in (0.1, 0.5, 0.9):
+            quantile = P2Quantile(p)
+            for value in values:
+                quantile.add(value)
+            self.assertAlmostEqual(np.quantile(values, p), quantile.value, delta=0.01)
+
+    def test_p2_quantile_few_values(self):
+        quantile = P2Quantile(0.5)
+        self.assertTrue(math.isnan(quantile.value))
+        for value in (3.0, 1.0, 2.0):
+            quantile.add(value)
+        self.assertEqual(2.0, quantile.value)
+
+
+class TestStationMonitor(unittest.TestCase):
+    def test_pairing(self):
+        station = StationMonitor({"Red": True, "Green": False})
+
+        # Joined during a trial, so the first marker is the end of a trial
+        station.add_trial(0.5, "Green", Position.Above)
+        station.add_reaction(0.6, Reaction.Up)
+
+        # The reaction arrives before the end of its trial
+        station.add_trial(1.0, "Red", Position.Below)
+        station.add_reaction(1.5, Reaction.CorrectReaction)
+        station.add_reaction(1.6, Reaction.Up)
+        station.add_trial(2.0, "Red", Position.Below)
+
+        # The reaction arrives after the end of its trial
+        station.add_trial(3.0, "Green", Position.Above)
+        station.add_trial(4.0, "Green", Position.Above)
+        station.add_reaction(3.75, Reaction.IncorrectReaction)
+
+        station.add_trial(5.0, "Green", Position.Below)
+        station.add_reaction(5.8, Reaction.CorrectReaction)
+        station.add_trial(6.0, "Green", Position.Below)
+
+        self.assertEqual(3, station.num_trials)
+        self.assertEqual(0, station.num_unassigned)
+        self.assertEqual(1, station.num_incomplete)
+        approach = station.conditions[(True, Position.Below)]
+        self.assertEqual(1, approach.num_correct)
+        self.assertAlmostEqual(0.5, approach.rt.mean)
+        avoid_above = station.conditions[(False, Position.Above)]
+        self.assertEqual((1, 0), (avoid_above.num_responses, avoid_above.num_correct))
+        self.assertAlmostEqual(0.8, station.conditions[(False, Position.Below)].rt.mean)
+        self.assertAlmostEqual(2 / 3, station.total().accuracy)
+
+    def test_dropped_markers(self):
+        station = StationMonitor({"Red": True, "Green": False})
+
+        # Consecutive trials of the same stimulus and position
+        for onset in (0.0, 2.0):
+            station.add_trial(onset, "Red", Position.Above)
+            station.add_reaction(onset + 0.5, Reaction.CorrectReaction)
+            station.add_trial(onset + 1.0, "Red", Position.Above)
+
+        # The end of this trial was dropped, so it is discarded once the next one starts
+        station.add_trial(4.0, "Green", Position.Above)
+        station.add_reaction(4.5, Reaction.CorrectReaction)
+        station.add_trial(6.0, "Red", Position.Below)
+        station.add_reaction(6.5, Reaction.IncorrectReaction)
+
+        # A marker out of order neither ends the open trial nor starts another one
+        station.add_trial(5.0, "Red", Position.Below)
+        station.add_trial(7.0, "Red", Position.Below)
+
+        self.assertEqual(3, station.num_trials)
+        self.assertEqual(1, station.num_incomplete)
+        self.assertEqual(1, station.num_ignored)
+        self.assertEqual(1, station.num_unassigned)
+        self.assertEqual(2, station.conditions[(True, Position.Above)].num_correct)
+        below = station.conditions[(True, Position.Below)]
+        self.assertEqual((1, 0), (below.num_responses, below.num_correct))
+        self.assertIn("1 incomplete", station.report("station")[0])
+
+    def test_congruency_effect(self):
+        station = StationMonitor({"Red": True, "Green": False})
+        onset = 0.0
+        for i in range(10):
+            for name, rt in (("Red", 0.5), ("Green", 0.7)):
+                rt += 0.01 * (i % 3)
+                station.add_trial(onset, name, Position.Above)
+                station.add_reaction(onset + rt, Reaction.CorrectReaction)
+                station.add_trial(onset + 1.0, name, Position.Above)
+                onset += 2.0
+
+        effect, error = station.congruency_effect()
+        self.assertAlmostEqual(0.2, effect)
+        self.assertGreater(error, 0.0)
+        self.assertEqual(2 + 2, len(station.report("station")))
+
+    def test_unknown_stimuli(self):
+        station = StationMonitor()
+        station.add_trial(0.0, "Red", Position.Above)
+        station.add_reaction(0.5, Reaction.CorrectReaction)
+        station.add_trial(1.0, "Red", Position.Above)
+
+        self.assertEqual([(None, Position.Above)], list(station.conditions))
+        self.assertTrue(math.isnan(station.congruency_effect()[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
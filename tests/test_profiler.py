@@ -0,0 +1,113 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from bid2d.simulation import HeadlessExperiment, SimulatedParticipant
+from bid2d.stimulus import Stimulus
+from bid2d.util.profiler import Profiler
+
+
+class _Logger:
+    def __bool__(self):
+        return True
+
+    def push(self, event):
+        pass
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _load(self, file: Path):
+        trace = json.loads(file.read_text())
+        spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        threads = {
+            event["tid"]: event["args"]["name"]
+            for event in trace["traceEvents"]
+            if event["ph"] == "M"
+        }
+        return trace, spans, threads
+
+    def test_trace(self):
+        file = self.directory / "trace.json"
+        with Profiler(file, cprofile=True) as profiler:
+            add = profiler.wrap("add", lambda a, b: a + b)
+            with profiler.span("session"):
+                self.assertEqual(3, add(1, 2))
+                thread = threading.Thread(target=add, args=(3, 4), name="Worker")
+                thread.start()
+                thread.join()
+
+        trace, spans, threads = self._load(file)
+        self.assertEqual(["add", "add", "session"], [span["name"] for span in spans])
+        self.assertEqual({"MainThread", "Worker"}, set(threads.values()))
+        self.assertEqual("Worker", threads[spans[1]["tid"]])
+
+        # The spans are nested in time
+        session = spans[2]
+        for span in spans[:2]:
+            self.assertGreaterEqual(span["ts"], session["ts"])
+            self.assertLessEqual(
+                span["ts"] + span["dur"], session["ts"] + session["dur"]
+            )
+        self.assertEqual(0, trace["otherData"]["num_dropped"])
+        self.assertTrue(file.with_suffix(".prof").is_file())
+
+    def test_capacity(self):
+        file = self.directory / "trace.json"
+        with Profiler(file, capacity=4) as profiler:
+            noop = profiler.wrap("noop", lambda: None)
+            for _ in range(10):
+                noop()
+
+        self.assertEqual(4, len(profiler))
+        self.assertEqual(6, profiler.num_dropped)
+        self.assertEqual(4, len(self._load(file)[1]))
+
+    def test_session(self):
+        stimuli = list(
+            Stimulus.from_csv(Path(__file__).parent / "example" / "samples.csv")
+        )
+        file = self.directory / "trace.json"
+        with Profiler(file) as profiler:
+            HeadlessExperiment(
+                stimuli,
+                _Logger(),
+                SimulatedParticipant.create_models(
+                    rt_mean=0.4, rt_sd=0.1, error_rate=0.0
+                ),
+                prefetch=1,
+                profiler=profiler,
+            ).run(
+                fixation_cross_jitter=(0.1, 0.2),
+                seed=3,
+                avatar_size=0.15,
+                stimulus_size=0.75,
+            )
+
+        names = {span["name"] for span in self._load(file)[1]}
+        self.assertLessEqual(
+            {
+                "Schedule.compile",
+                "preload",
+                "FixationPoint.show",
+                "TexturePrefetcher.prepare",
+                "Stimulus.load",
+                "decode",
+                "draw",
+                "flip",
+                "Logger.push",
+            },
+            names,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
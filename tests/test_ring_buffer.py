@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+
+from bid2d.util.ring_buffer import RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_wrap_around(self):
+        buffer = RingBuffer(4, channel_count=2, dtype=np.int32)
+        for i in range(3):
+            self.assertTrue(buffer.put((i, i), float(i)))
+        buffer.release(len(buffer.peek()[1]))
+
+        # The next records wrap around the end of the preallocated storage
+        for i in range(3, 7):
+            self.assertTrue(buffer.put((i, i), float(i)))
+        self.assertFalse(buffer.put((7, 7), 7.0))
+        self.assertEqual(1, buffer.dropped)
+
+        consumed = []
+        while len(buffer) > 0:
+            values, timestamps = buffer.peek()
+            consumed.extend(values[:, 0].tolist())
+            buffer.release(len(timestamps))
+        self.assertEqual([3, 4, 5, 6], consumed)
+        self.assertEqual(4, buffer.max_depth)
+
+    def test_enqueued(self):
+        buffer = RingBuffer(4, channel_count=1, dtype=np.int32)
+        buffer.put((0,), 1.0, enqueued=5.0)
+        buffer.put((1,), 6.0)
+        self.assertEqual(5.0, buffer.oldest_enqueued())
+        buffer.release(1)
+        self.assertEqual(6.0, buffer.oldest_enqueued())
+
+
+if __name__ == "__main__":
+    unittest.main()
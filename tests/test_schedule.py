@@ -0,0 +1,171 @@
+import contextlib
+import io
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.position import Position
+from bid2d.schedule import Schedule, main
+from bid2d.session import Session
+from bid2d.stimulus import Stimulus
+from bid2d.trial import TrialTable
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        example_file = Path(__file__).parent / "example" / "samples.csv"
+        self.stimuli = list(Stimulus.from_csv(example_file, delimiter=","))
+        self.schedule = Schedule.compile(
+            self.stimuli,
+            seed=7,
+            fixation_jitter=(0.75, 1.25),
+            frame_period=1 / 60,
+            window_size=(1920, 1080),
+            stimulus_size=0.75,
+            avatar_size=0.15,
+        )
+
+    def test_matches_unscheduled_session(self):
+        trials = TrialTable.generate(
+            self.stimuli, position=(Position.Above, Position.Below), seed=7
+        )
+        scheduled = self.schedule.trial_table(self.stimuli)
+        self.assertEqual(
+            [(trial.name, trial["position"]) for trial in trials],
+            [(trial.name, trial["position"]) for trial in scheduled],
+        )
+
+        random_generator = random.Random(7)
+        self.assertEqual(
+            [int(60 * random_generator.uniform(0.75, 1.25)) for _ in trials],
+            self.schedule.trials["fixation_frames"].tolist(),
+        )
+
+    def test_distractors(self):
+        schedule = Schedule.compile(
+            self.stimuli,
+            seed=7,
+            fixation_jitter=(0.75, 1.25),
+            frame_period=1 / 60,
+            window_size=(1920, 1080),
+            stimulus_size=0.5,
+            avatar_size=0.15,
+            num_distractors=2,
+            distractor_size=0.2,
+        )
+        np.testing.assert_array_equal(
+            self.schedule.trials["stimulus"], schedule.trials["stimulus"]
+        )
+        for trial in schedule.trials:
+            self.assertNotIn(trial["stimulus"], trial["distractors"])
+            self.assertEqual(2, len(set(trial["distractors"])))
+            self.assertTrue(np.all(np.abs(trial["distractor_x"]) < 1.0))
+            self.assertTrue(np.all(np.abs(trial["distractor_y"]) < 1.0))
+
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory) / "session.schedule"
+            schedule.save(file)
+            loaded = Schedule.load(file)
+            np.testing.assert_array_equal(schedule.trials, loaded.trials)
+            self.assertEqual(2, loaded.num_distractors)
+            del loaded
+
+        # Only the distractors of stimuli to approach end the trial, if they take the role of their stimulus
+        self.assertFalse(schedule.trials["distractor_approach"].any())
+        approaching = Schedule.compile(
+            self.stimuli,
+            seed=7,
+            fixation_jitter=(0.75, 1.25),
+            frame_period=1 / 60,
+            window_size=(1920, 1080),
+            stimulus_size=0.5,
+            avatar_size=0.15,
+            num_distractors=2,
+            distractor_size=0.2,
+            approach_distractors=True,
+        )
+        np.testing.assert_array_equal(
+            [
+                [self.stimuli[index].should_approach for index in trial["distractors"]]
+                for trial in approaching.trials
+            ],
+            approaching.trials["distractor_approach"],
+        )
+
+        with self.assertRaises(ValueError):
+            Schedule.compile(
+                self.stimuli,
+                seed=7,
+                fixation_jitter=(0.75, 1.25),
+                frame_period=1 / 60,
+                window_size=(1920, 1080),
+                stimulus_size=0.5,
+                avatar_size=0.15,
+                num_distractors=3,
+            )
+
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory) / "session.schedule"
+            self.schedule.save(file)
+            loaded = Schedule.load(file)
+            np.testing.assert_array_equal(self.schedule.trials, loaded.trials)
+            self.assertEqual(self.schedule.stimuli, loaded.stimuli)
+            self.assertEqual(self.schedule.window_size, loaded.window_size)
+            self.assertEqual(self.schedule.frame_period, loaded.frame_period)
+            del loaded
+
+    def test_check(self):
+        self.schedule.check(self.stimuli, (1920, 1080), 1 / 60)
+        with self.assertRaises(ValueError):
+            self.schedule.check(self.stimuli, (1024, 768), 1 / 60)
+        with self.assertRaises(ValueError):
+            self.schedule.check(self.stimuli, (1920, 1080), 1 / 144)
+        with self.assertRaises(ValueError):
+            self.schedule.check(self.stimuli[::-1], (1920, 1080), 1 / 60)
+
+    def test_verify(self):
+        # A session which was recorded exactly as planned
+        trials = np.zeros(len(self.schedule.trials), dtype=Session.TRIAL_DTYPE)
+        trials["name"] = self.schedule.trials["stimulus"]
+        trials["position"] = self.schedule.trials["position"]
+        for i, fixation_frames in enumerate(self.schedule.trials["fixation_frames"]):
+            previous_offset = trials["offset"][i - 1] if i > 0 else 0.0
+            trials["onset"][i] = previous_offset + fixation_frames / 60
+            trials["offset"][i] = trials["onset"][i] + 2.0
+        session = Session(
+            trials=trials,
+            reactions=np.zeros(0, dtype=Session.REACTION_DTYPE),
+            names=np.asarray(self.schedule.stimuli),
+        )
+        verification = self.schedule.verify(session)
+        self.assertTrue(verification)
+        self.assertAlmostEqual(0.0, verification.max_fixation_error)
+
+        session.trials["position"][3] = 1 - session.trials["position"][3]
+        verification = self.schedule.verify(session)
+        self.assertFalse(verification)
+        self.assertEqual(1, verification.num_mismatches)
+        self.assertEqual(3, verification.first_mismatch)
+
+    def test_invalid_constraints(self):
+        # Reported as usage errors before compiling anything
+        samples = str(Path(__file__).parent / "example" / "samples.csv")
+        with tempfile.TemporaryDirectory() as directory:
+            output = str(Path(directory) / "session.schedule")
+            for constraint in (["-max_run", "position=x"], ["-max_run", "block=1"]):
+                stderr = io.StringIO()
+                with self.assertRaises(
+                    SystemExit
+                ) as context, contextlib.redirect_stderr(stderr):
+                    main([samples, output, *constraint])
+                self.assertEqual(2, context.exception.code)
+                self.assertIn(constraint[1].split("=")[0], stderr.getvalue())
+                self.assertFalse(Path(output).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
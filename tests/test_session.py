@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.reaction import Reaction
+from bid2d.session import Session
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(
+            trials=np.array(
+                [(1.0, 2.0, 0, 0), (3.0, 4.0, 1, 1), (5.0, np.nan, 0, 1)],
+                dtype=Session.TRIAL_DTYPE,
+            ),
+            reactions=np.array(
+                [
+                    (1.5, 30, Reaction.CorrectReaction.value),
+                    (1.6, 31, Reaction.Up.value),
+                    (3.75, 45, Reaction.IncorrectReaction.value),
+                    (4.5, 3, Reaction.Down.value),
+                ],
+                dtype=Session.REACTION_DTYPE,
+            ),
+            names=np.array(["Red", "Green"]),
+        )
+
+    def test_responses(self):
+        responses = self.session.responses()
+
+        np.testing.assert_allclose([0.5, 0.75, np.nan], responses["rt"])
+        np.testing.assert_array_equal([30, 45, -1], responses["num_frames"])
+        np.testing.assert_array_equal([True, False, False], responses["correct"])
+
+    def test_roundtrip(self):
+        for suffix in (".npy", ".npz"):
+            with tempfile.TemporaryDirectory() as directory:
+                file = Path(directory) / f"session{suffix}"
+                self.session.save(file)
+                loaded = Session.load(file)
+
+                # Only the directory of '.npy' tables is memory-mapped
+                self.assertEqual(suffix == ".npy", isinstance(loaded.trials, np.memmap))
+                for name in Session.TRIAL_DTYPE.names:
+                    np.testing.assert_array_equal(
+                        self.session.trials[name], loaded.trials[name]
+                    )
+                np.testing.assert_array_equal(self.session.reactions, loaded.reactions)
+                np.testing.assert_array_equal(self.session.names, loaded.names)
+                np.testing.assert_allclose(
+                    self.session.responses()["rt"], loaded.responses()["rt"]
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,380 @@
+import dataclasses
+import gc
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.assets import AssetCache
+from bid2d.journal import EventJournal
+from bid2d.logger import Logger
+from bid2d.position import Position
+from bid2d.reaction import Reaction
+from bid2d.schedule import Schedule
+from bid2d.simulation import HeadlessExperiment, SimulatedParticipant
+from bid2d.stimulus import Stimulus
+from bid2d.util.keyboard import UP, DOWN
+
+
+class _Logger:
+    def __init__(self):
+        self.events = []
+
+    def __bool__(self):
+        return True
+
+    def push(self, event):
+        # The experiment reuses its event records
+        self.events.append(dataclasses.replace(event))
+
+
+class _MemoryLogger:
+    # Records the traced memory at each reaction into preallocated arrays, so it does not allocate itself. The peak
+    # since the previous reaction exceeds the memory in use, if a frame allocated anything, even if it was freed.
+    def __init__(self, capacity: int = 10000):
+        self.memory = np.zeros(capacity, dtype=np.int64)
+        self.peak = np.zeros(capacity, dtype=np.int64)
+        self.trials = np.zeros(capacity, dtype=np.int64)
+        self.gc_enabled = np.zeros(capacity, dtype=bool)
+        self.num_reactions = 0
+        self.num_trials = 0
+
+    def __bool__(self):
+        return True
+
+    def push(self, event):
+        if isinstance(event, Logger.Reaction):
+            # The measured values must not be alive when the peak is reset, or freeing them appears as allocation
+            self.memory[self.num_reactions], self.peak[self.num_reactions] = (
+                tracemalloc.get_traced_memory()
+            )
+            self.trials[self.num_reactions] = self.num_trials
+            self.gc_enabled[self.num_reactions] = gc.isenabled()
+            self.num_reactions += 1
+            tracemalloc.reset_peak()
+        elif isinstance(event, Logger.Trial):
+            self.num_trials += 1
+
+
+class TestSimulation(unittest.TestCase):
+    def setUp(self):
+        example_file = Path(__file__).parent / "example" / "samples.csv"
+        self.stimuli = list(Stimulus.from_csv(example_file, delimiter=","))
+
+    def _run(self, error_rate: float, clock=None, num_distractors: int = 0) -> _Logger:
+        logger = _Logger()
+        experiment = HeadlessExperiment(
+            self.stimuli,
+            logger,
+            SimulatedParticipant.create_models(
+                rt_mean=0.4, rt_sd=0.1, error_rate=error_rate
+            ),
+            seed=3,
+            clock=clock,
+        )
+        experiment.run(
+            fixation_cross_jitter=(0.1, 0.2),
+            seed=3,
+            avatar_size=0.15,
+            stimulus_size=0.75,
+            num_distractors=num_distractors,
+            distractor_size=0.1,
+        )
+        return logger
+
+    def test_correct_key(self):
+        self.assertEqual(UP, SimulatedParticipant.correct_key(Position.Below, True))
+        self.assertEqual(DOWN, SimulatedParticipant.correct_key(Position.Above, True))
+        self.assertEqual(UP, SimulatedParticipant.correct_key(Position.Above, False))
+        self.assertEqual(DOWN, SimulatedParticipant.correct_key(Position.Below, False))
+
+    def test_all_trials_finish(self):
+        events = self._run(error_rate=0.0).events
+        trial_markers = [event for event in events if isinstance(event, Logger.Trial)]
+        self.assertEqual(len(self.stimuli) * 2 * 2, len(trial_markers))
+
+        # Without errors, every first reaction of a trial is correct
+        first_reactions = [
+            current.reaction
+            for previous, current in zip(events, events[1:])
+            if isinstance(previous, Logger.Trial)
+            and isinstance(current, Logger.Reaction)
+        ]
+        self.assertEqual(len(self.stimuli) * 2, len(first_reactions))
+        self.assertTrue(
+            all(reaction == Reaction.CorrectReaction for reaction in first_reactions)
+        )
+
+    def test_first_reaction_uses_press_timestamp(self):
+        clock = iter(range(1, 10**6))
+        events = self._run(error_rate=0.0, clock=lambda: float(next(clock))).events
+
+        # The first reaction of each trial carries the time of the key press, which happened before it was logged
+        for previous, current in zip(events, events[1:]):
+            if isinstance(previous, Logger.Trial) and isinstance(
+                current, Logger.Reaction
+            ):
+                self.assertEqual(previous.timestamp + 1, current.timestamp)
+
+    def test_simulated_reaction_times(self):
+        # Through the logger and the recorded session, the reaction times are the modeled ones
+        stimuli = self.stimuli * 100
+        models = SimulatedParticipant.create_models(
+            rt_mean=0.5, rt_sd=0.1, error_rate=0.0, avoid_slowdown=0.1
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Path(directory) / "session.journal"
+            logger = Logger(journal=journal)
+            experiment = HeadlessExperiment(
+                stimuli, logger, models, seed=3, start=100.0
+            )
+            experiment.run(
+                fixation_cross_jitter=(0.1, 0.2),
+                seed=3,
+                avatar_size=0.15,
+                stimulus_size=0.75,
+            )
+            logger.close()
+            session = EventJournal.load(journal)
+
+        responses = session.responses()
+        self.assertEqual(len(stimuli) * 2, len(responses))
+        self.assertTrue(responses["correct"].all())
+        self.assertGreater(session.trials["onset"].min(), 100.0)
+
+        should_approach = np.array(
+            [
+                {stimulus.name: stimulus.should_approach for stimulus in stimuli}[name]
+                for name in session.names[session.trials["name"]]
+            ]
+        )
+        for condition in (True, False):
+            model = models[(Position.Above, condition)]
+            rt = responses["rt"][should_approach == condition]
+            self.assertGreater(len(rt), 100)
+
+            # The presses arrive on the flips, so they are rounded to the frame period
+            np.testing.assert_allclose(
+                np.round(rt * 60.0), rt * 60.0, rtol=0.0, atol=1e-6
+            )
+            self.assertAlmostEqual(model.rt_mean, rt.mean(), delta=0.02)
+            self.assertAlmostEqual(model.rt_sd, rt.std(), delta=0.02)
+
+        # A press is late by up to a frame period, half of it on average
+        latency = responses["rt"] - np.array(experiment.participant.reaction_times)
+        self.assertGreaterEqual(latency.min(), -1e-9)
+        self.assertLess(latency.max(), 1 / 60)
+        self.assertAlmostEqual(0.5 / 60, latency.mean(), delta=0.1 / 60)
+
+    def test_touches(self):
+        events = self._run(error_rate=0.0, num_distractors=1).events
+        self.assertEqual(
+            len(self.stimuli) * 2 * 2,
+            len([event for event in events if isinstance(event, Logger.Trial)]),
+        )
+
+        # Every approach trial ends by touching the stimulus, but a distractor may be touched on the way
+        touches = [event for event in events if isinstance(event, Logger.Touch)]
+        num_approach = sum(stimulus.should_approach for stimulus in self.stimuli) * 2
+        self.assertGreaterEqual(len(touches), num_approach)
+        self.assertTrue(all(touch.index in (0, 1) for touch in touches))
+
+    def test_compiled_approach_distractors(self):
+        # The distractors take the role of their stimuli and are placed at random, so avoid trials contain
+        # distractors to approach off the path of the avatar
+        stimuli = self.stimuli * 4
+        schedule = Schedule.compile(
+            stimuli,
+            seed=5,
+            fixation_jitter=(0.1, 0.2),
+            frame_period=1 / 60,
+            window_size=(1920, 1080),
+            stimulus_size=0.75,
+            avatar_size=0.15,
+            num_distractors=2,
+            distractor_size=0.1,
+            approach_distractors=True,
+        )
+        avoid = np.array(
+            [
+                not stimuli[index].should_approach
+                for index in schedule.trials["stimulus"]
+            ]
+        )
+        self.assertTrue(schedule.trials["distractor_approach"][avoid].any())
+
+        logger = _Logger()
+        experiment = HeadlessExperiment(
+            stimuli,
+            logger,
+            SimulatedParticipant.create_models(rt_mean=0.4, rt_sd=0.1, error_rate=0.0),
+            seed=5,
+        )
+
+        # A trial which never ends fails instead of hanging
+        step = experiment._window.on_flip
+        max_flips = len(schedule.trials) * 1000
+
+        def limited_step():
+            if experiment._window.num_flips > max_flips:
+                raise AssertionError("A trial did not end.")
+            step()
+
+        experiment._window.on_flip = limited_step
+        experiment.run_schedule(schedule)
+
+        self.assertEqual(
+            len(schedule.trials) * 2,
+            len([event for event in logger.events if isinstance(event, Logger.Trial)]),
+        )
+
+    def test_approach_distractor_ends_trial(self):
+        schedule = Schedule.compile(
+            self.stimuli,
+            seed=3,
+            fixation_jitter=(0.1, 0.2),
+            frame_period=1 / 60,
+            window_size=(1920, 1080),
+            stimulus_size=0.75,
+            avatar_size=0.15,
+            num_distractors=1,
+            distractor_size=0.1,
+        )
+
+        # In the avoid trials, a distractor to approach lies on the way of the avatar, a few steps ahead. In the
+        # approach trials, a distractor lies behind it.
+        avatar_height = Stimulus.norm_size(AssetCache.AVATAR, 0.15, (1920, 1080))[1]
+        for trial in schedule.trials:
+            stimulus = self.stimuli[trial["stimulus"]]
+            direction = (
+                1.0
+                if SimulatedParticipant.correct_key(
+                    Schedule.POSITIONS[trial["position"]], stimulus.should_approach
+                )
+                == UP
+                else -1.0
+            )
+            distractor_height = Stimulus.norm_size(
+                self.stimuli[trial["distractors"][0]].image, 0.1, (1920, 1080)
+            )[1]
+            trial["distractor_x"][0] = 0.0
+            if stimulus.should_approach:
+                direction = -direction
+            trial["distractor_y"][0] = trial["avatar_y"] + direction * (
+                avatar_height / 2 + distractor_height / 2 + 0.05
+            )
+            trial["distractor_approach"][0] = not stimulus.should_approach
+
+        logger = _Logger()
+        HeadlessExperiment(
+            self.stimuli,
+            logger,
+            SimulatedParticipant.create_models(rt_mean=0.4, rt_sd=0.1, error_rate=0.0),
+            seed=3,
+        ).run_schedule(schedule)
+
+        # Each trial ends right after touching its first object to approach: The distractor in the avoid trials
+        markers = [
+            i
+            for i, event in enumerate(logger.events)
+            if isinstance(event, Logger.Trial)
+        ]
+        self.assertEqual(len(schedule.trials) * 2, len(markers))
+        for trial, onset, offset in zip(schedule.trials, markers[::2], markers[1::2]):
+            last = logger.events[offset - 1]
+            self.assertIsInstance(last, Logger.Touch)
+            self.assertEqual(
+                0 if self.stimuli[trial["stimulus"]].should_approach else 1, last.index
+            )
+            self.assertGreater(offset - onset, 2)
+
+    def test_prefetch(self):
+        logger = _Logger()
+        experiment = HeadlessExperiment(
+            self.stimuli,
+            logger,
+            SimulatedParticipant.create_models(rt_mean=0.4, rt_sd=0.1, error_rate=0.0),
+            seed=3,
+            prefetch=1,
+        )
+        experiment.run(
+            fixation_cross_jitter=(0.1, 0.2),
+            seed=3,
+            avatar_size=0.15,
+            stimulus_size=0.75,
+            num_distractors=2,
+        )
+        self.assertEqual(
+            len(self.stimuli) * 2 * 2,
+            len([event for event in logger.events if isinstance(event, Logger.Trial)]),
+        )
+
+        # Every stimulus was resident when its trial started, and at most two were at once
+        statistics = experiment.prefetcher.statistics
+        self.assertEqual(0, statistics.num_misses)
+        self.assertLessEqual(statistics.max_resident, 2)
+        self.assertEqual(statistics.num_created, statistics.num_released)
+        self.assertEqual(0, len(experiment.prefetcher))
+
+        # The same for the distractors, two per trial
+        statistics = experiment.distractor_prefetcher.statistics
+        self.assertEqual(0, statistics.num_misses)
+        self.assertLessEqual(statistics.max_resident, 4)
+        self.assertEqual(statistics.num_created, statistics.num_released)
+        self.assertEqual(0, len(experiment.distractor_prefetcher))
+
+    @unittest.skipUnless(
+        hasattr(tracemalloc, "reset_peak"), "Requires Python 3.9 or newer."
+    )
+    def test_frame_loop_does_not_allocate(self):
+        experiment = HeadlessExperiment(
+            self.stimuli,
+            _Logger(),
+            SimulatedParticipant.create_models(rt_mean=0.4, rt_sd=0.1, error_rate=0.0),
+            seed=3,
+        )
+        arguments = dict(
+            fixation_cross_jitter=(0.1, 0.2),
+            seed=3,
+            avatar_size=0.15,
+            stimulus_size=0.75,
+        )
+
+        # The first session warms up the caches and counters, which allocate once
+        experiment.run(**arguments)
+        logger = experiment.logger = _MemoryLogger()
+        tracemalloc.start()
+        try:
+            experiment.run(**arguments)
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(gc.isenabled())
+
+        # While a key is held, each frame logs a reaction. Apart from the first frames, which set up the trial,
+        # the frames neither keep nor temporarily allocate any memory.
+        num_reactions = logger.num_reactions
+        self.assertFalse(logger.gc_enabled[:num_reactions].any())
+        for trial in np.unique(logger.trials[:num_reactions]):
+            frames = logger.trials[:num_reactions] == trial
+            memory = logger.memory[:num_reactions][frames]
+            self.assertGreater(len(memory), 10)
+            np.testing.assert_array_equal(0, np.diff(memory[2:]))
+            allocated = logger.peak[:num_reactions] - logger.memory[:num_reactions]
+            np.testing.assert_array_equal(0, allocated[frames][3:])
+
+    def test_errors_are_corrected(self):
+        events = self._run(error_rate=1.0).events
+        reactions = [
+            event.reaction for event in events if isinstance(event, Logger.Reaction)
+        ]
+        self.assertIn(Reaction.IncorrectReaction, reactions)
+        self.assertEqual(
+            len(self.stimuli) * 2 * 2,
+            len([event for event in events if isinstance(event, Logger.Trial)]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
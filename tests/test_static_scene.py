@@ -0,0 +1,23 @@
+import unittest
+
+from bid2d.util.static_scene import StaticScene
+
+
+class TestStaticScene(unittest.TestCase):
+    def test_bounding_rect(self):
+        left, top, right, bottom = StaticScene.bounding_rect(
+            (0.0, 0.0), (0.5, 0.25), (1000, 500), margin=0
+        )
+        self.assertEqual([-0.25, 0.125, 0.25, -0.125], [left, top, right, bottom])
+
+        # The margin is given in pixels and the rect never exceeds the window
+        left, top, right, bottom = StaticScene.bounding_rect(
+            (0.0, 0.9), (0.5, 0.25), (1000, 500), margin=5
+        )
+        self.assertAlmostEqual(-0.26, left)
+        self.assertEqual(1.0, top)
+        self.assertAlmostEqual(0.9 - 0.125 - 0.02, bottom)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.analysis import Analysis
+from bid2d.logger import Logger
+from bid2d.session import Session
+from bid2d.simulation import SimulatedParticipant
+from bid2d.stats import ConditionMeans, GroupEffect, Trials
+from bid2d.synthetic import RecordingGenerator
+
+
+class TestTrials(unittest.TestCase):
+    def _trials(self, num_participants: int = 5, num_trials: int = 200) -> Trials:
+        generator = np.random.default_rng(1)
+        size = num_participants * num_trials
+        should_approach = generator.random(size) < 0.5
+        rt = generator.normal(0.6, 0.1, size) + np.where(should_approach, 0.0, 0.05)
+        rt[::50] = 5.0
+        return Trials(
+            participants=np.array([f"p{i}" for i in range(num_participants)]),
+            participant=np.repeat(np.arange(num_participants), num_trials),
+            position=generator.integers(0, len(Session.POSITIONS), size),
+            should_approach=should_approach,
+            rt=rt,
+            correct=generator.random(size) < 0.9,
+        )
+
+    def test_condition_means(self):
+        trials = self._trials()
+        means = trials.condition_means(min_rt=0.15, max_rt=2.0, trim=0.1)
+
+        # Compare against a loop over the conditions
+        for participant in range(len(trials.participants)):
+            for position in range(len(Session.POSITIONS)):
+                for condition, should_approach in enumerate((True, False)):
+                    cell = (
+                        (trials.participant == participant)
+                        & (trials.position == position)
+                        & (trials.should_approach == should_approach)
+                    )
+                    index = participant, position, condition
+                    self.assertEqual(cell.sum(), means.num_trials[index])
+                    self.assertAlmostEqual(
+                        trials.correct[cell].mean(), means.accuracy[index]
+                    )
+
+                    rt = trials.rt[cell & trials.correct]
+                    rt = np.sort(rt[(rt >= 0.15) & (rt <= 2.0)])
+                    inside = np.abs(rt - rt.mean()) <= 2.5 * rt.std(ddof=1)
+                    self.assertEqual(inside.sum(), means.num_kept[index])
+                    self.assertAlmostEqual(rt[inside].mean(), means.rt[index])
+
+                    cut = int(len(rt) * 0.1)
+                    self.assertAlmostEqual(
+                        rt[cut : len(rt) - cut].mean(), means.trimmed_rt[index]
+                    )
+
+        self.assertTrue(np.all(np.abs(means.effect() - 0.05) < 0.05))
+        self.assertEqual(len(ConditionMeans.columns()), len(next(means.rows())))
+
+    def test_sessions(self):
+        # From the recordings through the table of 'bid2d analyze'
+        stimuli = RecordingGenerator.synthetic_stimuli(4)
+        generator = RecordingGenerator(
+            stimuli,
+            SimulatedParticipant.create_models(
+                rt_mean=0.5, rt_sd=0.05, error_rate=0.05, avoid_slowdown=0.1
+            ),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            rows = []
+            for i in range(3):
+                file = Path(directory) / f"participant{i}.xdf"
+                generator.write(file, 80, seed=i)
+                rows.extend(Analysis.tabulate(file, Logger.load_session(str(file))))
+            Analysis.save(rows, Path(directory) / "trials.csv")
+
+            should_approach = {
+                stimulus.name: stimulus.should_approach for stimulus in stimuli
+            }
+            trials = Trials.load_csv(Path(directory) / "trials.csv", should_approach)
+            inverted = Trials.from_rows(
+                rows, should_approach, inverted=["participant1"]
+            )
+
+        self.assertEqual(
+            ["participant0", "participant1", "participant2"], list(trials.participants)
+        )
+        effects = trials.condition_means().effect()
+        self.assertTrue(np.all(np.abs(effects - 0.1) < 0.05), effects)
+
+        effects = inverted.condition_means().effect()
+        self.assertLess(effects[1], -0.05)
+        self.assertGreater(effects[2], 0.05)
+
+
+class TestGroupEffect(unittest.TestCase):
+    def test_estimate(self):
+        effects = np.random.default_rng(2).normal(0.05, 0.02, 30)
+        group = GroupEffect.estimate(effects, num_resamples=2500, seed=3, processes=1)
+        self.assertAlmostEqual(effects.mean(), group.mean)
+        self.assertLess(group.ci_low, group.mean)
+        self.assertGreater(group.ci_high, group.mean)
+        self.assertAlmostEqual(1 / 2501, group.p_value)
+
+        # The same resamples, regardless of the number of processes
+        self.assertEqual(
+            group,
+            GroupEffect.estimate(effects, num_resamples=2500, seed=3, processes=2),
+        )
+
+    def test_no_effect(self):
+        effects = np.random.default_rng(4).normal(0.0, 0.02, 30)
+        effects[0] = np.nan
+        group = GroupEffect.estimate(effects, num_resamples=1000, seed=5, processes=1)
+        self.assertEqual(29, group.num_participants)
+        self.assertLess(group.ci_low, 0.0)
+        self.assertGreater(group.p_value, 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
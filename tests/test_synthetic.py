@@ -0,0 +1,68 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.logger import Logger
+from bid2d.simulation import SimulatedParticipant
+from bid2d.synthetic import FillerStream, RecordingGenerator
+from bid2d.xdf import XdfReader
+
+
+class TestRecordingGenerator(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _generator(self, error_rate: float, **kwargs) -> RecordingGenerator:
+        return RecordingGenerator(
+            RecordingGenerator.synthetic_stimuli(5),
+            SimulatedParticipant.create_models(
+                rt_mean=0.5, rt_sd=0.1, error_rate=error_rate, avoid_slowdown=0.1
+            ),
+            **kwargs,
+        )
+
+    def test_session(self):
+        file = self.directory / "session.xdf"
+        duration = self._generator(
+            error_rate=0.0, fillers=[FillerStream.parse("EEG:8:250")]
+        ).write(file, 25, seed=1)
+
+        session = Logger.load_session(str(file))
+        self.assertEqual(25, len(session.trials))
+        self.assertTrue(np.all(session.trials["offset"] > session.trials["onset"]))
+
+        # Each design cell is shown once per block of 5 stimuli at 2 positions
+        cells = session.trials["name"] * 2 + session.trials["position"]
+        self.assertEqual(10, len(np.unique(cells[:10])))
+        self.assertEqual(10, len(np.unique(cells[10:20])))
+
+        responses = session.responses()
+        self.assertTrue(responses["correct"].all())
+        self.assertTrue(np.all(responses["rt"] > 0.0))
+
+        eeg = XdfReader(file).load(("EEG",))["EEG"]
+        self.assertEqual((8,), eeg.time_series.shape[1:])
+        self.assertAlmostEqual(duration, len(eeg.time_stamps) / 250.0, delta=1.0)
+
+    def test_compact_trials(self):
+        files = [self.directory / "session.xdf", self.directory / "compact.xdf"]
+        self._generator(error_rate=0.2).write(files[0], 30, seed=2)
+        self._generator(error_rate=0.2, compact_trials=True).write(files[1], 30, seed=2)
+
+        trials, reactions = zip(*(Logger.load(str(file)) for file in files))
+        self.assertEqual(trials[0], trials[1])
+        self.assertEqual(reactions[0], reactions[1])
+
+        # Some of the first reactions are erroneous
+        session = Logger.load_session(str(files[0]))
+        self.assertFalse(session.responses()["correct"].all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from bid2d.util.texture_prefetcher import TexturePrefetcher
+
+
+class TestTexturePrefetcher(unittest.TestCase):
+    KEYS = ["a", "b", "a", "c", "d", "d", "b"]
+
+    def setUp(self):
+        self.created = []
+        self.released = []
+        self.resident = []
+
+    def _create(self, key, decoded):
+        self.created.append(key)
+        return f"texture {decoded}"
+
+    def _release(self, key, texture):
+        self.released.append(key)
+
+    def test_sliding_window(self):
+        with TexturePrefetcher(
+            TestTexturePrefetcher.KEYS,
+            window=1,
+            create=self._create,
+            decode=lambda key: key.upper(),
+            release=self._release,
+        ) as prefetcher:
+            for index in range(len(TestTexturePrefetcher.KEYS)):
+                prefetcher.prepare(index)
+                self.assertEqual(
+                    f"texture {TestTexturePrefetcher.KEYS[index].upper()}",
+                    prefetcher.get(index),
+                )
+                self.resident.append(len(prefetcher))
+
+        # Textures are kept while shown within the window, but created again once they left it
+        self.assertEqual(["a", "b", "c", "d", "b"], self.created)
+        self.assertEqual(["b", "a", "c", "d", "b"], self.released)
+        self.assertEqual([1, 2, 1, 1, 1, 1, 1], self.resident)
+        self.assertEqual(0, prefetcher.statistics.num_misses)
+        self.assertEqual(2, prefetcher.statistics.max_resident)
+
+    def test_unprepared_trial(self):
+        with TexturePrefetcher(
+            ["a", "b", "c"], window=1, create=self._create, decode=lambda key: key
+        ) as prefetcher:
+            prefetcher.prepare(0)
+            prefetcher.prepare(1)
+
+            # A trial which was not prepared is loaded when its stimulus appears
+            self.assertEqual("texture c", prefetcher.get(2))
+
+        self.assertEqual(1, prefetcher.statistics.num_misses)
+        self.assertEqual(["a", "b", "c"], self.created)
+
+    def test_several_keys_per_trial(self):
+        keys = ["a", "b", "b", "c", "d", "e"]
+        with TexturePrefetcher(
+            keys,
+            window=1,
+            create=self._create,
+            decode=lambda key: key,
+            release=self._release,
+            keys_per_trial=2,
+        ) as prefetcher:
+            for index in range(3):
+                prefetcher.prepare(index)
+                for k in range(2):
+                    self.assertEqual(
+                        f"texture {keys[index * 2 + k]}", prefetcher.get(index, k)
+                    )
+                self.resident.append(len(prefetcher))
+
+        # The image shared by consecutive trials is created once
+        self.assertEqual(["a", "b", "c", "d", "e"], self.created)
+        self.assertEqual(["a", "b", "c", "d", "e"], self.released)
+        self.assertEqual([2, 2, 2], self.resident)
+        self.assertEqual(0, prefetcher.statistics.num_misses)
+
+    def test_empty_window(self):
+        with self.assertRaises(ValueError):
+            TexturePrefetcher(["a"], window=0, create=self._create)
+        with self.assertRaises(ValueError):
+            TexturePrefetcher(["a"], window=1, create=self._create, keys_per_trial=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
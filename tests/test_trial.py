@@ -0,0 +1,132 @@
+import itertools
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.position import Position
+from bid2d.stimulus import Stimulus
+from bid2d.trial import TrialTable
+from bid2d.util.constrained_shuffle import SequenceConstraints
+
+
+class TestTrialTable(unittest.TestCase):
+    def setUp(self):
+        example_file = Path(__file__).parent / "example" / "samples.csv"
+        self.stimuli = list(Stimulus.from_csv(example_file, delimiter=","))
+
+    def test_full_factorial_design(self):
+        trials = TrialTable.generate(
+            self.stimuli, position=(Position.Above, Position.Below), block=(1, 2)
+        )
+        self.assertEqual(len(self.stimuli) * 2 * 2, len(trials))
+
+        combinations = {
+            (trial.name, trial["position"], trial["block"]) for trial in trials
+        }
+        self.assertEqual(
+            set(
+                itertools.product(
+                    (stimulus.name for stimulus in self.stimuli),
+                    (Position.Above, Position.Below),
+                    (1, 2),
+                )
+            ),
+            combinations,
+        )
+
+        # The vectorized codes match the lazily created trials
+        for trial, stimulus_index, code in zip(
+            trials, trials.stimulus_indices, trials.codes("position")
+        ):
+            self.assertIs(self.stimuli[stimulus_index], trial.stimulus)
+            self.assertEqual((Position.Above, Position.Below)[code], trial["position"])
+
+    def test_reproducible_order(self):
+        first = TrialTable.generate(self.stimuli, seed=1, position=tuple(Position))
+        second = TrialTable.generate(self.stimuli, seed=1, position=tuple(Position))
+        self.assertEqual(first.order.tolist(), second.order.tolist())
+
+    @staticmethod
+    def _max_run(codes: np.ndarray) -> int:
+        starts = np.flatnonzero(np.diff(codes, prepend=-1, append=-1))
+        return int(np.diff(starts).max())
+
+    def test_constrained_order(self):
+        stimuli = [
+            Stimulus(
+                Path(f"stimulus{i}.png"), should_approach=i % 2 == 0, check_file=False
+            )
+            for i in range(500)
+        ]
+        constraints = SequenceConstraints(
+            max_run={"position": 3, "should_approach": 3, "stimulus": 1},
+            balanced_transitions=("position", "should_approach"),
+        )
+        trials = TrialTable.generate(
+            stimuli, seed=3, constraints=constraints, position=tuple(Position)
+        )
+        self.assertEqual(list(range(len(trials))), sorted(trials.order.tolist()))
+
+        self.assertLessEqual(self._max_run(trials.codes("position")), 3)
+        self.assertLessEqual(self._max_run(trials.factor_codes("should_approach")), 3)
+        self.assertEqual(1, self._max_run(trials.stimulus_indices))
+        self.assertEqual(
+            [trial.should_approach for trial in trials],
+            [not bool(code) for code in trials.factor_codes("should_approach")],
+        )
+
+        # Each of the four transitions occurs in about a quarter of the trials
+        for factor in constraints.balanced_transitions:
+            codes = trials.factor_codes(factor)
+            counts = np.bincount(codes[:-1] * 2 + codes[1:], minlength=4)
+            self.assertLessEqual(np.ptp(counts), 2, factor)
+
+        self.assertEqual(
+            trials.order.tolist(),
+            TrialTable.generate(
+                stimuli, seed=3, constraints=constraints, position=tuple(Position)
+            ).order.tolist(),
+        )
+
+    def test_impossible_constraints(self):
+        stimuli = [stimulus for stimulus in self.stimuli if stimulus.should_approach]
+        with self.assertRaises(ValueError):
+            TrialTable.generate(
+                stimuli,
+                constraints=SequenceConstraints(max_run={"should_approach": 1}),
+                position=tuple(Position),
+            )
+
+    def test_unknown_factor(self):
+        self.assertEqual(
+            ["position", "stimulus", "name", "should_approach"],
+            TrialTable.factors(self.stimuli, ("position",)),
+        )
+        with self.assertRaisesRegex(ValueError, "'block'"):
+            TrialTable.generate(
+                self.stimuli,
+                constraints=SequenceConstraints(max_run={"block": 1}),
+                position=tuple(Position),
+            )
+
+
+class TestSequenceConstraints(unittest.TestCase):
+    def test_parse(self):
+        constraints = SequenceConstraints.parse(
+            ["position=3", "stimulus=1"], ["position"], factors=("position", "stimulus")
+        )
+        self.assertEqual({"position": 3, "stimulus": 1}, constraints.max_run)
+        self.assertEqual(("position",), constraints.balanced_transitions)
+        self.assertIsNone(SequenceConstraints.parse([], []))
+
+    def test_invalid(self):
+        for max_run in ("position=x", "position", "=3", "position=0"):
+            with self.assertRaisesRegex(ValueError, "FACTOR=N"):
+                SequenceConstraints.parse([max_run], [])
+        with self.assertRaisesRegex(ValueError, "'block'"):
+            SequenceConstraints.parse([], ["block"], factors=("position",))
+
+
+if __name__ == "__main__":
+    unittest.main()
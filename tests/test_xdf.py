@@ -0,0 +1,100 @@
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from bid2d.xdf import XdfReader, XdfChunk, XdfWriter
+
+
+def _chunk(tag: int, content: bytes, stream_id: int = None) -> bytes:
+    if stream_id is not None:
+        content = struct.pack("<I", stream_id) + content
+    return b"\x08" + struct.pack("<QH", len(content) + 2, tag) + content
+
+
+def _header(name: str, channel_format: str, channel_count: int) -> bytes:
+    return (
+        f"<?xml version='1.0'?><info><name>{name}</name><channel_format>{channel_format}"
+        f"</channel_format><channel_count>{channel_count}</channel_count>"
+        f"<nominal_srate>0</nominal_srate></info>"
+    ).encode()
+
+
+def _samples(channel_format: str, samples) -> bytes:
+    content = b"\x04" + struct.pack("<I", len(samples))
+    for timestamp, values in samples:
+        content += b"\x08" + struct.pack("<d", timestamp)
+        if channel_format == "string":
+            for value in values:
+                content += b"\x01" + bytes([len(value)]) + value.encode()
+        else:
+            content += np.asarray(values, dtype="<f4").tobytes()
+    return content
+
+
+class TestXdfReader(unittest.TestCase):
+    def test_selective_loading(self):
+        data = b"XDF:" + _chunk(XdfChunk.FILE_HEADER, b"<info/>")
+        data += _chunk(XdfChunk.STREAM_HEADER, _header("Markers", "string", 2), 1)
+        data += _chunk(XdfChunk.STREAM_HEADER, _header("EEG", "float32", 4), 2)
+        data += _chunk(
+            XdfChunk.SAMPLES, _samples("float32", [(0.5, [1, 2, 3, 4])] * 8), 2
+        )
+        data += _chunk(XdfChunk.SAMPLES, _samples("string", [(1.0, ["A", "above"])]), 1)
+        data += _chunk(XdfChunk.CLOCK_OFFSET, struct.pack("<dd", 1.0, 0.25), 1)
+        data += _chunk(XdfChunk.SAMPLES, _samples("string", [(2.0, ["B", "below"])]), 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory) / "recording.xdf"
+            file.write_bytes(data)
+            streams = XdfReader(file).load(("Markers",))
+
+        self.assertEqual(["Markers"], list(streams.keys()))
+        markers = streams["Markers"]
+        self.assertEqual([["A", "above"], ["B", "below"]], markers.time_series)
+        np.testing.assert_allclose([1.25, 2.25], markers.time_stamps)
+
+    def test_truncated_recording(self):
+        data = b"XDF:" + _chunk(XdfChunk.FILE_HEADER, b"<info/>")
+        data += _chunk(XdfChunk.STREAM_HEADER, _header("Markers", "string", 2), 1)
+        data += _chunk(XdfChunk.SAMPLES, _samples("string", [(1.0, ["A", "above"])]), 1)
+        complete = len(data)
+        data += _chunk(XdfChunk.CLOCK_OFFSET, struct.pack("<dd", 1.0, 0.0), 1)
+        data += _chunk(XdfChunk.SAMPLES, _samples("string", [(2.0, ["B", "below"])]), 1)
+
+        # Cut off anywhere after the first marker, including within the length, tag and stream id of a chunk
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory) / "recording.xdf"
+            for length in range(complete, len(data)):
+                file.write_bytes(data[:length])
+                markers = XdfReader(file).load(("Markers",))["Markers"]
+                self.assertEqual([["A", "above"]], markers.time_series, length)
+
+    def test_writer_roundtrip(self):
+        eeg = np.arange(40, dtype=np.float32).reshape(10, 4)
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory) / "recording.xdf"
+            with XdfWriter(file) as writer:
+                writer.add_stream(1, "Markers", "string", 2)
+                writer.add_stream(2, "EEG", "float32", 4, nominal_srate=100.0)
+                writer.add_stream(3, "Reactions", "int32", 2)
+                writer.write_samples(2, np.arange(10) / 100.0, eeg)
+                writer.write_samples(
+                    1, np.array([1.0, 2.0]), [["A", "above"], ["B", "below"]]
+                )
+                writer.write_samples(3, np.array([1.5]), np.array([[3, 4]]))
+            streams = XdfReader(file).load(("Markers", "EEG", "Reactions"))
+
+        self.assertEqual(
+            [["A", "above"], ["B", "below"]], streams["Markers"].time_series
+        )
+        np.testing.assert_array_equal(eeg, streams["EEG"].time_series)
+        np.testing.assert_allclose(np.arange(10) / 100.0, streams["EEG"].time_stamps)
+        np.testing.assert_array_equal([[3, 4]], streams["Reactions"].time_series)
+        np.testing.assert_allclose([1.5], streams["Reactions"].time_stamps)
+
+
+if __name__ == "__main__":
+    unittest.main()